@@ -77,6 +77,7 @@ tests_require = [
     'nti.testing',
     'gevent >= 23.7.0',
     'pyperf',
+    'zstandard',
     # Versions of PyPy2 prior to 7.4 (maybe?) are incompatible with
     # psutil >= 5.6.4.
     # https://github.com/giampaolo/psutil/issues/1659
@@ -328,6 +329,9 @@ setup(
         'sqlite': [],
         'sqlite3': [],
         'memcache': memcache_require,
+        'zstd': [
+            'zstandard',
+        ],
         'test': tests_require,
         'docs': [
             'sphinx',
@@ -366,6 +370,7 @@ setup(
         'console_scripts': [
             'zodbconvert = relstorage.zodbconvert:main',
             'zodbpack = relstorage.zodbpack:main',
+            'relstorage-cache-simulate = relstorage.cache.simulate:main',
         ],
         'zodburi.resolvers': [
             'postgres = relstorage.zodburi_resolver:postgresql_resolver',
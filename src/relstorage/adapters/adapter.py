@@ -38,6 +38,7 @@ from ..options import Options
 from ._util import DatabaseHelpersMixin
 from .drivers import _select_driver
 from .interfaces import UnableToLockRowsToModifyError
+from .notifier import LocalSocketNotifier
 from .interfaces import UnableToLockRowsDeadlockError
 
 logger = __import__('logging').getLogger(__name__)
@@ -54,6 +55,11 @@ class AbstractAdapter(DatabaseHelpersMixin):
     oidallocator = None # type: IOIDAllocator
     dbiter = None # type: DatabaseIterator
     packundo = None
+    notifier = None # type: IInvalidationNotifier
+    #: Whether every process using the database must be on this
+    #: machine (true of SQLite). Only then can the ``socket``
+    #: invalidation notifier reach them all.
+    single_host = False
 
     def __init__(self, options=None):
         if options is None:
@@ -78,9 +84,43 @@ class AbstractAdapter(DatabaseHelpersMixin):
             self.connmanager.add_on_load_opened(self.mover.on_load_opened)
             self.connmanager.add_on_store_opened(self.locker.on_store_opened)
 
+        # Like the connmanager, this is shared with new instances.
+        if self.notifier is None and options.invalidation_notifier:
+            self.notifier = self._create_notifier(options.invalidation_notifier)
+            if self.notifier is not None:
+                self.notifier.start()
+        self.poller.notifier = self.notifier
+
     def _create(self):
         raise NotImplementedError
 
+    def _create_notifier(self, kind):
+        """
+        Return the :class:`IInvalidationNotifier` named by *kind*
+        (the ``invalidation-notifier`` option), or None.
+        """
+        if self.poller.transactions_may_go_backwards:
+            # A replica may not have the transaction yet.
+            logger.warning("Not using the %r invalidation notifier with replicas.", kind)
+            return None
+        if kind == 'socket':
+            if not self.single_host:
+                # Processes on other machines would never hear of our
+                # commits, and we'd never hear of theirs, so polls
+                # would miss their changes.
+                raise ValueError("The socket invalidation notifier only reaches "
+                                 "processes on one machine; it can't be used with %s"
+                                 % (type(self).__name__,))
+            directory = self.options.invalidation_notifier_dir or self._default_notifier_dir()
+            if not directory:
+                raise ValueError("The socket invalidation notifier requires "
+                                 "invalidation-notifier-dir")
+            return LocalSocketNotifier(directory)
+        raise ValueError("Unknown invalidation notifier %r" % (kind,))
+
+    def _default_notifier_dir(self):
+        return None
+
     def release(self):
         if self.oidallocator is not None:
             self.oidallocator.release()
@@ -90,6 +130,9 @@ class AbstractAdapter(DatabaseHelpersMixin):
         if self.oidallocator is not None:
             self.oidallocator.close()
             self.oidallocator = None
+        if self.notifier is not None:
+            self.notifier.close()
+            self.notifier = None
 
     def _select_driver(self, options=None):
         return _select_driver(
@@ -1084,6 +1084,49 @@ class IPoller(Interface):
         transaction.
         """
 
+class IInvalidationNotifier(Interface):
+    """
+    Hears about transactions as they commit, so that a poller can
+    avoid asking the database what changed when nothing did.
+    """
+
+    def start():
+        """
+        Begin listening in the background.
+        """
+
+    def close():
+        """
+        Stop listening.
+        """
+
+    def changed_since(tid):
+        """
+        Return whether a transaction newer than *tid* might have
+        committed.
+
+        This is only false when we have been listening long enough to
+        be sure.
+        """
+
+    def begin_poll():
+        """
+        Call before querying the database for changes. Returns a value
+        to pass to :meth:`polled`.
+        """
+
+    def polled(token, tid):
+        """
+        The query begun after :meth:`begin_poll` returned *token*
+        found that *tid* is the newest transaction.
+        """
+
+    def committed(tid):
+        """
+        This process committed *tid*. Tell other listeners if the
+        database doesn't.
+        """
+
 class ISchemaInstaller(Interface):
     """Install the schema in the database, clear it, or uninstall it"""
 
@@ -99,6 +99,7 @@ class MySQLAdapter(AbstractAdapter):
                  connmanager=None,
                  locker=None,
                  mover=None,
+                 notifier=None,
                  **params):
         self._params = params
         self.oidallocator = oidallocator
@@ -106,6 +107,7 @@ class MySQLAdapter(AbstractAdapter):
         self.connmanager = connmanager
         self.locker = locker
         self.mover = mover
+        self.notifier = notifier
         super().__init__(options)
 
     def _create(self):
@@ -202,6 +204,7 @@ class MySQLAdapter(AbstractAdapter):
             connmanager=self.connmanager,
             locker=self.locker,
             mover=self.mover,
+            notifier=self.notifier,
             **self._params
         )
 
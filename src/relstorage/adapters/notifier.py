@@ -0,0 +1,313 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Being told when transactions commit, instead of asking.
+
+A notifier listens for the TIDs of transactions as they commit. While
+it's listening, a poll that would ask the database what changed since
+a TID no newer than any it has heard of can skip the query: nothing
+did.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+from zope.interface import implementer
+
+from relstorage._util import thread_spawn
+
+from .interfaces import IInvalidationNotifier
+
+logger = __import__('logging').getLogger(__name__)
+
+#: The channel the PostgreSQL stored procedures notify when a
+#: transaction commits. The payload is the TID.
+PG_CHANNEL = 'relstorage_commits'
+#: The session setting that makes the PostgreSQL stored procedures
+#: send those notifications; they don't unless it's ``on``.
+PG_NOTIFY_SETTING = 'rs.notify'
+
+
+@implementer(IInvalidationNotifier)
+class InvalidationNotifier(object):
+    """
+    Keeps track of the newest TID we know of, and whether we can
+    trust that we would have heard of anything newer.
+
+    Subclasses listen for notifications in a background thread,
+    calling :meth:`_notified` for each one, and
+    :meth:`_listening_started` and :meth:`_listening_stopped` as that
+    changes.
+    """
+
+    #: Even while listening, never go more than this many seconds
+    #: without letting a poll query the database, in case a
+    #: notification was lost.
+    max_quiet = 60.0
+
+    #: How long to wait before trying to listen again after an error.
+    retry_delay = 5.0
+
+    _thread = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        # Changes whenever we start or stop listening, so we can tell
+        # whether a poll began while we were listening.
+        self._generation = 0
+        self._listening = False
+        # The newest TID we know was committed, and when the
+        # database last told us so itself.
+        self._last_tid = None
+        self._last_polled = 0
+        self.stats = {
+            'notified': 0,
+            'skipped': 0,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = thread_spawn(self._listen_until_closed, daemon=True)
+
+    def close(self):
+        # The thread notices within ``retry_delay``, unless
+        # :meth:`_wake` can tell it sooner.
+        self._closed.set()
+        thread = self._thread
+        if thread is not None and self._wake():
+            thread.wait(self.retry_delay)
+        self._thread = None
+
+    def _wake(self):
+        "Interrupt the listening thread. Return whether we could."
+        return False
+
+    def changed_since(self, tid):
+        """
+        Return whether a transaction newer than *tid* might have
+        committed.
+        """
+        with self._lock:
+            unchanged = (
+                self._listening
+                and self._last_tid is not None
+                and self._last_tid <= tid
+                and time.time() - self._last_polled < self.max_quiet
+            )
+            if unchanged:
+                self.stats['skipped'] += 1
+        return not unchanged
+
+    def begin_poll(self):
+        with self._lock:
+            return self._generation if self._listening else None
+
+    def polled(self, token, tid):
+        with self._lock:
+            if token is None or token != self._generation:
+                # We weren't listening for the whole query; something
+                # could have committed after it that we didn't hear of.
+                return
+            self._last_polled = time.time()
+            self.__notified_locked(tid)
+
+    def committed(self, tid):
+        """
+        This process just committed *tid*. Remember it, and tell
+        anyone else listening.
+        """
+        with self._lock:
+            if self._listening:
+                self.__notified_locked(tid)
+        self._send(tid)
+
+    def _send(self, tid):
+        "Tell other listeners about *tid*, if the database doesn't."
+
+    def _notified(self, tid):
+        with self._lock:
+            self.stats['notified'] += 1
+            if self._listening:
+                self.__notified_locked(tid)
+
+    def __notified_locked(self, tid):
+        if self._last_tid is None or tid > self._last_tid:
+            self._last_tid = tid
+
+    def _listening_started(self):
+        with self._lock:
+            self._generation += 1
+            self._listening = True
+            # We know nothing until a poll query tells us where the
+            # database is.
+            self._last_tid = None
+
+    def _listening_stopped(self):
+        with self._lock:
+            self._generation += 1
+            self._listening = False
+            self._last_tid = None
+
+    def _listen_until_closed(self):
+        while not self._closed.is_set():
+            try:
+                self._listen()
+            except Exception: # pylint:disable=broad-except
+                logger.exception("Failed to listen for committed transactions")
+            finally:
+                self._listening_stopped()
+            self._closed.wait(self.retry_delay)
+
+    def _listen(self):
+        """
+        Listen for notifications until closed or an error occurs.
+        """
+        raise NotImplementedError
+
+
+class LocalSocketNotifier(InvalidationNotifier):
+    """
+    Notifications sent between processes on one machine as datagrams
+    over Unix sockets, one for each listener, kept in a shared
+    directory.
+
+    Each process tells the others about the transactions it commits.
+    This is useful for SQLite, and for testing.
+    """
+
+    _TID = struct.Struct('>q')
+    #: How long to wait for a listener to accept a notification.
+    send_timeout = 1.0
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(
+            directory,
+            'rs-notify-%d-%x.sock' % (os.getpid(), id(self))
+        )
+
+    def _send(self, tid):
+        message = self._TID.pack(tid)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.settimeout(self.send_timeout)
+        try:
+            for path in glob.glob(os.path.join(self.directory, 'rs-notify-*.sock')):
+                if path == self.path:
+                    continue
+                try:
+                    sock.sendto(message, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Left behind by a process that's gone.
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                except OSError:
+                    # That listener will have to poll the next time
+                    # it's not told about a commit for a while.
+                    logger.warning("Failed to notify %s of commit %s", path, tid,
+                                   exc_info=True)
+        finally:
+            sock.close()
+
+    def _wake(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.sendto(b'', self.path)
+        except OSError:
+            return False
+        finally:
+            sock.close()
+        return True
+
+    def _listen(self):
+        if not os.path.isdir(self.directory):
+            # Not created yet (SQLite creates its data directory
+            # when it first connects). Try again later.
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.bind(self.path)
+            sock.settimeout(self.retry_delay)
+            self._listening_started()
+            unpack = self._TID.unpack
+            while not self._closed.is_set():
+                try:
+                    message = sock.recv(64)
+                except socket.timeout:
+                    continue
+                if len(message) == self._TID.size:
+                    self._notified(unpack(message)[0])
+        finally:
+            sock.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class PostgreSQLNotifier(InvalidationNotifier):
+    """
+    Notifications sent by the stored procedures that commit, using
+    PostgreSQL's ``LISTEN`` and ``NOTIFY``.
+
+    This requires a driver whose connections have psycopg2's
+    ``poll()`` and ``notifies``.
+    """
+
+    def __init__(self, connmanager):
+        super().__init__()
+        self.connmanager = connmanager
+
+    def on_store_opened(self, cursor, restart=False):
+        """
+        Make the stored procedures on the store connection of
+        *cursor* notify when they commit.
+        """
+        # Like a lock timeout, this only lasts beyond the current
+        # transaction if it commits.
+        cursor.execute("SET " + PG_NOTIFY_SETTING + " = 'on'")
+        cursor.connection.commit()
+
+    def _listen(self):
+        conn, cursor = self.connmanager.open(application_name='RS: Notify')
+        try:
+            if not hasattr(conn, 'notifies') or not hasattr(conn, 'poll'):
+                logger.warning(
+                    "The database driver can't receive notifications; polling instead.")
+                self._closed.set()
+                return
+            conn.rollback()
+            conn.autocommit = True
+            cursor.execute('LISTEN ' + PG_CHANNEL)
+            self._listening_started()
+            notifies = conn.notifies
+            while not self._closed.is_set():
+                if select.select([conn], [], [], self.retry_delay) == ([], [], []):
+                    continue
+                conn.poll()
+                while notifies:
+                    self._notified(int(notifies.pop(0).payload))
+        finally:
+            self.connmanager.close(conn, cursor)
@@ -56,6 +56,7 @@ class OracleAdapter(AbstractAdapter):
                  locker=None,
                  mover=None,
                  connmanager=None,
+                 notifier=None,
                  ):
         """Create an Oracle adapter.
 
@@ -76,6 +77,7 @@ class OracleAdapter(AbstractAdapter):
         self.locker = locker
         self.mover = mover
         self.connmanager = connmanager
+        self.notifier = notifier
 
         super().__init__(options)
 
@@ -196,6 +198,7 @@ class OracleAdapter(AbstractAdapter):
             locker=self.locker,
             mover=self.mover,
             connmanager=self.connmanager,
+            notifier=self.notifier,
         )
 
     def __str__(self):
@@ -47,4 +47,4 @@ class Adapter(BaseAdapter):
 class TestAdapter(test_adapter.AdapterTestBase):
 
     def _makeOne(self, options):
-        return Adapter(options)
+        return Adapter(options=options)
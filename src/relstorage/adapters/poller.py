@@ -45,6 +45,10 @@ class Poller(object):
         func.max(Schema.all_transaction.c.tid)
     ).prepared()
 
+    #: An :class:`IInvalidationNotifier`, if we're told when
+    #: transactions commit. Set by the adapter.
+    notifier = None
+
     def __init__(self, driver, keep_history, runner,
                  revert_when_stale, transactions_may_go_backwards):
         self.driver = driver
@@ -63,6 +67,23 @@ class Poller(object):
         """
         See ``IPoller``
         """
+        notifier = self.notifier
+        if notifier is None or prev_polled_tid is None:
+            return self._poll_invalidations(conn, cursor, prev_polled_tid)
+
+        if not notifier.changed_since(prev_polled_tid):
+            # We would have heard about anything newer. Note that
+            # we haven't begun a snapshot; if something commits
+            # before we read anything, its objects are from the
+            # future and can't be loaded.
+            return (), prev_polled_tid
+
+        token = notifier.begin_poll()
+        changes, new_polled_tid = self._poll_invalidations(conn, cursor, prev_polled_tid)
+        notifier.polled(token, new_polled_tid)
+        return changes, new_polled_tid
+
+    def _poll_invalidations(self, conn, cursor, prev_polled_tid):
         # pylint:disable=unused-argument
 
         # Some databases, in some isolation modes, only establish a snapshot
@@ -24,6 +24,7 @@ from ..adapter import AbstractAdapter
 from ..dbiter import HistoryFreeDatabaseIterator
 from ..dbiter import HistoryPreservingDatabaseIterator
 from ..interfaces import IRelStorageAdapter
+from ..notifier import PostgreSQLNotifier
 from ..packundo import HistoryFreePackUndo
 from ..packundo import HistoryPreservingPackUndo
 from ..poller import Poller
@@ -66,7 +67,8 @@ class PostgreSQLAdapter(AbstractAdapter):
     def __init__(self, dsn='', options=None, oidallocator=None,
                  locker=None,
                  mover=None,
-                 connmanager=None
+                 connmanager=None,
+                 notifier=None,
                  ):
         # options is a relstorage.options.Options or None
         self._dsn = dsn
@@ -74,6 +76,7 @@ class PostgreSQLAdapter(AbstractAdapter):
         self.locker = locker
         self.mover = mover
         self.connmanager = connmanager
+        self.notifier = notifier
         super().__init__(options)
 
     def _create(self):
@@ -167,9 +170,17 @@ class PostgreSQLAdapter(AbstractAdapter):
             locker=self.locker,
             mover=self.mover,
             connmanager=self.connmanager,
+            notifier=self.notifier,
         )
         return inst
 
+    def _create_notifier(self, kind):
+        if kind == 'postgresql' and not self.poller.transactions_may_go_backwards:
+            notifier = PostgreSQLNotifier(self.connmanager)
+            self.connmanager.add_on_store_opened(notifier.on_store_opened)
+            return notifier
+        return super()._create_notifier(kind)
+
     def __str__(self):
         parts = []
         if self.keep_history:
@@ -49,6 +49,12 @@ BEGIN
   FROM temp_blob_chunk;
 
   -- History free has no current_object to update.
+  -- Tell listeners (the ``invalidation-notifier`` option) once we
+  -- commit. Only connections using that option turn this on.
+  IF current_setting('rs.notify', TRUE) = 'on' THEN
+    PERFORM pg_notify('relstorage_commits', p_committing_tid::text);
+  END IF;
+
   RETURN p_committing_tid;
 END;
 $$
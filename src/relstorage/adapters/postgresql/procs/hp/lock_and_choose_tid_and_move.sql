@@ -49,6 +49,12 @@ BEGIN
   ON CONFLICT (zoid) DO UPDATE SET
      tid = excluded.tid;
 
+  -- Tell listeners (the ``invalidation-notifier`` option) once we
+  -- commit. Only connections using that option turn this on.
+  IF current_setting('rs.notify', TRUE) = 'on' THEN
+    PERFORM pg_notify('relstorage_commits', p_committing_tid::text);
+  END IF;
+
   RETURN p_committing_tid;
 END;
 $$
@@ -49,18 +49,21 @@ class Sqlite3Adapter(AbstractAdapter): # pylint:disable=too-many-instance-attrib
     """
     driver_options = drivers
     WRITING_REQUIRES_EXCLUSIVE_LOCK = True
+    single_host = True
 
     def __init__(self, data_dir, pragmas,
                  options=None, oidallocator=None,
                  locker=None,
                  mover=None,
-                 connmanager=None):
+                 connmanager=None,
+                 notifier=None):
         self.data_dir = os.path.abspath(data_dir)
         self.pragmas = pragmas
         self.oidallocator = oidallocator
         self.locker = locker
         self.mover = mover
         self.connmanager = connmanager
+        self.notifier = notifier
         super().__init__(options)
 
     def _create(self):
@@ -155,5 +158,9 @@ class Sqlite3Adapter(AbstractAdapter): # pylint:disable=too-many-instance-attrib
             locker=self.locker,
             mover=self.mover,
             connmanager=self.connmanager,
+            notifier=self.notifier,
         )
         return inst
+
+    def _default_notifier_dir(self):
+        return self.data_dir
@@ -32,6 +32,24 @@ class AdapterTestBase(TestCase):
     def _makeOne(self, options):
         raise NotImplementedError
 
+    def test_socket_notifier_only_on_one_host(self):
+        import tempfile
+        import shutil
+        from ..notifier import LocalSocketNotifier
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        options = Options(driver=self.driver,
+                          invalidation_notifier='socket',
+                          invalidation_notifier_dir=directory)
+        adapter_kind = self._makeOne(Options(driver=self.driver))
+        if not adapter_kind.single_host:
+            with self.assertRaises(ValueError):
+                self._makeOne(options)
+            return
+        adapter = self._makeOne(options)
+        self.addCleanup(adapter.close)
+        self.assertIsInstance(adapter.notifier, LocalSocketNotifier)
+
     def test_implements(self):
         options = Options(driver=self.driver)
         adapter = self._makeOne(options)
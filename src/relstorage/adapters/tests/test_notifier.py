@@ -0,0 +1,180 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from hamcrest import assert_that
+from nti.testing.matchers import validly_provides
+
+from relstorage.tests import TestCase
+
+from ..interfaces import IInvalidationNotifier
+
+# pylint:disable=protected-access
+
+
+class TestInvalidationNotifier(TestCase):
+
+    def _makeOne(self):
+        from ..notifier import InvalidationNotifier
+        return InvalidationNotifier()
+
+    def test_provides(self):
+        assert_that(self._makeOne(), validly_provides(IInvalidationNotifier))
+
+    def test_changed_since(self):
+        notifier = self._makeOne()
+        # Not listening.
+        token = notifier.begin_poll()
+        self.assertIsNone(token)
+        notifier.polled(token, 5)
+        self.assertTrue(notifier.changed_since(5))
+
+        notifier._listening_started()
+        # We don't know where the database is yet.
+        self.assertTrue(notifier.changed_since(5))
+        notifier.polled(notifier.begin_poll(), 5)
+        self.assertFalse(notifier.changed_since(5))
+        self.assertTrue(notifier.changed_since(4))
+
+        notifier._notified(6)
+        self.assertTrue(notifier.changed_since(5))
+        self.assertFalse(notifier.changed_since(6))
+        notifier.committed(7)
+        self.assertTrue(notifier.changed_since(6))
+        self.assertEqual(notifier.stats, {'notified': 1, 'skipped': 2})
+
+        # A poll that began before we last started listening
+        # doesn't count.
+        token = notifier.begin_poll()
+        notifier._listening_stopped()
+        notifier._listening_started()
+        notifier.polled(token, 7)
+        self.assertTrue(notifier.changed_since(7))
+
+    def test_changed_since_after_max_quiet(self):
+        notifier = self._makeOne()
+        notifier._listening_started()
+        notifier.polled(notifier.begin_poll(), 5)
+        self.assertFalse(notifier.changed_since(5))
+        notifier.max_quiet = 0
+        self.assertTrue(notifier.changed_since(5))
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), "Requires Unix sockets")
+class TestLocalSocketNotifier(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp('.rsnotify')
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+    def _makeOne(self):
+        from ..notifier import LocalSocketNotifier
+        notifier = LocalSocketNotifier(self.temp_dir)
+        notifier.retry_delay = 0.1
+        notifier.start()
+        self.addCleanup(notifier.close)
+        self._wait_for(lambda: notifier.begin_poll() is not None)
+        return notifier
+
+    def _wait_for(self, condition):
+        deadline = time.time() + 10
+        while not condition():
+            if time.time() > deadline:
+                self.fail("Timed out")
+            time.sleep(0.01)
+
+    def test_committed_notifies_others(self):
+        sender = self._makeOne()
+        receiver = self._makeOne()
+        receiver.polled(receiver.begin_poll(), 5)
+        self.assertFalse(receiver.changed_since(5))
+
+        sender.committed(7)
+        self._wait_for(lambda: receiver.changed_since(5))
+        self.assertFalse(receiver.changed_since(7))
+        self.assertEqual(receiver.stats['notified'], 1)
+
+    def test_close_removes_socket(self):
+        import os
+        notifier = self._makeOne()
+        self.assertTrue(os.path.exists(notifier.path))
+        notifier.close()
+        self.assertFalse(os.path.exists(notifier.path))
+        # Sending to a socket left behind removes it.
+        with open(notifier.path, 'w'):
+            pass
+        self._makeOne().committed(1)
+        self.assertFalse(os.path.exists(notifier.path))
+
+
+class TestPostgreSQLNotifier(TestCase):
+
+    def test_store_connections_ask_for_notifications(self):
+        from ..notifier import PostgreSQLNotifier
+        executed = []
+
+        class Connection(object):
+            def commit(self):
+                executed.append('COMMIT')
+
+        class Cursor(object):
+            connection = Connection()
+            def execute(self, stmt):
+                executed.append(stmt)
+
+        PostgreSQLNotifier(None).on_store_opened(Cursor())
+        # The commit procs check this setting before they NOTIFY.
+        self.assertEqual(executed, ["SET rs.notify = 'on'", 'COMMIT'])
+
+
+class TestPollerWithNotifier(TestCase):
+
+    def _makeOne(self):
+        from ..poller import Poller
+        from ..notifier import InvalidationNotifier
+        poller = Poller(None, False, None, False, False)
+        poller.notifier = InvalidationNotifier()
+        poller.notifier._listening_started()
+        self.queries = []
+        def _poll_invalidations(conn, cursor, prev_polled_tid):
+            self.queries.append(prev_polled_tid)
+            return [(1, 6)], 6
+        poller._poll_invalidations = _poll_invalidations
+        return poller
+
+    def test_skips_query_when_nothing_committed(self):
+        poller = self._makeOne()
+        self.assertEqual(poller.poll_invalidations(None, None, 5), ([(1, 6)], 6))
+        self.assertEqual(self.queries, [5])
+
+        self.assertEqual(poller.poll_invalidations(None, None, 6), ((), 6))
+        self.assertEqual(self.queries, [5])
+
+        poller.notifier._notified(7)
+        poller.poll_invalidations(None, None, 6)
+        self.assertEqual(self.queries, [5, 6])
+
+    def test_first_poll_always_queries(self):
+        poller = self._makeOne()
+        poller.poll_invalidations(None, None, None)
+        self.assertEqual(self.queries, [None])
@@ -0,0 +1,176 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Learning which objects are loaded together.
+
+Each connection remembers the OIDs it loads during a transaction.
+When the transaction is over, each OID in that sequence is credited
+with the few OIDs loaded right after it. When one of those OIDs later
+misses the cache, its most frequent successors can be loaded in the
+same query instead of one at a time as the application asks for
+them.
+
+The table is bounded: only the most recently seen OIDs are kept, and
+each keeps only its most frequent successors.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import logging
+import struct
+import threading
+from collections import OrderedDict
+
+from .persistence import replacing_file
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'RSCOAC01'
+_COUNT = struct.Struct('<I')
+_ENTRY = struct.Struct('<qI')
+
+
+class CoAccessTable(object):
+    """
+    Counts how often each OID is loaded shortly after each other OID.
+    """
+
+    #: How many of the following loads are counted as successors.
+    window = 4
+    #: The most OIDs we keep successors for.
+    max_objects = 10000
+    #: The most successors we keep for each OID.
+    max_successors = 8
+    #: How many times a successor must have been seen to be
+    #: prefetched.
+    min_count = 2
+    #: The most loads of one transaction that we learn from.
+    max_sequence = 1000
+
+    def __init__(self):
+        # {oid: {successor: count}}, least recently used first.
+        self._table = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._table)
+
+    def clear(self):
+        with self._lock:
+            self._table.clear()
+
+    def learn(self, oids):
+        """
+        Learn from the sequence of OIDs loaded in one transaction.
+        """
+        oids = oids[:self.max_sequence]
+        window = self.window
+        with self._lock:
+            table = self._table
+            for i, oid in enumerate(oids):
+                following = set(oids[i + 1:i + 1 + window])
+                following.discard(oid)
+                if not following:
+                    continue
+                successors = table.get(oid)
+                if successors is None:
+                    successors = table[oid] = {}
+                    if len(table) > self.max_objects:
+                        table.popitem(last=False)
+                else:
+                    table.move_to_end(oid)
+                for successor in following:
+                    successors[successor] = successors.get(successor, 0) + 1
+                if len(successors) > 2 * self.max_successors:
+                    self._trim(successors)
+
+    def _trim(self, successors):
+        keep = sorted(successors.items(), key=lambda i: i[1], reverse=True)
+        keep = keep[:self.max_successors]
+        successors.clear()
+        successors.update(keep)
+
+    def successors(self, oid):
+        """
+        Return the OIDs most often loaded after *oid*, most frequent
+        first.
+        """
+        with self._lock:
+            successors = self._table.get(oid)
+            if not successors:
+                return []
+            found = sorted(
+                ((count, successor) for successor, count in successors.items()
+                 if count >= self.min_count),
+                reverse=True
+            )
+        return [successor for _, successor in found[:self.max_successors]]
+
+    def save(self, path):
+        """
+        Write the table to *path*, replacing it atomically.
+        """
+        with self._lock:
+            items = [(oid, list(successors.items()))
+                     for oid, successors in self._table.items()]
+        with replacing_file(path) as f:
+            f.write(_MAGIC)
+            f.write(_COUNT.pack(len(items)))
+            for oid, successors in items:
+                f.write(_ENTRY.pack(oid, len(successors)))
+                f.write(b''.join(_ENTRY.pack(s, c) for s, c in successors))
+
+    def load(self, path):
+        """
+        Add the table saved at *path*, if there is one.
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        except OSError:
+            logger.exception("Failed to read %r", path)
+            return
+        try:
+            loaded = self._parse(data)
+        except (struct.error, ValueError):
+            logger.warning("Ignoring corrupt co-access file %r", path)
+            return
+        with self._lock:
+            for oid, successors in loaded:
+                self._table[oid] = successors
+            while len(self._table) > self.max_objects:
+                self._table.popitem(last=False)
+
+    @staticmethod
+    def _parse(data):
+        if not data.startswith(_MAGIC):
+            raise ValueError("Bad magic")
+        offset = len(_MAGIC)
+        count, = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        entry_size = _ENTRY.size
+        loaded = []
+        for _ in range(count):
+            oid, successor_count = _ENTRY.unpack_from(data, offset)
+            offset += entry_size
+            successors = {}
+            for _ in range(successor_count):
+                successor, seen = _ENTRY.unpack_from(data, offset)
+                offset += entry_size
+                successors[successor] = seen
+            loaded.append((oid, successors))
+        return loaded
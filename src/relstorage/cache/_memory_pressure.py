@@ -0,0 +1,126 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Sizing the local cache according to the memory available.
+
+In a container, the memory that counts is what the container's
+control group is using, because that's what the kernel compares
+against the limit when it decides to kill us. Otherwise, we
+watch the resident set size of this process.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from relstorage._util import get_this_psutil_process
+
+logger = __import__('logging').getLogger(__name__)
+
+#: Files reporting the memory used by our control group, for
+#: cgroups v2 and v1, respectively.
+CGROUP_USAGE_FILES = (
+    '/sys/fs/cgroup/memory.current',
+    '/sys/fs/cgroup/memory/memory.usage_in_bytes',
+)
+
+
+def _read_int(path):
+    with open(path, 'rb') as f:
+        return int(f.read())
+
+
+def cgroup_memory_usage_function(paths=CGROUP_USAGE_FILES):
+    """
+    Return a function of no arguments that reports the bytes used by
+    our control group, or None if that's not available.
+    """
+    for path in paths:
+        try:
+            _read_int(path)
+        except (OSError, ValueError):
+            continue
+        return lambda: _read_int(path)
+    return None
+
+
+def process_memory_usage_function():
+    """
+    Return a function of no arguments that reports the resident set
+    size of this process, or None if that's not available.
+
+    This deliberately isn't :func:`relstorage._util.get_memory_usage`:
+    finding the unique set size is much too slow to do often.
+    """
+    proc = get_this_psutil_process()
+    if proc is None: # pragma: no cover
+        return None
+    return lambda: proc.memory_info().rss
+
+
+class MemoryPressureController(object):
+    """
+    Decides how large the local cache may be.
+
+    When the memory in use is above *memory_limit*, the cache is
+    shrunk by that excess (the memory we free by evicting is at least
+    the weight of what we evict), but never below a fraction of its
+    configured size. When there's enough headroom, it grows back
+    towards *max_cache_limit*, by half the headroom at a time.
+    """
+
+    #: Grow only when less than this fraction of the memory limit is used.
+    headroom_pct = 0.9
+    #: Never shrink below this fraction of the configured cache size.
+    min_limit_pct = 0.1
+
+    def __init__(self, memory_limit, max_cache_limit, get_usage):
+        self.memory_limit = memory_limit
+        self.max_cache_limit = max_cache_limit
+        self.min_cache_limit = int(max_cache_limit * self.min_limit_pct)
+        self.get_usage = get_usage
+
+    @classmethod
+    def from_options(cls, options, max_cache_limit):
+        """
+        Return a new controller, or None if not configured or memory
+        usage can't be determined.
+        """
+        if not options.cache_local_memory_limit_mb or not max_cache_limit:
+            return None
+        get_usage = cgroup_memory_usage_function() or process_memory_usage_function()
+        if get_usage is None: # pragma: no cover
+            logger.warning("Unable to determine memory usage; cache size will not be adjusted.")
+            return None
+        return cls(int(1000000 * options.cache_local_memory_limit_mb),
+                   max_cache_limit,
+                   get_usage)
+
+    def adjusted_limit(self, cache_limit, cache_weight):
+        """
+        Given the current limit and weight of the cache, return
+        what its limit should be.
+        """
+        usage = self.get_usage()
+        if not usage:
+            return cache_limit
+        if usage > self.memory_limit:
+            # Shrink from what's actually in use, not the limit,
+            # or a cache that's not full wouldn't give anything up.
+            target = min(cache_limit, cache_weight) - (usage - self.memory_limit)
+            return max(self.min_cache_limit, int(target))
+
+        low_water = self.memory_limit * self.headroom_pct
+        if usage < low_water and cache_limit < self.max_cache_limit:
+            return min(self.max_cache_limit, int(cache_limit + (low_water - usage) / 2))
+        return cache_limit
@@ -0,0 +1,202 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Online estimation of the hit ratio for other cache sizes.
+
+This uses spatially hashed sampling as described in "Efficient MRC
+Construction with SHARDS" (Waldspurger et al., FAST '15). Only
+accesses to OIDs whose hash falls below a threshold are tracked. For
+those, we find the reuse distance: the total size of the distinct
+sampled objects accessed since the last access to the same object.
+Scaled up by the inverse of the sampling rate, that estimates how
+large an LRU cache must be for the access to be a hit.
+
+The number of tracked OIDs is bounded. When there are too many, the
+threshold is lowered to drop those with the largest hashes, and what
+we've counted so far is scaled down to match (the "fixed-size"
+variant of SHARDS).
+
+With a low sampling rate, the sampled objects may be accessed more or
+less often than the typical object. As SHARDS_adj does, we
+correct for that by counting the difference between the expected and
+actual number of sampled accesses as hits in the smallest cache.
+
+The estimate is for a plain LRU cache, which the local cache is
+not, so it's best used to compare sizes, not to predict the exact
+hit ratio.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import heapq
+import threading
+from bisect import bisect_left
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_HASH_BITS = 24
+#: The modulus for sampling; an OID is sampled when its hash is
+#: less than the threshold.
+_MODULUS = 1 << _HASH_BITS
+
+
+def _hash(oid):
+    # Fibonacci hashing; the high bits are well distributed
+    # even though OIDs are sequential.
+    return ((oid * 0x9E3779B97F4A7C15) & _MASK64) >> (64 - _HASH_BITS)
+
+
+class _SizeTree(object):
+    """
+    A Fenwick tree holding the size of each sampled object at the
+    time of its most recent access, so we can sum the sizes of the
+    objects accessed after a given time.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._tree = [0] * (capacity + 1)
+
+    def add(self, time, size):
+        tree = self._tree
+        i = time + 1
+        capacity = self.capacity
+        while i <= capacity:
+            tree[i] += size
+            i += i & -i
+
+    def sum_through(self, time):
+        tree = self._tree
+        i = time + 1
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+
+class MissRatioCurve(object):
+    """
+    Estimates the hit ratio that LRU caches of *cache_sizes* (in
+    bytes) would achieve for the accesses passed to :meth:`record`.
+    """
+
+    #: The most OIDs we'll track at once.
+    max_tracked = 8192
+
+    def __init__(self, sample_rate, cache_sizes):
+        self.cache_sizes = sorted(cache_sizes)
+        self.threshold = max(1, int(_MODULUS * sample_rate))
+        # {oid: [last_access_time, size, hash]}
+        self._tracked = {}
+        # The tracked OIDs with the largest hashes first, so we know
+        # which to drop.
+        self._by_hash = []
+        self._tree = _SizeTree(self.max_tracked * 4)
+        self._time = 0
+        self._total_size = 0
+        # How many (scaled) accesses fall within each of the
+        # cache sizes, but not the smaller ones. The last entry is
+        # for those that fit none, including first accesses.
+        self._counts = [0.0] * (len(self.cache_sizes) + 1)
+        # All accesses, sampled or not. This isn't locked, so it may
+        # lose a few increments.
+        self._references = 0
+        self._lock = threading.Lock()
+
+    @property
+    def sample_rate(self):
+        return self.threshold / _MODULUS
+
+    def record(self, oid, size=None):
+        """
+        Record an access to *oid*. If it is cached, *size* is its
+        size; otherwise, the average size of the objects we track is
+        used until we find out.
+        """
+        self._references += 1
+        oid_hash = _hash(oid)
+        if oid_hash >= self.threshold:
+            return
+        with self._lock:
+            self._record(oid, oid_hash, size)
+
+    def _record(self, oid, oid_hash, size):
+        tracked = self._tracked
+        tree = self._tree
+        if self._time >= tree.capacity:
+            self._compact()
+        now = self._time
+        self._time += 1
+
+        entry = tracked.get(oid)
+        if entry is None:
+            if size is None:
+                size = self._total_size // len(tracked) if tracked else 0
+            tracked[oid] = [now, size, oid_hash]
+            heapq.heappush(self._by_hash, (-oid_hash, oid))
+            self._counts[-1] += 1
+            if len(tracked) > self.max_tracked:
+                self._lower_threshold()
+        else:
+            last_time, old_size, _ = entry
+            if size is None:
+                size = old_size
+            distance = (tree.sum_through(now) - tree.sum_through(last_time)) + size
+            self._counts[bisect_left(self.cache_sizes, distance / self.sample_rate)] += 1
+            tree.add(last_time, -old_size)
+            self._total_size -= old_size
+            entry[0] = now
+            entry[1] = size
+        tree.add(now, size)
+        self._total_size += size
+
+    def _lower_threshold(self):
+        tracked = self._tracked
+        by_hash = self._by_hash
+        old_rate = self.sample_rate
+        new_threshold = -by_hash[0][0]
+        while by_hash and -by_hash[0][0] >= new_threshold:
+            _, oid = heapq.heappop(by_hash)
+            last_time, size, _ = tracked.pop(oid)
+            self._tree.add(last_time, -size)
+            self._total_size -= size
+        self.threshold = new_threshold
+        # What we've counted so far was sampled at a higher rate.
+        scale = self.sample_rate / old_rate
+        self._counts = [count * scale for count in self._counts]
+
+    def _compact(self):
+        # Renumber the access times, preserving their order, so
+        # they fit in the tree again.
+        entries = sorted(self._tracked.values())
+        tree = self._tree = _SizeTree(self._tree.capacity)
+        for now, entry in enumerate(entries):
+            entry[0] = now
+            tree.add(now, entry[1])
+        self._time = len(entries)
+
+    def hit_ratios(self):
+        """
+        Return a list of ``(cache_size, estimated_hit_ratio)`` pairs.
+        """
+        counts = list(self._counts)
+        counts[0] += self._references * self.sample_rate - sum(counts)
+        total = sum(counts)
+        result = []
+        hits = 0
+        for cache_size, count in zip(self.cache_sizes, counts):
+            hits += count
+            result.append((cache_size, hits / total if total else 0))
+        return result
@@ -0,0 +1,431 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+A persistent cache format that is read through memory maps.
+
+Each cache prefix has two files in ``cache-local-dir``:
+
+- A data file of length-prefixed records. Each record is a fixed
+  size header (the OID, the TID, whether the state was frozen, and
+  the length of the state) followed by the state. Records are only
+  ever appended; storing a newer state for an object makes the old
+  record garbage. When there's too much garbage, the live records
+  are copied to a new data file, whose name has the next generation
+  number.
+- An index, recording the checkpoints, the compression dictionaries,
+  which data file is current and how much of it is valid, and where
+  the record for each object is. The entries are sorted by OID, so
+  one state can be found by a binary search of the mapped index,
+  without reading anything else.
+
+The index is replaced atomically after the data it refers to is on
+disk, so a write that's interrupted leaves the previous contents
+intact. The next write discards anything appended past the valid
+length. Writers in different processes take turns using a lock file.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import logging
+import mmap
+import os
+import struct
+
+from relstorage._compat import OID_TID_MAP_TYPE
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover
+    # Windows. Writers aren't coordinated.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'RSSEGI01'
+# magic, generation, max_hvt, complete_since, data_length,
+# entry_count, dictionary_count
+_HEADER = struct.Struct('<8sIqqQII')
+_DICTIONARY_LENGTH = struct.Struct('<I')
+# oid, tid, offset, length, frequency
+_ENTRY = struct.Struct('<qqQII')
+# oid, tid, frozen, length
+_RECORD = struct.Struct('<qqBI')
+
+_MAX_FREQUENCY = 0xFFFFFFFF
+
+
+class CorruptSegmentFileError(ValueError):
+    """
+    Raised when a segment index can't be used.
+    """
+
+
+class SegmentReader(object):
+    """
+    Read access to the current contents of a segment cache.
+
+    The index and data files are memory mapped; the data is only
+    read when a state is asked for.
+    """
+
+    def __init__(self, files):
+        self._index_map = self._data_map = None
+        with open(files.index_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise CorruptSegmentFileError("Truncated segment index", files.index_path)
+            self._index_map = index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, self.generation, max_hvt, complete_since, self.data_length,
+         self._count, dictionary_count) = _HEADER.unpack_from(index_map, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise CorruptSegmentFileError("Not a segment index", files.index_path)
+        self.checkpoints = (max_hvt, complete_since) if max_hvt >= 0 else None
+
+        offset = _HEADER.size
+        dictionaries = []
+        for _ in range(dictionary_count):
+            length, = _DICTIONARY_LENGTH.unpack_from(index_map, offset)
+            offset += _DICTIONARY_LENGTH.size
+            dictionaries.append(index_map[offset:offset + length])
+            offset += length
+        #: The serialized compression dictionaries, most recent first.
+        self.compression_dictionaries = dictionaries
+        self._entries_offset = offset
+        if offset + self._count * _ENTRY.size > size:
+            self.close()
+            raise CorruptSegmentFileError("Truncated segment index", files.index_path)
+
+        self.data_path = files.data_path(self.generation)
+        if self.data_length:
+            try:
+                with open(self.data_path, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size < self.data_length:
+                        raise CorruptSegmentFileError("Truncated segment data", self.data_path)
+                    self._data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except:
+                self.close()
+                raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t, v, tb):
+        self.close()
+
+    def close(self):
+        for m in self._index_map, self._data_map:
+            if m is not None:
+                m.close()
+        self._index_map = self._data_map = None
+
+    def __len__(self):
+        return self._count
+
+    def _entry(self, i):
+        return _ENTRY.unpack_from(self._index_map, self._entries_offset + i * _ENTRY.size)
+
+    def entries(self):
+        """
+        Iterate ``(oid, tid, offset, length, frequency)`` for all the
+        objects, in OID order.
+        """
+        return _ENTRY.iter_unpack(
+            self._index_map[self._entries_offset:self._entries_offset + self._count * _ENTRY.size]
+        )
+
+    def oid_to_tid(self):
+        """
+        A map from OID to the TID of its state.
+        """
+        return OID_TID_MAP_TYPE([(entry[0], entry[1]) for entry in self.entries()])
+
+    def _state(self, oid, tid, offset, length):
+        data_map = self._data_map
+        record_oid, record_tid, frozen, record_length = _RECORD.unpack_from(data_map, offset)
+        if (record_oid, record_tid, record_length) != (oid, tid, length):
+            raise CorruptSegmentFileError("Index doesn't match data", self.data_path, oid)
+        start = offset + _RECORD.size
+        return data_map[start:start + length], frozen
+
+    def get(self, oid):
+        """
+        Find the object *oid* and return ``(state, tid, frozen, frequency)``,
+        or None if it isn't here.
+        """
+        low = 0
+        high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            if entry[0] < oid:
+                low = middle + 1
+            elif entry[0] > oid:
+                high = middle
+            else:
+                _, tid, offset, length, frequency = entry
+                state, frozen = self._state(oid, tid, offset, length)
+                return state, tid, bool(frozen), frequency
+        return None
+
+    def fetch_rows_by_priority(self):
+        """
+        Iterate ``(zoid, was_frozen, state, tid, frequency)`` from most
+        frequently used and newest, to least frequently used and
+        oldest, like
+        :meth:`relstorage.cache.local_database.Database.fetch_rows_by_priority`.
+        """
+        entries = sorted(self.entries(), key=lambda e: (e[4], e[1]), reverse=True)
+        for oid, tid, offset, length, frequency in entries:
+            state, frozen = self._state(oid, tid, offset, length)
+            yield oid, -1 if frozen else tid, state, tid, frequency
+
+
+class SegmentWriter(object):
+    """
+    Changes a segment cache. Get one from :meth:`SegmentFiles.writing`.
+
+    Call :meth:`append` and :meth:`remove` as needed, and then
+    :meth:`commit`.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.generation = 0
+        self.data_length = 0
+        self.checkpoints = None
+        self.compression_dictionaries = []
+        # {oid: [tid, offset, length, frequency]}
+        self._entries = {}
+        reader = None
+        try:
+            reader = files.open_reader()
+        except (CorruptSegmentFileError, OSError, ValueError):
+            logger.exception("Discarding unusable cache index at %s", files.index_path)
+        if reader is not None:
+            with reader:
+                self.generation = reader.generation
+                self.data_length = reader.data_length
+                self.checkpoints = reader.checkpoints
+                self.compression_dictionaries = reader.compression_dictionaries
+                self._entries = {
+                    entry[0]: list(entry[1:])
+                    for entry in reader.entries()
+                }
+        self.oid_to_tid = OID_TID_MAP_TYPE([(oid, entry[0]) for oid, entry in self._entries.items()])
+
+    def append(self, rows):
+        """
+        Add the ``(oid, tid, frozen, state, frequency)`` *rows* to the
+        data file, ignoring those older than what we have.
+
+        Returns how many were added.
+        """
+        entries = self._entries
+        count = 0
+        data_path = self.files.data_path(self.generation)
+        with open(data_path, 'r+b' if os.path.exists(data_path) else 'w+b') as f:
+            # Anything past the valid length is from an
+            # interrupted write.
+            f.truncate(self.data_length)
+            f.seek(self.data_length)
+            offset = self.data_length
+            for oid, tid, frozen, state, frequency in rows:
+                entry = entries.get(oid)
+                if entry is not None:
+                    if entry[0] > tid:
+                        continue
+                    frequency += entry[3]
+                length = len(state)
+                f.write(_RECORD.pack(oid, tid, bool(frozen), length))
+                f.write(state)
+                entries[oid] = [tid, offset, length, min(frequency, _MAX_FREQUENCY)]
+                offset += _RECORD.size + length
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        self.data_length = offset
+        return count
+
+    def remove(self, oids):
+        """
+        Forget the objects *oids*. Returns how many there were.
+        """
+        entries = self._entries
+        count = 0
+        for oid in oids:
+            if entries.pop(oid, None) is not None:
+                count += 1
+        return count
+
+    def _trim_to_size(self, limit):
+        entries = self._entries
+        how_much_to_trim = sum(entry[2] for entry in entries.values()) - limit
+        if how_much_to_trim <= 0:
+            return
+        # The oldest, least used, biggest objects go first,
+        # like Database.trim_to_size.
+        victims = sorted(entries.items(),
+                         key=lambda item: (item[1][3], item[1][0], -item[1][2], item[0]))
+        for oid, entry in victims:
+            del entries[oid]
+            how_much_to_trim -= entry[2]
+            if how_much_to_trim <= 0:
+                break
+
+    def _compact(self):
+        old_path = self.files.data_path(self.generation)
+        generation = self.generation + 1
+        new_path = self.files.data_path(generation)
+        entries = self._entries
+        offset = 0
+        with open(old_path, 'rb') as old, open(new_path, 'wb') as new:
+            old_map = mmap.mmap(old.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for oid, entry in sorted(entries.items(), key=lambda item: item[1][1]):
+                    size = _RECORD.size + entry[2]
+                    new.write(old_map[entry[1]:entry[1] + size])
+                    entry[1] = offset
+                    offset += size
+            finally:
+                old_map.close()
+            new.flush()
+            os.fsync(new.fileno())
+        self.generation = generation
+        self.data_length = offset
+
+    def commit(self, checkpoints=None, dictionary=None, limit=None):
+        """
+        Trim the contents to *limit* bytes of state, if given, and
+        write the index.
+
+        The *checkpoints* replace the saved ones if they're newer;
+        a compression *dictionary* is saved along with a few
+        older ones.
+        """
+        if limit is not None:
+            self._trim_to_size(limit)
+        live_length = sum(_RECORD.size + entry[2] for entry in self._entries.values())
+        garbage = self.data_length - live_length
+        if garbage > max(live_length, self.files.min_garbage_to_compact):
+            self._compact()
+
+        if checkpoints and (not self.checkpoints or checkpoints[0] >= self.checkpoints[0]):
+            self.checkpoints = tuple(checkpoints)
+        if dictionary is not None:
+            self.compression_dictionaries = [dictionary] + [
+                d for d in self.compression_dictionaries if d != dictionary
+            ]
+        dictionaries = self.compression_dictionaries[:self.files.max_compression_dictionaries]
+
+        checkpoints = self.checkpoints or (-1, -1)
+        parts = [_HEADER.pack(_MAGIC, self.generation, checkpoints[0], checkpoints[1],
+                              self.data_length, len(self._entries), len(dictionaries))]
+        for d in dictionaries:
+            parts.append(_DICTIONARY_LENGTH.pack(len(d)))
+            parts.append(d)
+        pack = _ENTRY.pack
+        parts.extend(pack(oid, *entry) for oid, entry in sorted(self._entries.items()))
+
+        index_path = self.files.index_path
+        temp_path = index_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(b''.join(parts))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, index_path)
+        self.files.remove_data_files(keep=self.generation)
+
+
+class _Writing(object):
+
+    def __init__(self, files):
+        self.files = files
+        self._lock_file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._lock_file = open(self.files.index_path + '.lock', 'ab') # pylint:disable=consider-using-with
+            fcntl.lockf(self._lock_file, fcntl.LOCK_EX)
+        return SegmentWriter(self.files)
+
+    def __exit__(self, t, v, tb):
+        if self._lock_file is not None:
+            # Closing releases the lock.
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class SegmentFiles(object):
+    """
+    The files of the segment cache for one prefix in a directory.
+    """
+
+    #: How many compression dictionaries to keep. States compressed
+    #: with a dictionary that has been discarded can't be used.
+    max_compression_dictionaries = 4
+    #: Don't bother to compact the data file until it has at least
+    #: this much garbage (and more garbage than live data).
+    min_garbage_to_compact = 1024 * 1024
+
+    def __init__(self, parent_dir, prefix):
+        self.parent_dir = parent_dir
+        self.prefix = prefix
+        self.index_path = os.path.join(parent_dir, 'relstorage-cache2-' + prefix + '.rsidx')
+
+    def data_path(self, generation):
+        return os.path.join(self.parent_dir,
+                            'relstorage-cache2-%s.%d.rsseg' % (self.prefix, generation))
+
+    def _data_paths(self):
+        # The prefix may have glob special characters.
+        pattern = os.path.join(glob.escape(self.parent_dir),
+                               glob.escape('relstorage-cache2-' + self.prefix) + '.*.rsseg')
+        return glob.glob(pattern)
+
+    def open_reader(self):
+        """
+        Return a :class:`SegmentReader`, or None if there's no cache.
+        """
+        if not os.path.exists(self.index_path):
+            return None
+        return SegmentReader(self)
+
+    def writing(self):
+        """
+        A context manager that waits for other writers and returns a
+        :class:`SegmentWriter`.
+        """
+        return _Writing(self)
+
+    def remove_data_files(self, keep=None):
+        keep = self.data_path(keep) if keep is not None else None
+        for path in self._data_paths():
+            if path != keep:
+                _quiet_remove(path)
+
+    def destroy(self):
+        logger.info("Replacing any existing cache at %s", self.index_path)
+        _quiet_remove(self.index_path)
+        self.remove_data_files()
+
+
+def _quiet_remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        logger.debug("Failed to remove %r", path, exc_info=True)
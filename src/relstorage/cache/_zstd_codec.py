@@ -0,0 +1,210 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Zstandard compression for the local cache.
+
+Pickles are small and individually compress poorly, but pickles of
+objects of the same class share most of their bytes. Zstandard can
+exploit that with a dictionary trained on a sample of pickles.
+
+States compressed without a dictionary are prefixed with
+``ZstdCodec.marker``; states compressed with a dictionary are
+prefixed with ``ZstdCodec.dictionary_marker``. The frame itself
+records which dictionary was used, so dictionaries that were loaded
+from a persistent cache file (possibly written by other processes)
+can still be used to decompress.
+
+This requires the optional ``zstandard`` package.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+
+from relstorage._util import thread_spawn
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = __import__('logging').getLogger(__name__)
+
+
+class ZstdCodec(object):
+    """
+    Compresses and decompresses cached states.
+
+    The (de)compressor objects in ``zstandard`` must not be shared
+    between threads, so each thread gets its own.
+    """
+
+    marker = b'.s'
+    dictionary_marker = b'.S'
+
+    #: The compression level.
+    level = 3
+    #: The size of a trained dictionary in bytes. This is the zstd default.
+    dictionary_size = 110 * 1024
+    #: How many states to sample before training a dictionary.
+    training_sample_count = 2000
+    #: States larger than this aren't worth sampling.
+    training_sample_max_size = 16384
+
+    available = zstandard is not None
+
+    def __init__(self, train_dictionary=False):
+        if zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        self._local = threading.local()
+        # The dictionary we compress with, if any.
+        self.dictionary = None
+        # All the dictionaries we can decompress with, by id.
+        self._dictionaries = {}
+        self._samples = [] if train_dictionary else None
+        self._training_lock = threading.Lock()
+        # The thread training a dictionary from the samples, once
+        # there are enough of them.
+        self._trainer = None
+
+    def _compressor(self):
+        local = self._local
+        dictionary = self.dictionary
+        compressor = getattr(local, 'compressor', None)
+        if compressor is None or local.compressor_dictionary is not dictionary:
+            if dictionary is None:
+                compressor = zstandard.ZstdCompressor(level=self.level)
+            else:
+                compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+            local.compressor = compressor
+            local.compressor_dictionary = dictionary
+        return compressor
+
+    def _decompressor(self, dict_id):
+        local = self._local
+        decompressors = getattr(local, 'decompressors', None)
+        if decompressors is None:
+            decompressors = local.decompressors = {}
+        try:
+            return decompressors[dict_id]
+        except KeyError:
+            pass
+        if dict_id:
+            decompressor = zstandard.ZstdDecompressor(dict_data=self._dictionaries[dict_id])
+        else:
+            decompressor = zstandard.ZstdDecompressor()
+        decompressors[dict_id] = decompressor
+        return decompressor
+
+    def compress(self, data):
+        """
+        Return the compressed *data*, including the marker.
+        """
+        if self._samples is not None and self.dictionary is None and self._trainer is None:
+            self._sample(data)
+        compressed = self._compressor().compress(data)
+        return (self.marker if self.dictionary is None else self.dictionary_marker) + compressed
+
+    def decompress(self, data):
+        """
+        Decompress *data* (not including the marker) that was
+        compressed without a dictionary.
+        """
+        return self._decompressor(0).decompress(data)
+
+    def decompress_with_dictionary(self, data):
+        """
+        Decompress *data* (not including the marker) that was
+        compressed with one of our dictionaries.
+        """
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        return self._decompressor(dict_id).decompress(data)
+
+    def can_decompress(self, state):
+        """
+        Can we decompress the complete (including the marker) *state*?
+        """
+        if state[:2] != self.dictionary_marker:
+            return True
+        try:
+            return zstandard.get_frame_parameters(state[2:]).dict_id in self._dictionaries
+        except zstandard.ZstdError:
+            return False
+
+    def _sample(self, data):
+        if len(data) > self.training_sample_max_size:
+            return
+        samples = self._samples
+        if samples is None:
+            return
+        samples.append(bytes(data))
+        if len(samples) < self.training_sample_count:
+            return
+        with self._training_lock:
+            if self._trainer is not None or self._samples is not samples:
+                # Someone else started training, or we stopped wanting to.
+                return
+            # Training takes a long time; don't make whoever is
+            # storing this state wait for it. Until it's done, we
+            # keep compressing without a dictionary.
+            self._trainer = thread_spawn(self._train, (samples,), daemon=True)
+
+    def _train(self, samples):
+        try:
+            dictionary = zstandard.train_dictionary(self.dictionary_size, samples)
+        except zstandard.ZstdError:
+            # Too little data, most likely.
+            logger.debug("Failed to train a compression dictionary", exc_info=True)
+            self._samples = None
+            return
+        logger.debug("Trained compression dictionary %d from %d samples",
+                     dictionary.dict_id(), len(samples))
+        if self.dictionary is None:
+            # We may have loaded one in the meantime.
+            self.use_dictionary(dictionary)
+
+    def wait_for_training(self, timeout=None):
+        """
+        Wait for a dictionary being trained in the background, if any.
+        """
+        trainer = self._trainer
+        if trainer is not None:
+            trainer.join(timeout)
+
+    def add_dictionary(self, data):
+        """
+        Make the serialized dictionary *data* available for decompression,
+        and return it.
+        """
+        dictionary = zstandard.ZstdCompressionDict(data)
+        self._dictionaries.setdefault(dictionary.dict_id(), dictionary)
+        return self._dictionaries[dictionary.dict_id()]
+
+    def use_dictionary(self, dictionary):
+        """
+        Begin compressing with *dictionary*.
+        """
+        if not isinstance(dictionary, zstandard.ZstdCompressionDict):
+            dictionary = self.add_dictionary(dictionary)
+        self._dictionaries[dictionary.dict_id()] = dictionary
+        self._samples = None
+        self.dictionary = dictionary
+
+    @property
+    def wants_dictionary(self):
+        """
+        Are we configured to use a dictionary, but don't have one yet?
+        """
+        return self._samples is not None and self.dictionary is None
@@ -57,6 +57,7 @@ using namespace relstorage::cache;
 RSR_SINLINE
 size_t _spill_from_ring_to_ring(Generation& updated_ring,
                                 Generation& destination_ring,
+                                const FrequencySketch& sketch,
                                 const ICacheEntry* updated_ignore_me=nullptr,
                                 bool allow_rejects=true)
 {
@@ -90,7 +91,9 @@ size_t _spill_from_ring_to_ring(Generation& updated_ring,
                 removed = updated_oldest;
                 updated_ring.remove(*updated_oldest);
             }
-            else if (updated_oldest->frequency >= destination_oldest->frequency) {
+            else if (sketch.enabled()
+                     ? sketch.admit(updated_oldest->key, destination_oldest->key)
+                     : updated_oldest->frequency >= destination_oldest->frequency) {
                 // good bye to the item on probation.
                 removed = destination_oldest;
                 destination_ring.remove(*destination_oldest);
@@ -240,17 +243,17 @@ void Generation::on_hit(ICacheEntry& entry)
 void Probation::on_hit(ICacheEntry& entry)
 {
     entry.frequency++;
-    this->_protected.adopt(entry); // guaranteed not to spill
+    this->cache.ring_protected.adopt(entry); // guaranteed not to spill
 
-    if( !this->_protected.oversize() ) {
+    if( !this->cache.ring_protected.oversize() ) {
         return;
     }
 
     // Protected got too big. Demote entries back to probation until
     // protected is the right size (or we happen to hit the entry we
     // just added, or the ring only has one item left)
-    _spill_from_ring_to_ring(this->_protected,
-                             *this, &entry);
+    _spill_from_ring_to_ring(this->cache.ring_protected,
+                             *this, this->cache.sketch, &entry);
 
 }
 
@@ -262,7 +265,8 @@ void Protected::on_hit(ICacheEntry& entry)
     Generation::on_hit(entry);
     if (this->oversize()) {
         // Demote to probation, rejecting as needed.
-        _spill_from_ring_to_ring(*this, this->_probation, &entry);
+        _spill_from_ring_to_ring(*this, this->cache.ring_probation,
+                                 this->cache.sketch, &entry);
     }
 }
 
@@ -313,6 +317,7 @@ bool Eden::_balance_rings(ICacheEntry* added_or_changed, bool allow_rejects)
     // if needed.
     return _spill_from_ring_to_ring(*this,
                                     this->cache.ring_probation,
+                                    this->cache.sketch,
                                     added_or_changed,
                                     allow_rejects);
 }
@@ -375,15 +380,17 @@ void MVCacheEntry::remove_tids_lte(TID_t tid)
     // erase(b, e) removes things from b, stopping at e (it never removes e).
     // Thus to remove everything less than tid, we need to return a second iterator
     // greater than tid,
+    // The left side must be closed: zero is a valid TID (it's used for
+    // objects that don't exist).
     std::pair<iterator, iterator> range = this->p_values.bounded_range(0, tid,
-                                                                       false, true);
+                                                                       true, true);
     this->p_values.erase_and_dispose(range.first, range.second, Disposer());
 }
 
 void MVCacheEntry::remove_tids_lt(TID_t tid)
 {
     std::pair<iterator, iterator> range = this->p_values.bounded_range(0, tid,
-                                                                       false, false);
+                                                                       true, false);
     this->p_values.erase_and_dispose(range.first, range.second, Disposer());
 }
 
@@ -460,14 +467,19 @@ PythonAllocator<SVCacheEntry> Cache::allocator;
 PythonAllocator<ICacheEntry> Cache::deallocator;
 
 
-void Cache::add_to_eden(const ProposedCacheEntry& proposed)
+void Cache::add_to_eden(ProposedCacheEntry& proposed)
 {
     if (unlikely(this->data.count(proposed.oid()))) {
         throw std::runtime_error("Key already present");
     }
 
+    this->states.share(proposed);
     SVCacheEntry* entry = new SVCacheEntry(proposed);
     this->data.insert(*entry);
+    if (this->sketch.enabled()) {
+        this->sketch.ensure_capacity(this->data.size());
+        this->sketch.increment(entry->key);
+    }
     this->ring_eden.add(*entry);
 }
 
@@ -508,12 +520,20 @@ OidList Cache::add_many(TempCacheFiller& temp_filler)
 
     // The numbers above are for if we quit early, as soon as we're full.
 
+    // Size the sketch for everything up front, rather than growing
+    // it while we seed it.
+    if (this->sketch.enabled()) {
+        this->sketch.ensure_capacity(this->data.size() + temp_filler.entries.size());
+    }
+
     // We put all the data into eden. We then manually rebalance the rings to get the
     // best rejections when we have all the frequency information.
-    for (TempCacheFiller::iterator it = temp_filler.begin(), end = temp_filler.end();
+    for (TempCacheFiller::EntryList::iterator it = temp_filler.entries.begin(),
+             end = temp_filler.entries.end();
          it != end;
          ++it ) {
         // Don't try if we know we won't find a place for it.
+        this->states.share(*it);
         SVCacheEntry* incoming = new SVCacheEntry(*it);
         if (!this->will_fit(*incoming)) {
             delete incoming;
@@ -521,6 +541,12 @@ OidList Cache::add_many(TempCacheFiller& temp_filler)
         }
 
         this->data.insert(*incoming); // This fails if it's already present.
+        if (this->sketch.enabled()) {
+            // Seed the sketch with the frequency we saved.
+            for (uint32_t i = 0; i < incoming->frequency && i < 15; i++) {
+                this->sketch.increment(incoming->key);
+            }
+        }
         this->ring_eden.add(*incoming, false);
         if (this->ring_eden.sum_weights() > this->max_weight()) {
             break;
@@ -536,8 +562,10 @@ OidList Cache::add_many(TempCacheFiller& temp_filler)
     int would_evict = 1;
 
     while(this->oversize() && would_evict) {
-        would_evict = _spill_from_ring_to_ring(this->ring_eden, this->ring_protected, nullptr, false);
-        would_evict += _spill_from_ring_to_ring(this->ring_protected, this->ring_probation);
+        would_evict = _spill_from_ring_to_ring(this->ring_eden, this->ring_protected,
+                                               this->sketch, nullptr, false);
+        would_evict += _spill_from_ring_to_ring(this->ring_protected, this->ring_probation,
+                                                this->sketch);
     }
 
     // Now, only what's left is added.
@@ -556,14 +584,16 @@ OidList Cache::add_many(TempCacheFiller& temp_filler)
     } while (0); \
     ICacheEntry& existing_entry = *it;
 
-void Cache::store_and_make_MRU(const ProposedCacheEntry& proposed)
+void Cache::store_and_make_MRU(ProposedCacheEntry& proposed)
 {
     if_existing(proposed.oid(), );
 
+    this->states.share(proposed);
     ICacheEntry* new_entry = existing_entry.adding_value(proposed);
 
     assert(new_entry);
     assert(new_entry->generation());
+    this->sketch.increment(new_entry->key);
     new_entry->generation()->on_hit(*new_entry);
 }
 
@@ -632,6 +662,11 @@ ICacheEntry* Cache::get(const OID_t key)
 
 SVCacheEntry* Cache::_get_or_peek(const OID_t key, const TID_t tid, const bool peek)
 {
+    if (!peek) {
+        // Record the access even on a miss; that's how the sketch
+        // remembers the popularity of evicted keys.
+        this->sketch.increment(key);
+    }
     if_existing(key, nullptr);
     SVCacheEntry* matching = existing_entry.matching_tid(tid);
     if (matching && !peek)
@@ -649,6 +684,29 @@ SVCacheEntry* Cache::get(const OID_t key, const TID_t tid)
     return _get_or_peek(key, tid, false);
 }
 
+size_t Cache::evict_to_fit()
+{
+    // Unlike spilling, this doesn't consider frequencies: the
+    // least valuable generations go first, oldest entries first.
+    Generation* rings[] = {&this->ring_probation, &this->ring_eden, &this->ring_protected};
+    const size_t limit = this->max_weight();
+    size_t evicted = 0;
+    for (size_t i = 0; i < 3; i++) {
+        Generation& ring = *rings[i];
+        while (this->weight() > limit && !ring.empty()) {
+            ICacheEntry* victim = ring.lru();
+            ring.remove(*victim);
+            victim->remove_from_index();
+            evicted += 1;
+            if (victim->can_delete())
+                delete victim;
+            else
+                assert(victim->in_python());
+        }
+    }
+    return evicted;
+}
+
 void Cache::age_frequencies()
 {
     OidEntryMap::iterator end = this->data.end();
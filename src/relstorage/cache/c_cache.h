@@ -59,7 +59,10 @@
 
 #include <string>
 #include <vector>
+#include <memory>
+#include <algorithm>
 #include <stdexcept>
+#include <unordered_set>
 #include <cassert>
 
 #include <boost/intrusive/list.hpp>
@@ -162,6 +165,12 @@ namespace cache {
 
             return static_cast<size_t>(s);
         }
+        /** Return a borrowed pointer to the bytes; valid as long as the pickle is. */
+        static inline const char* data(const PyObject*const & pickle)
+        {
+            assert(pickle);
+            return PyBytes_AS_STRING(const_cast<PyObject*&>(pickle));
+        }
         static inline bool eq(const PyObject*const& lhs,
                               const PyObject*const& rhs)
         {
@@ -208,6 +217,7 @@ namespace cache {
             return o;
         }
         static inline size_t size(const std::string& p) { return p.size(); }
+        static inline const char* data(const std::string& p) { return p.data(); }
         static inline bool eq(const std::string& lhs, const std::string& rhs) {
             return lhs == rhs;
         }
@@ -455,16 +465,18 @@ namespace cache {
         OID_t _oid;
         TID_t _tid;
         bool _frozen;
+        bool _shared;
         int _frequency;
     public:
         // For bulk allocation in a vector
-        ProposedCacheEntry() : _pickle(), _oid(-1), _tid(-1), _frozen(false), _frequency(1) {}
+        ProposedCacheEntry() : _pickle(), _oid(-1), _tid(-1), _frozen(false), _shared(false), _frequency(1) {}
 
         ProposedCacheEntry(const ProposedCacheEntry& other)
             : _pickle(other._pickle),
               _oid(other._oid),
               _tid(other._tid),
               _frozen(other._frozen),
+              _shared(other._shared),
               _frequency(other._frequency)
         {
             Py_XINCREF(this->_pickle);
@@ -476,6 +488,7 @@ namespace cache {
               _oid(oid),
               _tid(tid),
               _frozen(frozen),
+              _shared(false),
               _frequency(frequency)
         {
             Py_INCREF(this->_pickle);
@@ -488,6 +501,7 @@ namespace cache {
             this->_oid = other._oid;
             this->_tid = other._tid;
             this->_frozen = other._frozen;
+            this->_shared = other._shared;
             this->_frequency = other._frequency;
             return *this;
         }
@@ -513,8 +527,21 @@ namespace cache {
         inline OID_t oid() const { return _oid; }
         inline TID_t tid() const { return _tid; }
         inline bool frozen() const { return _frozen; }
+        inline bool shared() const { return _shared; }
         inline PyObject* borrow_pickle() const { return _pickle; }
         inline int frequency() const { return _frequency; }
+
+        /**
+         * Use *pickle*, which must be equal to our pickle, instead. If
+         * *shared*, its bytes are already paid for by another entry.
+         */
+        void share_pickle(PyObject* pickle, bool shared)
+        {
+            Py_INCREF(pickle);
+            Py_XDECREF(this->_pickle);
+            this->_pickle = pickle;
+            this->_shared = shared;
+        }
     };
 
     struct TempCacheFiller {
@@ -550,6 +577,8 @@ namespace cache {
         // Remember alignment constraints; if the parent changes at all,
         // we might need to adjust here to avoid padding.
         bool _frozen;
+        // Whether the bytes of the pickle are charged to another entry.
+        bool _shared;
         const Pickle_t _pickle;
         const TID_t _tid;
         BOOST_MOVABLE_BUT_NOT_COPYABLE(SVCacheEntry)
@@ -567,6 +596,7 @@ namespace cache {
         SVCacheEntry(BOOST_RV_REF(SVCacheEntry) from)
             : ICacheEntry(from.key),
               _frozen(from._frozen),
+              _shared(from._shared),
               _pickle(boost::move(from._pickle)), // steal the reference
               _tid(from._tid)
         {
@@ -575,6 +605,7 @@ namespace cache {
         SVCacheEntry(const ProposedCacheEntry& proposed)
             : ICacheEntry(proposed.oid()),
               _frozen(proposed.frozen()),
+              _shared(proposed.shared()),
               _pickle(owning_state(proposed.borrow_pickle())),
               _tid(proposed.tid())
         {
@@ -582,9 +613,11 @@ namespace cache {
         }
 
         SVCacheEntry(const OID_t oid, TID_t tid,
-                     const Pickle_t& pickle, bool frozen=false)
+                     const Pickle_t& pickle, bool frozen=false,
+                     bool shared=false)
             : ICacheEntry(oid),
               _frozen(frozen),
+              _shared(shared),
               _pickle(pickle),
               _tid(tid)
         {
@@ -594,6 +627,7 @@ namespace cache {
         SVCacheEntry()
             : ICacheEntry(),
               _frozen(false),
+              _shared(false),
               _pickle(),
               _tid(-1)
         {
@@ -627,6 +661,16 @@ namespace cache {
             return _StateOperations::size(this->_pickle);
         }
 
+        /**
+         * Borrow the raw bytes of the state. This is only valid
+         * for as long as this object is alive; callers that expose
+         * it must hold a use (``Py_use``) on this entry.
+         */
+        const char* data() const
+        {
+            return _StateOperations::data(this->_pickle);
+        }
+
         bool state_eq(const Pickle_t& other) const
         {
             return _StateOperations::eq(this->_pickle, other);
@@ -658,10 +702,16 @@ namespace cache {
             return this->_frozen;
         }
 
+        bool shared() const
+        {
+            return this->_shared;
+        }
+
         virtual size_t weight() const
         {
-            // include: the bytes for the cached object,
-            return ICacheEntry::weight() + this->size();
+            // include: the bytes for the cached object, unless
+            // another entry is paying for them.
+            return ICacheEntry::weight() + (this->_shared ? 0 : this->size());
         }
 
         virtual size_t overhead() const
@@ -706,16 +756,19 @@ namespace cache {
             const Pickle_t state;
             const TID_t tid;
             bool frozen;
+            const bool shared;
 
             Entry(const ProposedCacheEntry& incoming)
                 : state(owning_state(incoming.borrow_pickle())),
                   tid(incoming.tid()),
-                  frozen(incoming.frozen())
+                  frozen(incoming.frozen()),
+                  shared(incoming.shared())
             {}
             Entry(const SVCacheEntry& incoming)
                 : state(boost::move(incoming.state())),
                   tid(incoming.tid()),
-                  frozen(incoming.frozen())
+                  frozen(incoming.frozen()),
+                  shared(incoming.shared())
             {}
 
             SVCacheEntry* new_sv(OID_t key, int freq) const
@@ -723,14 +776,15 @@ namespace cache {
                 SVCacheEntry* new_entry = new SVCacheEntry(key,
                                                            tid,
                                                            state,
-                                                           frozen);
+                                                           frozen,
+                                                           shared);
                 new_entry->frequency = freq;
                 return new_entry;
             }
 
             size_t weight() const
             {
-                return _StateOperations::size(this->state) + sizeof(Entry);
+                return (shared ? 0 : _StateOperations::size(this->state)) + sizeof(Entry);
             }
 
             ~Entry()
@@ -882,6 +936,334 @@ namespace cache {
 
     class Cache;
 
+    /**
+     * A count-min sketch of the popularity of keys, as used by
+     * W-TinyLFU (and Caffeine's ``FrequencySketch``, from which this
+     * is adapted).
+     *
+     * Each key is tracked by four 4-bit counters, found in a table of
+     * 64-bit words; the estimated frequency of a key is the minimum
+     * of its counters, so it is never less than its true count
+     * (saturating at 15). Because the sketch is independent of the
+     * cached entries, it also remembers keys that have been evicted.
+     *
+     * Once the number of increments reaches a sample size of ten
+     * times the number of tracked entries, all the counters are
+     * halved. This ages the popularity of every key at once, in time
+     * proportional to the (small) size of the table, not the number
+     * of cached entries.
+     */
+    class FrequencySketch {
+    private:
+        // Kept small: this is embedded in the Cache, whose size
+        // counts towards its weight.
+        std::unique_ptr<uint64_t[]> table;
+        uint64_t table_mask;
+        size_t additions;
+
+        static const uint64_t RESET_MASK = 0x7777777777777777ULL;
+        static const uint64_t ONE_MASK = 0x1111111111111111ULL;
+
+        RSR_SINLINE uint64_t seed(int i)
+        {
+            static const uint64_t seeds[] = {
+                0xc3a5c85c97cb3127ULL, 0xb492b66fbe98f273ULL,
+                0x9ae16a3b2f90404fULL, 0xcbf29ce484222325ULL
+            };
+            return seeds[i];
+        }
+
+        RSR_SINLINE uint64_t spread(OID_t key)
+        {
+            // The splitmix64 finalizer. OIDs tend to be sequential,
+            // so we need to scatter them.
+            uint64_t x = static_cast<uint64_t>(key);
+            x = (x ^ (x >> 30)) * 0xbf58476d1ce4e5b9ULL;
+            x = (x ^ (x >> 27)) * 0x94d049bb133111ebULL;
+            return x ^ (x >> 31);
+        }
+
+        RSR_SINLINE int bit_count(uint64_t x)
+        {
+            int count = 0;
+            for (; x; ++count) {
+                x &= x - 1;
+            }
+            return count;
+        }
+
+        RSR_INLINE size_t index_of(uint64_t hash, int i) const
+        {
+            uint64_t h = (hash + seed(i)) * seed(i);
+            h += h >> 32;
+            return static_cast<size_t>(h & this->table_mask);
+        }
+
+        RSR_INLINE bool increment_at(size_t i, int j)
+        {
+            const int offset = j << 2;
+            const uint64_t mask = 0xfULL << offset;
+            if ((this->table[i] & mask) != mask) {
+                this->table[i] += 1ULL << offset;
+                return true;
+            }
+            return false;
+        }
+
+        RSR_INLINE size_t sample_size() const
+        {
+            return 10 * this->capacity();
+        }
+
+        void reset()
+        {
+            size_t count = 0;
+            for (size_t i = 0; i < this->capacity(); i++) {
+                count += bit_count(this->table[i] & ONE_MASK);
+                this->table[i] = (this->table[i] >> 1) & RESET_MASK;
+            }
+            this->additions = (this->additions >> 1) - (count >> 2);
+        }
+
+    public:
+        FrequencySketch()
+            : table(),
+              table_mask(0),
+              additions(0)
+        {
+        }
+
+        RSR_INLINE bool enabled() const
+        {
+            return static_cast<bool>(this->table);
+        }
+
+        /** The number of entries we can track. */
+        RSR_INLINE size_t capacity() const
+        {
+            return this->enabled() ? this->table_mask + 1 : 0;
+        }
+
+        /**
+         * Make sure we can track at least *maximum* entries.
+         *
+         * Growing keeps the existing counts. A key's counters are
+         * found by masking its hashes, and the new mask only adds
+         * high bits, so each word of the bigger table starts as a
+         * copy of the word at the same index modulo the old size.
+         * Every key thus reads the same frequency as before; the
+         * copies diverge (and collide less) as accesses continue.
+         */
+        void ensure_capacity(size_t maximum)
+        {
+            if (maximum < 64) {
+                maximum = 64;
+            }
+            const size_t old_length = this->capacity();
+            if (maximum <= old_length) {
+                return;
+            }
+            size_t length = 64;
+            while (length < maximum) {
+                length <<= 1;
+            }
+            uint64_t* grown = new uint64_t[length]();
+            if (old_length) {
+                for (size_t i = 0; i < length; i++) {
+                    grown[i] = this->table[i & this->table_mask];
+                }
+            }
+            this->table.reset(grown);
+            this->table_mask = length - 1;
+        }
+
+        /** Return the estimated frequency of *key*, from 0 to 15. */
+        int frequency(OID_t key) const
+        {
+            if (unlikely(!this->enabled())) {
+                return 0;
+            }
+            const uint64_t hash = spread(key);
+            const int start = static_cast<int>((hash & 3) << 2);
+            int frequency = 15;
+            for (int i = 0; i < 4; i++) {
+                const size_t index = this->index_of(hash, i);
+                const int count = static_cast<int>(
+                    (this->table[index] >> ((start + i) << 2)) & 0xfULL);
+                if (count < frequency) {
+                    frequency = count;
+                }
+            }
+            return frequency;
+        }
+
+        /**
+         * Record an access to *key*. Periodically, this halves all
+         * the counters.
+         */
+        void increment(OID_t key)
+        {
+            if (unlikely(!this->enabled())) {
+                return;
+            }
+            const uint64_t hash = spread(key);
+            const int start = static_cast<int>((hash & 3) << 2);
+            bool added = false;
+            for (int i = 0; i < 4; i++) {
+                added |= this->increment_at(this->index_of(hash, i), start + i);
+            }
+            if (added && ++this->additions >= this->sample_size()) {
+                this->reset();
+            }
+        }
+
+        /**
+         * Should the *candidate* be kept instead of the *victim*? The
+         * candidate must be strictly more popular (TinyLFU).
+         */
+        RSR_INLINE bool admit(OID_t candidate, OID_t victim) const
+        {
+            return this->frequency(candidate) > this->frequency(victim);
+        }
+    };
+
+    /**
+     * A table of the distinct states stored in the cache, so that
+     * entries with byte-identical states (empty containers, records
+     * with default values) can share one bytes object.
+     *
+     * States are found by their hash, which bytes objects compute
+     * once and remember. The table holds a reference to each state;
+     * states that nothing else refers to any more are pruned
+     * whenever the table has doubled in size since the last time.
+     *
+     * The bytes of a shared state are charged to the entry that
+     * first stored them; entries that share it afterwards are only
+     * charged for their overhead. If the first entry goes away
+     * while others still share its state, those bytes are no longer
+     * counted, so the cache weight is an underestimate to that extent.
+     *
+     * Under PyPy, states are copied into the entries, so they cannot
+     * be shared, and this is never enabled.
+     */
+    class StateTable {
+    private:
+        struct StateHash {
+            size_t operator()(PyObject* const& state) const
+            {
+                Py_hash_t h = PyObject_Hash(state);
+                if (unlikely(h == -1))
+                    throw std::runtime_error("Failed to hash state");
+                return static_cast<size_t>(h);
+            }
+        };
+
+        struct StateEq {
+            bool operator()(PyObject* const& lhs, PyObject* const& rhs) const
+            {
+                return _StateOperations<PyObject*, PyObject*>::eq(lhs, rhs);
+            }
+        };
+
+        typedef std::unordered_set<PyObject*, StateHash, StateEq> StateSet;
+
+        static const size_t MIN_PRUNE_AT = 1024;
+
+        struct Table {
+            StateSet states;
+            size_t prune_at;
+            Table() : states(), prune_at(MIN_PRUNE_AT) {}
+        };
+        // Kept small: this is embedded in the Cache, whose size
+        // counts towards its weight.
+        std::unique_ptr<Table> table;
+    public:
+        StateTable()
+            : table()
+        {
+        }
+
+        ~StateTable()
+        {
+            this->clear();
+        }
+
+        RSR_INLINE bool enabled() const
+        {
+            return static_cast<bool>(this->table);
+        }
+
+        void enable()
+        {
+#ifndef RS_COPY_STRING
+            if (!this->enabled()) {
+                this->table.reset(new Table());
+            }
+#endif
+        }
+
+        size_t size() const
+        {
+            return this->enabled() ? this->table->states.size() : 0;
+        }
+
+        /**
+         * Make *proposed* use the existing state equal to its own, if
+         * there is one, or remember its state for the next entry.
+         */
+        void share(ProposedCacheEntry& proposed)
+        {
+            if (!this->enabled()) {
+                return;
+            }
+            StateSet& states = this->table->states;
+            PyObject* state = proposed.borrow_pickle();
+            StateSet::iterator it = states.find(state);
+            if (it == states.end()) {
+                if (states.size() >= this->table->prune_at) {
+                    this->prune();
+                }
+                Py_INCREF(state);
+                states.insert(state);
+                return;
+            }
+            // If only we refer to it, nobody is paying for it.
+            PyObject* existing = *it;
+            proposed.share_pickle(existing, Py_REFCNT(existing) > 1);
+        }
+
+        /**
+         * Forget the states that only we refer to.
+         */
+        void prune()
+        {
+            StateSet& states = this->table->states;
+            for (StateSet::iterator it = states.begin(); it != states.end();) {
+                PyObject* state = *it;
+                if (Py_REFCNT(state) == 1) {
+                    it = states.erase(it);
+                    Py_DECREF(state);
+                }
+                else {
+                    ++it;
+                }
+            }
+            this->table->prune_at = std::max(MIN_PRUNE_AT, 2 * states.size());
+        }
+
+        void clear()
+        {
+            if (!this->enabled()) {
+                return;
+            }
+            StateSet& states = this->table->states;
+            for (StateSet::iterator it = states.begin(); it != states.end(); ++it) {
+                Py_DECREF(*it);
+            }
+            states.clear();
+        }
+    };
+
     class Generation {
         // When we are destructed, we unlink all items
         // from our list. This can prematurely be done with
@@ -1043,7 +1425,6 @@ namespace cache {
          */
         virtual void on_hit(ICacheEntry& entry);
 
-
         // Two rings are equal iff they are the same object.
         virtual bool operator==(const Generation& other) const;
 
@@ -1068,14 +1449,12 @@ namespace cache {
         virtual void on_hit(ICacheEntry& entry);
     };
 
-    class Probation;
-
     class Protected : public Generation {
     private:
-        Probation& _probation;
-        Protected(size_t limit, Probation& probation)
+        Cache& cache;
+        Protected(size_t limit, Cache& cache)
             : Generation(limit, GEN_PROTECTED),
-              _probation(probation)
+              cache(cache)
         {}
         friend class Cache;
     public:
@@ -1084,10 +1463,10 @@ namespace cache {
 
     class Probation : public Generation {
     private:
-        Protected& _protected;
-        Probation(size_t limit, Protected& next)
+        Cache& cache;
+        Probation(size_t limit, Cache& cache)
             : Generation(limit, GEN_PROBATION),
-              _protected(next)
+              cache(cache)
         {}
         friend class Cache;
     public:
@@ -1109,7 +1488,6 @@ namespace cache {
         // the object's base classes (in reverse order of their
         // appearance in the class definition)."
         OidEntryMap data;
-        OidList rejects;
 
         struct Disposer {
             void operator()(ICacheEntry* ptr)
@@ -1135,14 +1513,19 @@ namespace cache {
         static PythonAllocator<SVCacheEntry> allocator;
         static PythonAllocator<ICacheEntry> deallocator;
 
+        // If enabled, this decides which entries to keep when
+        // generations spill, instead of the entry frequencies.
+        FrequencySketch sketch;
+        // If enabled, entries with equal states share them.
+        StateTable states;
         Eden ring_eden;
         Protected ring_protected;
         Probation ring_probation;
 
         Cache(size_t eden_limit=0, size_t protected_limit=0, size_t probation_limit=0)
             : ring_eden(eden_limit, *this),
-              ring_protected(protected_limit, ring_probation),
-              ring_probation(probation_limit, ring_protected)
+              ring_protected(protected_limit, *this),
+              ring_probation(probation_limit, *this)
         {
         }
 
@@ -1203,14 +1586,14 @@ namespace cache {
          * It becomes the first entry in eden. If this causes the cache to be oversized,
          * entries are freed.
          */
-        void add_to_eden(const ProposedCacheEntry& proposed);
+        void add_to_eden(ProposedCacheEntry& proposed);
 
         /**
          * Update an existing entry, replacing its value contents
          * and making it most-recently-used. The key must already
          * be present. Possibly evicts items if the entry grew.
          */
-        void store_and_make_MRU(const ProposedCacheEntry& proposed);
+        void store_and_make_MRU(ProposedCacheEntry& proposed);
 
         /**
          * Remove an existing key.
@@ -1246,6 +1629,53 @@ namespace cache {
         SVCacheEntry* get(const OID_t key, const TID_t tid);
 
         void age_frequencies();
+
+        /**
+         * Evict entries until the weight is no more than max_weight(),
+         * taking them from probation first, then eden, then protected.
+         * Returns the number evicted.
+         */
+        size_t evict_to_fit();
+
+        /**
+         * Begin using a frequency sketch for admission decisions
+         * instead of the per-entry frequencies. Once enabled, the sketch
+         * ages itself and there is no need to call age_frequencies().
+         */
+        void enable_frequency_sketch()
+        {
+            this->sketch.ensure_capacity(this->data.size());
+        }
+
+        bool uses_frequency_sketch() const
+        {
+            return this->sketch.enabled();
+        }
+
+        int sketch_frequency(OID_t key) const
+        {
+            return this->sketch.frequency(key);
+        }
+
+        /**
+         * Begin sharing equal states between entries. This only
+         * applies to entries added from now on.
+         */
+        void enable_state_sharing()
+        {
+            this->states.enable();
+        }
+
+        bool shares_states() const
+        {
+            return this->states.enabled();
+        }
+
+        size_t distinct_state_count() const
+        {
+            return this->states.size();
+        }
+
         size_t size()
         {
             // The lists have constant time size(), the map
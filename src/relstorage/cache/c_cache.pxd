@@ -41,6 +41,7 @@ cdef extern from "c_cache.h" namespace "relstorage::cache":
         # Using -1 for None
         object as_object()
         size_t size()
+        const char* data()
         bint operator==(SVCacheEntry&)
 
 
@@ -99,6 +100,13 @@ cdef extern from "c_cache.h" namespace "relstorage::cache":
         bool contains(OID_t key)
         TID_t contains_oid_with_newer_tid(OID_t key, TID_t tid)
         void age_frequencies()
+        size_t evict_to_fit()
+        void enable_frequency_sketch() except +
+        bool uses_frequency_sketch()
+        int sketch_frequency(OID_t key)
+        void enable_state_sharing() except +
+        bool shares_states()
+        size_t distinct_state_count()
         ICacheEntry* get(OID_t key)
         SVCacheEntry* get(OID_t, TID_t)
         SVCacheEntry* peek(OID_t, TID_t)
@@ -149,6 +149,19 @@ cdef class SingleValue(CachedValue):
             self.entry.tid()
         ))
 
+    # The buffer protocol. This exposes the cached state
+    # without making a copy of it; the entry remains valid
+    # for as long as we (or any buffer made from us, which
+    # keeps a reference to us) are alive, even if it is removed from the
+    # cache in the meantime.
+    def __getbuffer__(self, Py_buffer* buf, int flags):
+        PyBuffer_FillInfo(buf, self,
+                          <void*>self.entry.data(), self.entry.size(),
+                          1, flags)
+
+    def __releasebuffer__(self, Py_buffer* buf):
+        pass
+
     @property
     def frozen(self):
         return self.entry.frozen()
@@ -314,6 +327,22 @@ cdef class PyCache:
     cpdef reset_stats(self):
         self.hits = self.sets = self.misses = 0
 
+    def resize(self, eden, protected, probation):
+        """
+        Change the limits of the generations. Shrinking a generation
+        does not immediately evict anything; entries move between
+        generations as they are accessed.
+        """
+        self.cache.resize(eden, protected, probation)
+
+    def evict_to_fit(self):
+        """
+        Evict entries until the weight is within the limit, starting
+        with the least recently used entries in probation, then eden,
+        and finally protected. Return the number of entries evicted.
+        """
+        return self.cache.evict_to_fit()
+
     @property
     def limit(self):
         return self.cache.max_weight()
@@ -537,6 +566,47 @@ cdef class PyCache:
     def age_frequencies(self):
         self.cache.age_frequencies()
 
+    def enable_frequency_sketch(self):
+        """
+        Make admission decisions using a count-min sketch of
+        key popularity (W-TinyLFU) instead of the per-entry
+        frequencies. The sketch ages itself, so
+        :meth:`age_frequencies` need not be called.
+        """
+        self.cache.enable_frequency_sketch()
+
+    @property
+    def uses_frequency_sketch(self):
+        return self.cache.uses_frequency_sketch()
+
+    def sketch_frequency(self, OID_t key):
+        """
+        Return the estimated popularity of *key* from the frequency
+        sketch, which may remember keys no longer in the cache.
+        """
+        return self.cache.sketch_frequency(key)
+
+    def enable_state_sharing(self):
+        """
+        Let entries added from now on share byte-identical states.
+        The bytes of a shared state count towards the weight of the
+        cache only once. This has no effect on PyPy, where states
+        are copied.
+        """
+        self.cache.enable_state_sharing()
+
+    @property
+    def shares_states(self):
+        return self.cache.shares_states()
+
+    @property
+    def distinct_state_count(self):
+        """
+        The number of distinct states known when sharing states.
+        This includes some that may no longer be in use.
+        """
+        return self.cache.distinct_state_count()
+
     def delitems(self, oids_tids):
         """
         For each OID/TID pair in the items, remove all cached values
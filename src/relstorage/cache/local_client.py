@@ -15,12 +15,16 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import atexit
 import bz2
+import heapq
 import time
 import zlib
 
 
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
+from contextlib import contextmanager
 
 from zope import interface
 
@@ -29,7 +33,9 @@ from relstorage._util import byte_display
 from relstorage._util import timer as _timer
 from relstorage._util import log_timed as _log_timed
 from relstorage._util import consume
+from relstorage._util import thread_spawn
 from relstorage._compat import OID_TID_MAP_TYPE as OidTMap
+from relstorage._compat import OID_SET_TYPE as OidSet
 from relstorage.interfaces import Int
 
 from relstorage.cache.interfaces import IStateCache
@@ -41,13 +47,35 @@ from relstorage.cache.interfaces import ILRUEntry
 
 from relstorage.cache.persistence import sqlite_connect
 from relstorage.cache.persistence import sqlite_files
+from relstorage.cache.persistence import segment_files
 from relstorage.cache.persistence import FAILURE_TO_OPEN_DB_EXCEPTIONS
 from relstorage.cache.local_database import Database
+from relstorage.cache._segment_file import CorruptSegmentFileError
 
 from relstorage.cache import cache # pylint:disable=no-name-in-module
+from relstorage.cache._sharded_cache import ShardedCache
+from relstorage.cache._memory_pressure import MemoryPressureController
+from relstorage.cache._mrc import MissRatioCurve
+from relstorage.cache._zstd_codec import ZstdCodec
 
 logger = __import__('logging').getLogger(__name__)
 
+# (thread, timeout) for each save running in the background
+# (``cache_local_background_save``). These are daemon threads, so
+# they don't keep the process alive on their own; instead, at exit,
+# we wait for each as long as it's configured to allow. Abandoning a
+# save part way is safe, because sqlite rolls back an uncommitted
+# transaction the next time the file is opened.
+_pending_saves = []
+
+@atexit.register
+def _wait_for_pending_saves():
+    for thread, timeout in _pending_saves:
+        thread.wait(timeout)
+        if not thread.ready():
+            logger.warning("Abandoning the save of the persistent cache in %s", thread)
+    del _pending_saves[:]
+
 # pylint:disable=too-many-lines
 
 class ICachedValue(ILRUEntry):
@@ -178,6 +206,22 @@ class LocalClient(object):
         b'.b': bz2.decompress
     }
 
+    # When adapting the generation sizes (``cache_local_adaptive_generations``),
+    # the limits on eden's share of the cache.
+    _gen_eden_min_pct = 0.01
+    _gen_eden_max_pct = 0.8
+    # The initial fraction of the cache that eden grows or shrinks by. This decays
+    # as we converge, and is restarted when the hit ratio changes by more than
+    # the threshold. These are the values Caffeine uses.
+    _climb_step_pct = 0.0625
+    _climb_step_decay = 0.98
+    _climb_restart_threshold = 0.05
+    # What multiplier of the number of items in the cache do we apply
+    # to determine how many operations are in a sample? Samples are never
+    # smaller than ``_climb_min_sample``.
+    _climb_factor = 10
+    _climb_min_sample = 1000
+
     # What multiplier of the number of items in the cache do we apply
     # to determine when to age the frequencies?
     _age_factor = 10
@@ -191,6 +235,49 @@ class LocalClient(object):
     # Things copied from self._cache
     _peek = None
 
+    # A ZstdCodec, if the zstandard package is available.
+    _zstd = None
+
+    # States this size or smaller aren't compressed. Small pickles
+    # compress well only with a dictionary.
+    _min_compressed_size = 100
+
+    # Hill-climbing state. If adapting, the step is signed (negative
+    # shrinks eden), and we climb after ``_next_climb_at`` hits and misses.
+    _adaptive_generations = False
+    _climb_step = 0
+    _climb_hit_ratio = 0.0
+    _climb_hits = 0
+    _climb_misses = 0
+    _next_climb_at = float('inf')
+
+    # A MemoryPressureController, if we adjust our limit to the
+    # memory available (``cache_local_memory_limit_mb``). We consult it
+    # every ``_memory_check_interval`` sets.
+    _memory = None
+    _memory_check_interval = 1000
+    _next_memory_check_at = float('inf')
+
+    # A MissRatioCurve, if we're estimating the hit ratio for
+    # other sizes (``cache_local_mrc_sample_rate``), and the multiples of
+    # ``cache_local_mb`` we estimate it for.
+    _mrc = None
+    _mrc_size_factors = (0.25, 0.5, 1, 2, 4, 8)
+
+    # The thread writing the persistent cache, if we're saving in the
+    # background and haven't yet seen it finish.
+    _save_thread = None
+
+    # The OIDs stored since the last incremental checkpoint of the
+    # persistent cache, if we're making them
+    # (``cache_local_checkpoint_interval``), and when to make the next.
+    _checkpoint_oids = None
+    _next_checkpoint_at = 0
+
+    # Whether the persistent cache uses the memory mapped segment
+    # files instead of sqlite (``cache_local_dir_format``).
+    _uses_segment_files = False
+
     def __init__(self, options,
                  prefix=None):
         self.options = options
@@ -212,16 +299,56 @@ class LocalClient(object):
         self.__initial_weight = self._cache.weight
 
         compression_module = options.cache_local_compression
-        try:
-            compression_markers = self._compression_markers[compression_module]
-        except KeyError as exc:
-            raise ValueError("Unknown compression module") from exc
+        if ZstdCodec.available:
+            # Even if we don't compress with it, we need to be able to
+            # decompress data from persistent caches.
+            self._zstd = ZstdCodec(
+                compression_module == 'zstd' and options.cache_local_compression_dictionary
+            )
+            self._decompression_functions = dict(self._decompression_functions)
+            self._decompression_functions[ZstdCodec.marker] = self._zstd.decompress
+            self._decompression_functions[
+                ZstdCodec.dictionary_marker] = self._zstd.decompress_with_dictionary
+
+        if compression_module == 'zstd':
+            if self._zstd is None:
+                raise ValueError("zstd compression requires the 'zstandard' package")
+            # The codec chooses the marker.
+            compression_markers = (b'', self._zstd.compress)
+            if options.cache_local_compression_dictionary:
+                self._min_compressed_size = 20
+        else:
+            try:
+                compression_markers = self._compression_markers[compression_module]
+            except KeyError as exc:
+                raise ValueError("Unknown compression module") from exc
 
         self.__compression_marker = compression_markers[0]
         self.__compress = compression_markers[1]
         if self.__compress is None:
             self._compress = None
 
+        if options.cache_local_dir_format not in ('sqlite', 'segment'):
+            raise ValueError("Unknown cache_local_dir_format", options.cache_local_dir_format)
+        self._uses_segment_files = options.cache_local_dir_format == 'segment'
+
+        if options.cache_local_adaptive_generations:
+            self._adaptive_generations = True
+            self._climb_step = -self._climb_step_pct
+            self._next_climb_at = self._climb_min_sample
+        self._memory = MemoryPressureController.from_options(options, self.limit)
+        if self._memory is not None:
+            self._next_memory_check_at = self._memory_check_interval
+        if options.cache_local_dir and options.cache_local_checkpoint_interval:
+            self._checkpoint_oids = OidSet()
+            self._next_checkpoint_at = time.time() + options.cache_local_checkpoint_interval
+        if options.cache_local_mrc_sample_rate and self.limit:
+            self._mrc = MissRatioCurve(
+                options.cache_local_mrc_sample_rate,
+                [int(1000000 * options.cache_local_mb * factor)
+                 for factor in self._mrc_size_factors]
+            )
+
     @property
     def size(self):
         return self._cache.weight
@@ -244,13 +371,20 @@ class LocalClient(object):
             return data
         return self._decompression_functions[pfx](data[2:])
 
+    def _can_decompress(self, state):
+        # Can we use *state* read from a persistent cache?
+        if self._zstd is not None:
+            return self._zstd.can_decompress(state)
+        return state[:2] not in (ZstdCodec.marker, ZstdCodec.dictionary_marker)
+
     def _compress(self, data): # pylint:disable=method-hidden
         # We override this if we're disabling compression
         # altogether.
         # Use the same basic rule as zc.zlibstorage, but bump the object size up from 20;
         # many smaller object (under 100 bytes) like you get with small btrees,
         # tend not to compress well, so don't bother.
-        if data and (len(data) > 100) and data[:2] not in self._decompression_functions:
+        if (data and len(data) > self._min_compressed_size
+                and data[:2] not in self._decompression_functions):
             compressed = self.__compression_marker + self.__compress(data)
             if len(compressed) < len(data):
                 return compressed
@@ -262,19 +396,120 @@ class LocalClient(object):
         if not options.cache_local_dir or self.size <= self.__initial_weight:
             return None
 
+        # Only one at a time (this includes checkpoints).
+        self.wait_for_save()
+        if options.cache_local_background_save:
+            # Take the snapshot now, while we're not changing; only
+            # the writing is in the background.
+            self._save_in_background(list(self._newest_items()),
+                                     checkpoints, object_index, sqlite_args)
+            return 1
+
+        return self._write_snapshot(None, checkpoints, object_index, sqlite_args)
+
+    def checkpoint(self, checkpoints):
+        """
+        If it's time to make an incremental checkpoint, begin writing
+        the entries stored since the last one to the persistent cache
+        in the background.
+
+        Return whether we did.
+        """
+        oids = self._checkpoint_oids
+        if oids is None or time.time() < self._next_checkpoint_at:
+            return False
+        if not self.wait_for_save(0):
+            # The last one is still going; try again next time.
+            return False
+        self._next_checkpoint_at = time.time() + self.options.cache_local_checkpoint_interval
+        # OIDs stored by other threads while we switch may be missed,
+        # until they're stored again or the cache is saved.
+        self._checkpoint_oids = OidSet()
+        items = self._checkpoint_items(oids)
+        if not items:
+            return False
+        self._save_in_background(items, checkpoints, None, {})
+        return True
+
+    def _checkpoint_items(self, oids):
+        # This runs on the thread that polled, so only the states
+        # that fit in the budget are copied.
+        peek = self._cache.peek
+        values = []
+        for oid in oids:
+            lru_entry = peek(oid)
+            if lru_entry is not None:
+                values.append((oid, lru_entry.newest_value, lru_entry.frequency))
+
+        budget = int(1000000 * self.options.cache_local_checkpoint_max_mb)
+        if budget:
+            # The most popular first; whatever doesn't fit waits for
+            # the next checkpoint.
+            values.sort(key=lambda value: value[2], reverse=True)
+
+        items = []
+        total = 0
+        for i, (oid, newest_value, frequency) in enumerate(values):
+            if budget:
+                # Measure the cached state without copying it.
+                total += len(memoryview(newest_value))
+                if total > budget:
+                    self._checkpoint_oids.update([leftover[0] for leftover in values[i:]])
+                    break
+            items.append((oid, newest_value.tid, newest_value.frozen,
+                          bytes(newest_value.state),
+                          frequency))
+        return items
+
+    def _save_in_background(self, items, checkpoints, object_index, sqlite_args):
+        self._save_thread = thread_spawn(
+            self._write_in_background,
+            (items, checkpoints, object_index, sqlite_args),
+            daemon=True
+        )
+        _pending_saves[:] = [p for p in _pending_saves if not p[0].ready()]
+        _pending_saves.append((self._save_thread, self.options.cache_local_save_timeout))
+
+    def _write_snapshot(self, items, checkpoints, object_index, sqlite_args):
+        if self._uses_segment_files:
+            self.write_to_segment_files(checkpoints, items)
+            return 1
+
         try:
-            conn = sqlite_connect(options, self.prefix,
+            conn = sqlite_connect(self.options, self.prefix,
                                   **sqlite_args)
         except FAILURE_TO_OPEN_DB_EXCEPTIONS:
             logger.exception("Failed to open sqlite to write")
             return 0
 
         with closing(conn):
-            self.write_to_sqlite(conn, checkpoints, object_index)
+            self.write_to_sqlite(conn, checkpoints, object_index, items)
         # Testing: Return a signal when we tried to write
         # something.
         return 1
 
+    def _write_in_background(self, *args):
+        try:
+            self._write_snapshot(*args)
+        except Exception: # pylint:disable=broad-except
+            logger.exception("Failed to save the persistent cache")
+
+    def wait_for_save(self, timeout=None):
+        """
+        Wait for a save happening in the background to finish, or
+        for *timeout* seconds.
+
+        Return whether there is no save in progress.
+        """
+        thread = self._save_thread
+        if thread is None:
+            return True
+        thread.wait(timeout)
+        if thread.ready():
+            self._save_thread = None
+            return True
+        return False
+
     def restore(self):
         """
         Load the data from the persistent database.
@@ -282,22 +517,66 @@ class LocalClient(object):
         Returns the checkpoint data last saved, which may be None if
         there was no data.
         """
+        with self._persistent_cache() as source:
+            if source is None:
+                return None
+            if self._uses_segment_files:
+                return self.read_from_segment_files(source)
+            return self.read_from_sqlite(source)
+
+    def read_persistent_items(self):
+        """
+        Read the persistent database without changing the cache.
+
+        Returns ``(checkpoints, items)``, where *items* is a list of
+        ``(oid, (state, actual_tid, frozen, frequency))`` ordered from
+        least to most recently used.
+        """
+        with self._persistent_cache() as source:
+            if source is None:
+                return None, []
+            if not self._uses_segment_files:
+                source = Database.from_connection(source)
+            return source.checkpoints, self._restorable_items(source)
+
+    @contextmanager
+    def _persistent_cache(self):
+        # Produces the open sqlite connection or SegmentReader,
+        # or None if there's nothing to read.
         options = self.options
         if not options.cache_local_dir:
-            return None
+            yield None
+            return
+
+        if self._uses_segment_files:
+            try:
+                reader = segment_files(options, self.prefix).open_reader()
+            except (CorruptSegmentFileError, OSError, ValueError):
+                logger.exception("Failed to read the persistent cache")
+                reader = None
+            if reader is None:
+                yield None
+                return
+            with reader:
+                yield reader
+            return
 
         try:
             conn = sqlite_connect(options, self.prefix)
         except FAILURE_TO_OPEN_DB_EXCEPTIONS:
             logger.exception("Failed to read data from sqlite")
-            return None
+            yield None
+            return
         with closing(conn):
-            return self.read_from_sqlite(conn)
+            yield conn
 
     @_log_timed
-    def remove_invalid_persistent_oids(self, bad_oids):
+    def remove_invalid_persistent_oids(self, bad_oids, invalidate=True):
         """
         Remove data from the persistent cache for the given oids.
+
+        Unless *invalidate* is false, they're also removed from
+        this cache.
         """
         options = self.options
         if not options.cache_local_dir:
@@ -305,8 +584,14 @@ class LocalClient(object):
 
         count_removed = 0
         conn = '(no oids to remove)'
-        if bad_oids:
+        if bad_oids and invalidate:
             self.invalidate_all(bad_oids)
+        if bad_oids and self._uses_segment_files:
+            files = conn = segment_files(options, self.prefix)
+            with files.writing() as writer:
+                count_removed = writer.remove(bad_oids)
+                writer.commit()
+        elif bad_oids:
             conn = sqlite_connect(options, self.prefix)
             with closing(conn):
                 db = Database.from_connection(conn)
@@ -315,7 +600,12 @@ class LocalClient(object):
         logger.debug("Removed %d invalid OIDs from %s", count_removed, conn)
 
     def zap_all(self):
-        _, destroy = sqlite_files(self.options, self.prefix)
+        # Don't let a save in progress recreate what we destroy.
+        self.wait_for_save()
+        if self._uses_segment_files:
+            destroy = segment_files(self.options, self.prefix).destroy
+        else:
+            _, destroy = sqlite_files(self.options, self.prefix)
         destroy()
         # zapping happens frequently during test runs,
         # and during zodbconvert when the process will exist
@@ -330,11 +620,20 @@ class LocalClient(object):
             # (those are expensive to create and tests call
             # this a LOT)
             byte_limit = self.limit
-            self._cache = cache.PyCache(
+            generation_limits = (
                 byte_limit * self._gen_eden_pct,
                 byte_limit * self._gen_protected_pct,
                 byte_limit * self._gen_probation_pct
             )
+            shard_count = self.options.cache_local_shards
+            if shard_count and shard_count > 1:
+                self._cache = ShardedCache(shard_count, *generation_limits)
+            else:
+                self._cache = cache.PyCache(*generation_limits)
+            if self.options.cache_local_frequency_sketch:
+                self._cache.enable_frequency_sketch()
+            if self.options.cache_local_dedup:
+                self._cache.enable_state_sharing()
         self._peek = self._cache.peek
         self.reset_stats()
 
@@ -342,17 +641,34 @@ class LocalClient(object):
         self._cache.reset_stats()
         self._aged_at = 0
         self._next_age_at = 1000
+        self._climb_hits = self._climb_misses = 0
+        if self._adaptive_generations:
+            self._next_climb_at = self._climb_min_sample
+        if self._memory is not None:
+            self._next_memory_check_at = self._memory_check_interval
 
     def stats(self):
         total = self._cache.hits + self._cache.misses
-        return {
+        stats = {
             'hits': self._cache.hits,
             'misses': self._cache.misses,
             'sets': self._cache.sets,
             'ratio': self._cache.hits / total if total else 0,
             'len': len(self),
             'bytes': self.size,
+            'limit': self.limit,
+            'eden_pct': self._gen_eden_pct,
+            'protected_pct': self._gen_protected_pct,
+            'probation_pct': self._gen_probation_pct,
         }
+        if self._mrc is not None:
+            # Keyed by cache_local_mb.
+            stats['estimated_hit_ratios'] = {
+                size / 1000000: ratio
+                for size, ratio in self._mrc.hit_ratios()
+            }
+            stats['mrc_sample_rate'] = self._mrc.sample_rate
+        return stats
 
     def __contains__(self, oid_tid):
         oid, tid = oid_tid
@@ -361,29 +677,54 @@ class LocalClient(object):
     def contains_oid_with_newer_tid(self, oid, tid):
         return self._cache.contains_oid_with_newer_tid(oid, tid)
 
-    def get(self, oid_tid, peek=False):
+    def _get_value(self, oid_tid, peek):
         oid, tid = oid_tid
         assert tid is None or tid >= 0
-        decompress = self._decompress
-        value = None
 
         if peek:
-            value = self._cache.peek_item_with_tid(oid, tid)
-        else:
-            value = self._cache.get_item_with_tid(oid, tid)
+            return self._cache.peek_item_with_tid(oid, tid)
+
+        value = self._cache.get_item_with_tid(oid, tid)
+        if self._mrc is not None:
+            self._mrc.record(oid, value.weight if value is not None else None)
+        return value
+
+    def get(self, oid_tid, peek=False):
+        value = self._get_value(oid_tid, peek)
 
         # Finally, decompress if needed.
         # Recall that for deleted objects, `state` can be None.
-        # TODO: This is making a copy of the string from C++ even if we
-        # don't need to decompress.
         if value is None:
             return None
 
         state, tid = value
-        return ((decompress(state) if state else state), tid)
+        return ((self._decompress(state) if state else state), tid)
 
     __getitem__ = get
 
+    def get_buffer(self, oid_tid, peek=False):
+        """
+        Like :meth:`get`, but the state is a read-only
+        :class:`memoryview` of the cached data, unless it had to be
+        decompressed. The view keeps the data alive even if the
+        object leaves the cache.
+
+        This is only for callers that can use a buffer directly.
+        Anything that must have bytes (such as ``IStorage.load``)
+        should use :meth:`get`; on CPython that doesn't copy either,
+        and making the view costs more than it saves.
+        """
+        value = self._get_value(oid_tid, peek)
+        if value is None:
+            return None
+
+        state = memoryview(value)
+        if state:
+            decompress = self._decompression_functions.get(state[:2].tobytes())
+            if decompress is not None:
+                state = decompress(state[2:])
+        return state, value.tid
+
     def _age(self):
         # Age only when we're full and would thus need to evict; this
         # makes initial population faster. It's cheaper to calculate this
@@ -399,6 +740,12 @@ class LocalClient(object):
         #
         # We don't take a lock to do this; it's fine if two threads
         # attempt it at the same time.
+        #
+        # If we're using a frequency sketch, none of this is needed;
+        # it ages itself incrementally.
+        if self._cache.uses_frequency_sketch:
+            self._next_age_at = float('inf')
+            return None
         age_period = self._age_factor * len(self._cache)
         operations = self._cache.hits + self._cache.sets
         if operations - self._aged_at < age_period:
@@ -419,6 +766,80 @@ class LocalClient(object):
 
         return self._aged_at
 
+    def _climb(self):
+        # Adapt the size of eden relative to the main (protected and
+        # probation) generations by hill climbing, as Caffeine does:
+        # after each sample of operations, keep moving in the same
+        # direction if the hit ratio improved, otherwise reverse.
+        #
+        # Like aging, this is done without a lock.
+        cache = self._cache
+        sample_hits = cache.hits - self._climb_hits
+        sample_misses = cache.misses - self._climb_misses
+        sample_size = sample_hits + sample_misses
+        needed = max(self._climb_min_sample, self._climb_factor * len(cache))
+        if sample_size < needed:
+            self._next_climb_at = self._climb_hits + self._climb_misses + needed
+            return None
+
+        hit_ratio = sample_hits / sample_size
+        change = hit_ratio - self._climb_hit_ratio
+        amount = self._climb_step if change >= 0 else -self._climb_step
+        if abs(change) >= self._climb_restart_threshold:
+            step = self._climb_step_pct if amount >= 0 else -self._climb_step_pct
+        else:
+            step = self._climb_step_decay * amount
+
+        self._climb_hit_ratio = hit_ratio
+        self._climb_step = step
+        self._climb_hits = cache.hits
+        self._climb_misses = cache.misses
+        self._next_climb_at = cache.hits + cache.misses + needed
+
+        eden_pct = min(self._gen_eden_max_pct,
+                       max(self._gen_eden_min_pct, self._gen_eden_pct + amount))
+        if eden_pct != self._gen_eden_pct:
+            # The main generations keep their proportions.
+            main_pct = self._gen_protected_pct + self._gen_probation_pct
+            protected_share = self._gen_protected_pct / main_pct
+            main_pct += self._gen_eden_pct - eden_pct
+            self._gen_eden_pct = eden_pct
+            self._gen_protected_pct = main_pct * protected_share
+            self._gen_probation_pct = main_pct - self._gen_protected_pct
+            byte_limit = self.limit
+            cache.resize(
+                byte_limit * self._gen_eden_pct,
+                byte_limit * self._gen_protected_pct,
+                byte_limit * self._gen_probation_pct
+            )
+            logger.debug(
+                "Adapted cache generations for hit ratio %.3f: eden=%.3f protected=%.3f "
+                "probation=%.3f",
+                hit_ratio, self._gen_eden_pct, self._gen_protected_pct, self._gen_probation_pct
+            )
+        return eden_pct
+
+    def _check_memory(self):
+        # Shrink or grow the cache to fit the memory available. Like
+        # aging and climbing, this is done without a lock.
+        self._next_memory_check_at = self._cache.sets + self._memory_check_interval
+        byte_limit = self._memory.adjusted_limit(self.limit, self.size)
+        if byte_limit != self.limit:
+            self._set_limit(byte_limit)
+        return byte_limit
+
+    def _set_limit(self, byte_limit):
+        shrinking = byte_limit < self.limit
+        self.limit = byte_limit
+        self._cache.resize(
+            byte_limit * self._gen_eden_pct,
+            byte_limit * self._gen_protected_pct,
+            byte_limit * self._gen_probation_pct
+        )
+        evicted = self._cache.evict_to_fit() if shrinking else 0
+        logger.debug("Changed cache limit to %s; evicted %d entries",
+                     byte_display(byte_limit), evicted)
+
     def __setitem__(self, oid_tid, state_bytes_tid):
         if not self.limit:
             # don't bother
@@ -435,10 +856,16 @@ class LocalClient(object):
     def set_all_for_tid(self, tid_int, state_oid_iter):
         if self.limit:
             self._cache.set_all_for_tid(tid_int, state_oid_iter, self._compress, self._value_limit)
+            if self._checkpoint_oids is not None:
+                self._checkpoint_oids.update([oid for _, oid, _ in state_oid_iter])
             # Inline some of the logic about whether to age or not; avoiding the
             # call helps speed
             if self._cache.hits + self._cache.sets > self._next_age_at:
                 self._age()
+            if self._cache.hits + self._cache.misses > self._next_climb_at:
+                self._climb()
+            if self._cache.sets > self._next_memory_check_at:
+                self._check_memory()
 
     def __delitem__(self, oid_tid):
         self.delitems({oid_tid[0]: oid_tid[1]})
@@ -456,6 +883,18 @@ class LocalClient(object):
     def freeze(self, oids_tids):
         self._cache.freeze(oids_tids)
 
+    def frozen_oid_tids(self):
+        """
+        Return a map from each OID whose newest cached state is
+        frozen to the TID of that state.
+        """
+        result = OidTMap()
+        for oid, lru_entry in self._cache.iteritems():
+            newest_value = lru_entry.newest_value
+            if newest_value.frozen:
+                result[oid] = newest_value.tid
+        return result
+
     def close(self):
         pass
 
@@ -516,48 +955,196 @@ class LocalClient(object):
         db = Database.from_connection(connection)
         checkpoints = db.checkpoints
 
-        @_log_timed
-        def fetch_and_filter_rows():
-            # Do this here so that we don't have the result
-            # in a local variable and it can be collected
-            # before we measure the memory delta.
-            #
-            # In large benchmarks, this function accounts for 57%
-            # of the total time to load data. 26% of the total is
-            # fetching rows from sqlite, and 18% of the total is allocating
-            # storage for the blob state.
-            #
-            # We make one call into sqlite and let it handle the iterating.
-            # Items are (oid, key_tid, state, actual_tid).
-            # key_tid may equal the actual tid, or be -1 when the row was previously
-            # frozen;
-            # That doesn't matter to us, we always freeze all rows.
-            size = 0
-            limit = self.limit
-            items = []
-            rows = db.fetch_rows_by_priority()
-            for oid, frozen, state, actual_tid, frequency in rows:
-                size += len(state)
-                if size > limit:
-                    break
-                items.append((oid, (state, actual_tid, frozen, frequency)))
-            consume(rows)
-            # Rows came to us MRU to LRU, but we need to feed them the other way.
-            items.reverse()
-            return items
+        thread_count = self.options.cache_local_restore_threads or 1
+        # Other connections can't see a memory or temporary database.
+        if thread_count > 1 and getattr(connection, 'rs_db_filename', '') not in ('', ':memory:'):
+            restorable_items = self._restorable_items_in_parallel(db, thread_count)
+        else:
+            restorable_items = self._restorable_items(db)
 
         # In the large benchmark, this is 25% of the total time.
         # 18% of the total time is preallocating the entry nodes.
-        self._bulk_update(fetch_and_filter_rows(),
+        self._bulk_update(restorable_items,
                           source=connection,
                           mem_usage_before=mem_before)
         return checkpoints
 
-    def _items_to_write(self, stored_oid_tid):
-        # pylint:disable=too-many-locals
-        all_entries_len = len(self._cache)
+    @_log_timed
+    def read_from_segment_files(self, reader):
+        """
+        Load the data from the
+        :class:`relstorage.cache._segment_file.SegmentReader` *reader*.
+
+        Returns the checkpoints it has.
+        """
+        import gc
+        gc.collect() # Free memory, we're about to make big allocations.
+        mem_before = get_memory_usage()
+
+        # Each state is copied straight out of the mapped data
+        # file into the bytes object the cache keeps.
+        self._bulk_update(self._restorable_items(reader),
+                          source=reader.data_path,
+                          mem_usage_before=mem_before)
+        return reader.checkpoints
+
+    def _load_compression_dictionaries(self, serialized_dictionaries):
+        if self._zstd is not None:
+            dictionaries = [self._zstd.add_dictionary(d) for d in serialized_dictionaries]
+            if dictionaries and self._zstd.wants_dictionary:
+                # Share the most recent one with whoever saved it.
+                self._zstd.use_dictionary(dictionaries[0])
 
+    @_log_timed
+    def _restorable_items(self, source):
+        """
+        Return the items in *source* (a ``Database`` or
+        ``SegmentReader``) that we can use and that fit, as
+        :meth:`_bulk_update` wants them.
+        """
+        # This is a separate function so that we don't have the
+        # result in a local variable and it can be collected
+        # before we measure the memory delta.
+        #
+        # In large benchmarks, this function accounts for 57%
+        # of the total time to load data. 26% of the total is
+        # fetching rows from sqlite, and 18% of the total is allocating
+        # storage for the blob state.
+        #
+        # We make one call into sqlite and let it handle the iterating.
+        # Items are (oid, key_tid, state, actual_tid).
+        # key_tid may equal the actual tid, or be -1 when the row was previously
+        # frozen;
+        # That doesn't matter to us, we always freeze all rows.
+        self._load_compression_dictionaries(source.compression_dictionaries)
+        items = self._take_restorable_rows(source.fetch_rows_by_priority())
+        # Rows came to us MRU to LRU, but we need to feed them the other way.
+        items.reverse()
+        return items
+
+    def _take_restorable_rows(self, rows):
+        # Consumes the *rows* from ``fetch_rows_by_priority`` and
+        # returns the items that we can use and that fit, MRU first.
+        can_decompress = self._can_decompress
+        size = 0
+        limit = self.limit
+        items = []
+        for oid, frozen, state, actual_tid, frequency in rows:
+            if not can_decompress(state):
+                continue
+            size += len(state)
+            if size > limit:
+                break
+            items.append((oid, (state, actual_tid, frozen, frequency)))
+        consume(rows)
+        return items
+
+    @_log_timed
+    def _restorable_items_in_parallel(self, db, thread_count):
+        """
+        Like :meth:`_restorable_items`, but divide the rows of *db*
+        into ranges of OIDs that are each read by a separate thread
+        using its own connection.
+        """
+        self._load_compression_dictionaries(db.compression_dictionaries)
+        boundaries = db.oid_boundaries(thread_count)
+        ranges = list(zip([None] + boundaries, boundaries + [None]))
+
+        def read_range(oid_range):
+            # The sqlite module releases the GIL while sqlite finds
+            # and sorts the rows.
+            conn = sqlite_connect(self.options, self.prefix)
+            with closing(conn):
+                return self._take_restorable_rows(
+                    Database.from_connection(conn).fetch_rows_by_priority(*oid_range))
+
+        # Each range is in priority order, and anything a range
+        # left out because it didn't fit wouldn't fit overall either.
+        with ThreadPoolExecutor(len(ranges)) as pool:
+            results = list(pool.map(read_range, ranges))
+        merged = heapq.merge(*results,
+                             key=lambda item: (item[1][3], item[1][1]),
+                             reverse=True)
+        del results
+        size = 0
+        limit = self.limit
+        items = []
+        for item in merged:
+            size += len(item[1][0])
+            if size > limit:
+                break
+            items.append(item)
+        items.reverse()
+        return items
+
+    def admit_restored(self, items):
+        """
+        Add *items*, read by :meth:`read_persistent_items`, to a
+        cache that may already be in use.
+
+        Objects the cache already has are skipped, and we only add
+        what fits in the space that's free; nothing is evicted to make
+        room. The entries are frozen.
+
+        Returns how many were added.
+        """
+        data = self._cache
+        room = self.limit - data.weight
+        admitted = []
+        # The most valuable first, so they get the room.
+        for item in reversed(items):
+            oid, (state, _, _, _) = item
+            if oid in data:
+                continue
+            room -= len(state)
+            if room < 0:
+                break
+            admitted.append(item)
+        admitted.reverse()
+        for oid, (state, actual_tid, _, _) in admitted:
+            data[oid] = (state, actual_tid)
+        data.freeze(OidTMap([(oid, value[1]) for oid, value in admitted]))
+        return len(admitted)
+
+    @_log_timed
+    def write_to_segment_files(self, checkpoints, items=None):
+        """
+        Append what's new in the cache (or *items*) to the segment
+        files, and update their index.
+
+        Returns how many items were written.
+        """
+        files = segment_files(self.options, self.prefix)
+        dictionary = None
+        if self._zstd is not None and self._zstd.dictionary is not None:
+            dictionary = self._zstd.dictionary.as_bytes()
+        with files.writing() as writer:
+            count_written = writer.append(self._items_to_write(writer.oid_to_tid, items))
+            writer.commit(checkpoints, dictionary, self.limit)
+        logger.info("Wrote %d items to %s", count_written, files.index_path)
+        return count_written
+
+    def _newest_items(self):
         # Only write the newest entry for each OID.
+        for oid, lru_entry in self._cache.iteritems():
+            newest_value = lru_entry.newest_value
+            # We must have something at least this fresh
+            # to consider writing it out
+            if newest_value is None:
+                raise AssertionError("Value should not be none", oid, lru_entry)
+            yield (oid, newest_value.tid, newest_value.frozen,
+                   bytes(newest_value.state),
+                   lru_entry.frequency)
+
+    def _items_to_write(self, stored_oid_tid, items=None):
+        # pylint:disable=too-many-locals
+        # *items* is a snapshot from _newest_items() if we're
+        # saving in the background.
+        if items is None:
+            all_entries_len = len(self._cache)
+            items = self._newest_items()
+        else:
+            all_entries_len = len(items)
 
 
         # Newly added items have a frequency of 1. They *may* be
@@ -600,13 +1187,9 @@ class LocalClient(object):
         # this function shows as about 3% of the total time to save
         # in a very large database.
         with _timer() as t:
-            for oid, lru_entry in self._cache.iteritems():
-                newest_value = lru_entry.newest_value
-                # We must have something at least this fresh
-                # to consider writing it out
-                if newest_value is None:
-                    raise AssertionError("Value should not be none", oid, lru_entry)
-                actual_tid = newest_value.tid
+            for item in items:
+                oid = item[0]
+                actual_tid = item[1]
 
                 # If we have something >= min_allowed, matching
                 # what's in the database, or even older (somehow),
@@ -616,9 +1199,7 @@ class LocalClient(object):
                     matching_tid_count += 1
                     continue
 
-                yield (oid, actual_tid, newest_value.frozen,
-                       bytes(newest_value.state),
-                       lru_entry.frequency)
+                yield item
 
                 # We're able to satisfy this, so we don't need to consider
                 # it in our min_allowed set anymore.
@@ -635,7 +1216,7 @@ class LocalClient(object):
             t.duration)
 
     @_log_timed
-    def write_to_sqlite(self, connection, checkpoints, object_index=None):
+    def write_to_sqlite(self, connection, checkpoints, object_index=None, items=None):
         # pylint:disable=too-many-locals
         mem_before = get_memory_usage()
         object_index = object_index or OidTMap()
@@ -657,7 +1238,7 @@ class LocalClient(object):
             cur.execute('BEGIN')
             stored_oid_tid = db.oid_to_tid
             fetch_current = time.time()
-            count_written, _ = db.store_temp(self._items_to_write(stored_oid_tid))
+            count_written, _ = db.store_temp(self._items_to_write(stored_oid_tid, items))
             cur.execute("COMMIT")
 
 
@@ -716,6 +1297,9 @@ class LocalClient(object):
             rows_inserted = db.move_from_temp()
             if checkpoints:
                 db.update_checkpoints(*checkpoints)
+            if self._zstd is not None and self._zstd.dictionary is not None:
+                db.store_compression_dictionary(self._zstd.dictionary.dict_id(),
+                                                self._zstd.dictionary.as_bytes())
 
             cur.execute('COMMIT')
         # TODO: Maybe use BTrees.family.intersection to get the common keys?
@@ -26,6 +26,7 @@ from __future__ import print_function
 from abc import abstractmethod
 from contextlib import closing
 import sqlite3
+import time
 
 from relstorage._compat import ABC
 from relstorage._compat import OID_TID_MAP_TYPE
@@ -121,8 +122,18 @@ class Database(ABC):
 
     CREATE INDEX IF NOT EXISTS IX_object_state_f_tid
     ON object_state (frequency DESC, tid DESC);
+
+    CREATE TABLE IF NOT EXISTS compression_dictionaries (
+        dict_id INTEGER PRIMARY KEY,
+        saved_at REAL NOT NULL,
+        dictionary BLOB NOT NULL
+    );
     """
 
+    #: How many compression dictionaries to keep. States compressed
+    #: with a dictionary that has been discarded can't be used.
+    max_compression_dictionaries = 4
+
     # Without the CAST AS BLOB, if a value went in with text affinity,
     # (which happens essentially always under Python 2 but if we've done
     # things right never under Python 3) LENGTH will stop at an embedded
@@ -159,6 +170,40 @@ class Database(ABC):
         self.cursor.execute("SELECT max_hvt, complete_since FROM checkpoints")
         return self.cursor.fetchone()
 
+    @property
+    def compression_dictionaries(self):
+        """
+        The serialized compression dictionaries in the database,
+        most recently saved first.
+        """
+        cur = self.connection.execute(
+            "SELECT CAST(dictionary AS BLOB) FROM compression_dictionaries "
+            "ORDER BY saved_at DESC"
+        )
+        with closing(cur):
+            return [bytes(row[0]) for row in cur.fetchall()]
+
+    def store_compression_dictionary(self, dict_id, dictionary):
+        """
+        Save the serialized compression *dictionary*, discarding
+        the oldest dictionaries if there are too many.
+
+        This must be called in a transaction.
+        """
+        self.cursor.execute(
+            'INSERT OR REPLACE INTO compression_dictionaries (dict_id, saved_at, dictionary) '
+            'VALUES (?, ?, ?)',
+            (dict_id, time.time(), dictionary)
+        )
+        self.cursor.execute("""
+        DELETE FROM compression_dictionaries
+        WHERE dict_id NOT IN (
+            SELECT dict_id FROM compression_dictionaries
+            ORDER BY saved_at DESC
+            LIMIT ?
+        )
+        """, (self.max_compression_dictionaries,))
+
     def _remove_invalid_persistent_oids(self, bad_oids, cur):
         cur.execute("BEGIN")
         batch = Sqlite3RowBatcher(cur)
@@ -192,11 +237,31 @@ class Database(ABC):
                 logger.debug("Failed to lock database to remove OIDs; tries left: %d", tries)
         return -1
 
-    def fetch_rows_by_priority(self):
+    def oid_boundaries(self, count):
+        """
+        Return a sorted list of no more than *count* - 1 OIDs that
+        divide the rows into *count* ranges of about the same number of
+        rows.
+        """
+        total = self.total_state_count
+        boundaries = []
+        for i in range(1, count):
+            self.cursor.execute(
+                'SELECT zoid FROM object_state ORDER BY zoid LIMIT 1 OFFSET ?',
+                (total * i // count,))
+            row = self.cursor.fetchone()
+            if row is not None and (not boundaries or row[0] > boundaries[-1]):
+                boundaries.append(row[0])
+        return boundaries
+
+    def fetch_rows_by_priority(self, min_oid=None, end_oid=None):
         """
         The returned object will iterate ``(zoid, was_frozen, state, tid, frequency)``
         from most frequently used and newest, to least frequently used and oldest.
 
+        If *min_oid* or *end_oid* is given, only rows with an OID at
+        least *min_oid* and less than *end_oid* are included.
+
         You *must* completely consume the returned object.
         """
         # Do this in a new cursor so it can interleave.
@@ -220,12 +285,21 @@ class Database(ABC):
         as_state = bytes # Py2 returns buffers, Py3 returns bytes. bytes(bytes) is a no-op.
         cur = self.connection.cursor()
         cur.arraysize = 100
+        conditions = []
+        params = []
+        if min_oid is not None:
+            conditions.append('zoid >= ?')
+            params.append(min_oid)
+        if end_oid is not None:
+            conditions.append('zoid < ?')
+            params.append(end_oid)
         cur.execute("""
             SELECT zoid, CASE was_frozen WHEN 1 THEN -1 ELSE tid END,
                    CAST(state AS BLOB), tid, frequency
             FROM object_state
+            %s
             ORDER BY frequency DESC, tid DESC
-        """)
+        """ % ('WHERE ' + ' AND '.join(conditions) if conditions else '',), params)
         for zoid, frozen, state, tid, frequency in cur:
             yield zoid, frozen, as_state(state), tid, frequency
 
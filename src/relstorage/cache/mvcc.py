@@ -19,6 +19,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from itertools import chain
 from logging import DEBUG as LDEBUG
 
 from perfmetrics import statsd_client
@@ -33,11 +39,15 @@ from relstorage._util import log_timed
 from relstorage._util import get_positive_integer_from_environ
 from relstorage._util import TRACE as LTRACE
 from relstorage._util import get_duration_from_environ
+from relstorage._util import thread_spawn
 from relstorage._mvcc import DetachableMVCCDatabaseCoordinator
+from relstorage._mvcc import DetachableMVCCDatabaseViewer
 from relstorage.options import Options
 
 
 from .interfaces import IStorageCacheMVCCDatabaseCoordinator
+from .persistence import object_index_file
+from .persistence import replacing_file
 
 from ._objectindex import _ObjectIndex # pylint:disable=no-name-in-module,import-error
 
@@ -45,6 +55,9 @@ from ._objectindex import _ObjectIndex # pylint:disable=no-name-in-module,import
 
 logger = __import__('logging').getLogger(__name__)
 
+# Returned when a poll can't be answered from another's results.
+_NOT_SHARED = object()
+
 
 #: The maximum amount of time, in seconds, we will spend polling the
 #: database for OIDS when restoring the cache. If this time is exceeded,
@@ -52,6 +65,61 @@ logger = __import__('logging').getLogger(__name__)
 #: doing so introduces a slight speed penalty to the polling process.
 POLL_TIMEOUT = get_duration_from_environ('RS_CACHE_POLL_TIMEOUT', None, logger=logger)
 
+_INDEX_MAGIC = b'RSOIDX01'
+# Magic, highest visible TID, count of OID/TID pairs.
+_INDEX_HEADER = struct.Struct('<8sqQ')
+# The CRC32 of the header and the pairs, at the end.
+_INDEX_CHECKSUM = struct.Struct('<I')
+
+
+def _save_object_index(path, highest_visible_tid, oid_tids):
+    """
+    Write *oid_tids*, the TID of each OID as of
+    *highest_visible_tid*, to *path*, replacing it atomically.
+    """
+    pairs = array('q', chain.from_iterable(oid_tids.items()))
+    if sys.byteorder != 'little':
+        pairs.byteswap()
+    header = _INDEX_HEADER.pack(_INDEX_MAGIC, highest_visible_tid, len(pairs) // 2)
+    body = pairs.tobytes()
+    with replacing_file(path) as f:
+        f.write(header)
+        f.write(body)
+        f.write(_INDEX_CHECKSUM.pack(zlib.crc32(body, zlib.crc32(header))))
+
+
+def _load_object_index(path):
+    """
+    Return ``(highest_visible_tid, oid_tids)`` from the object index
+    saved at *path*, or ``(None, None)`` if there isn't a usable one.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None, None
+    except OSError:
+        logger.exception("Failed to read %r", path)
+        return None, None
+    # Trust nothing about it, not even what the header says, unless
+    # the checksum matches.
+    body_end = len(data) - _INDEX_CHECKSUM.size
+    try:
+        checksum, = _INDEX_CHECKSUM.unpack_from(data, body_end)
+        if checksum != zlib.crc32(data[:body_end]):
+            raise ValueError("Bad checksum")
+        magic, highest_visible_tid, count = _INDEX_HEADER.unpack_from(data)
+        if magic != _INDEX_MAGIC or body_end != _INDEX_HEADER.size + count * 16:
+            raise ValueError("Bad object index")
+    except (struct.error, ValueError):
+        logger.warning("Ignoring corrupt object index file %r", path)
+        return None, None
+    pairs = array('q')
+    pairs.frombytes(data[_INDEX_HEADER.size:body_end])
+    if sys.byteorder != 'little':
+        pairs.byteswap()
+    return highest_visible_tid, OidTMap(zip(pairs[::2], pairs[1::2]))
+
 ###
 # Notes on in-process concurrency:
 #
@@ -108,6 +176,15 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
         'RS_CACHE_MVCC_MAX_DEPTH', 1000, logger=logger
     )
 
+    # The most object index entries one vacuum, done while holding
+    # the lock during a poll, will process. When a burst of writes
+    # leaves more than that to do, the rest is left for later polls
+    # (at least one transaction map is always processed, so
+    # vacuuming keeps up). Setting this to 0 does everything at once.
+    vacuum_max_entries = get_positive_integer_from_environ(
+        'RS_CACHE_MVCC_VACUUM_MAX_ENTRIES', 10000, logger=logger
+    )
+
     # The total number of entries in the object index we allow
     # before we start cutting off old viewers. This gets set from
     # Options.cache_delta_size_limit. A full structure with the default
@@ -115,6 +192,32 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
     max_allowed_index_size = 100000
     object_index = None
 
+    # The thread restoring the persistent cache in the background, if
+    # any (``cache_local_restore_in_background``), and a counter we
+    # change to tell it that what it restores is no longer wanted.
+    _restore_thread = None
+    _restore_generation = 0
+
+    # The Event set when the poll query being run by some viewer
+    # finishes, if polls are shared (``cache_share_polls``).
+    _poll_in_flight = None
+
+    #: How long, in seconds, a viewer waits for a poll already in
+    #: progress before making its own.
+    shared_poll_wait = 5.0
+
+    # The thread polling in the background, if any
+    # (``cache_background_poll_interval``), and the Event that tells
+    # it to stop.
+    _poll_thread = None
+    _poll_thread_stop = None
+
+    #: How many times a background restore will poll the database for
+    #: the current TIDs of the restored objects. It has to try again
+    #: if, by the time it has them, the object index no longer
+    #: reaches back that far.
+    restore_poll_attempts = 3
+
     def __init__(self, options=None):
         super().__init__()
         # There's a tension between blocking as little as possible
@@ -136,6 +239,28 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
         # Also, lots of it is shared across the connections.
         self.max_allowed_index_size = options.cache_delta_size_limit * 2
         self.log = logger.log
+        self.background_poll_interval = options.cache_background_poll_interval
+        # Polling in the background is only useful if others can use
+        # what it found.
+        self.share_polls = options.cache_share_polls or bool(self.background_poll_interval)
+        self.save_object_index = options.cache_local_object_index
+        # How many polls waited for another, how many were answered
+        # from the index another had polled for, and how many the
+        # background thread made.
+        self.poll_stats = {
+            'waited': 0,
+            'shared': 0,
+            'background': 0,
+        }
+        # The work vacuuming has done, and how many times it left
+        # some for later.
+        self.vacuum_stats = {
+            'passes': 0,
+            'deferred': 0,
+            'maps_removed': 0,
+            'entries_frozen': 0,
+            'entries_removed': 0,
+        }
 
     def stats(self):
         return {
@@ -143,6 +268,8 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
             'oldest viewer': self.minimum_highest_visible_tid,
             'hvt': self.object_index.maximum_highest_visible_tid if self.object_index else None,
             'index': self.object_index.stats() if self.object_index else None,
+            'vacuum': dict(self.vacuum_stats),
+            'polls': dict(self.poll_stats),
         }
 
     @property
@@ -158,8 +285,69 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
             cur_ix = self.object_index
             # this can mutate without changing the object identity!
             cur_ix_hvt = cur_ix.highest_visible_tid if cur_ix else None
+            in_flight = self._poll_in_flight
+
+        if not self.share_polls:
+            return self._poll(cache, conn, cursor, cur_ix, cur_ix_hvt)
+
+        if in_flight is not None:
+            # Someone else is already asking the database what
+            # changed. Rather than asking again, wait for their answer.
+            self.poll_stats['waited'] += 1
+            in_flight.wait(self.shared_poll_wait)
+            with self._lock:
+                cur_ix = self.object_index
+                cur_ix_hvt = cur_ix.highest_visible_tid if cur_ix else None
+
+        if cur_ix is not None:
+            changes = self.__poll_shared(cache, cursor, cur_ix_hvt)
+            if changes is not _NOT_SHARED:
+                return changes
+
+        event = threading.Event()
+        with self._lock:
+            leader = self._poll_in_flight is None
+            if leader:
+                self._poll_in_flight = event
+        try:
+            return self._poll(cache, conn, cursor, cur_ix, cur_ix_hvt)
+        finally:
+            if leader:
+                with self._lock:
+                    self._poll_in_flight = None
+                event.set()
+
+    def __poll_shared(self, cache, cursor, current_index_hvt):
+        """
+        If another viewer has already polled past *cache*, and the
+        database hasn't changed since, move *cache* forward to that
+        index and return its changes (as :meth:`poll` does) without
+        running the poll query.
+
+        Finding the current TID both tells us that, and, like the
+        poll query would, establishes the snapshot the viewer will
+        read from, so the two agree. Otherwise, return ``_NOT_SHARED``.
+        """
+        viewer_hvt = cache.highest_visible_tid
+        if viewer_hvt is None or cache.detached or viewer_hvt >= current_index_hvt:
+            return _NOT_SHARED
 
-        return self._poll(cache, conn, cursor, cur_ix, cur_ix_hvt)
+        current_tid = cache.adapter.poller.get_current_tid(cursor)
+        with self._lock:
+            index = self.object_index
+            if index is None or index.highest_visible_tid != current_tid:
+                return _NOT_SHARED
+
+        # As in _poll(), the viewer's registered TID keeps the maps we
+        # need from being vacuumed while we do this.
+        changes = self._find_changes_for_viewer(cache, index)
+        with self._lock:
+            if self.object_index is None:
+                self.__set_viewer_state_locked(cache, None)
+                return None
+            self.__set_viewer_state_locked(cache, index)
+        self.poll_stats['shared'] += 1
+        return changes
 
     def __set_viewer_state_locked(self, cache, index):
         cache.object_index = index
@@ -295,6 +483,7 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
         change_iter = self._find_changes_for_viewer(cache, change_index)
 
         # Move our MVCC state forward and vacuum while locked.
+        checkpoints = None
         with self._lock:
             if self.object_index is None:
                 self.__set_viewer_state_locked(cache, None)
@@ -306,10 +495,21 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
                 # If it's been replaced, it will only have moved forward
                 # and all the rest of the maps are still shared.
                 if self.object_index.highest_visible_tid >= polled_tid:
-                    self._vacuum(cache, change_index)
+                    self._vacuum(cache, change_index, self.vacuum_max_entries)
+                    checkpoints = self._checkpoints()
 
+        if checkpoints is not None:
+            # Possibly write what's changed to the persistent cache.
+            cache.local_client.checkpoint(checkpoints)
         return change_iter
 
+    def _checkpoints(self):
+        max_hvt = self.object_index.maximum_highest_visible_tid
+        return (
+            max_hvt,
+            self.complete_since_tid or max_hvt
+        )
+
     @staticmethod
     def _find_changes_for_viewer(viewer, object_index):
         """
@@ -349,7 +549,7 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
         return iteroiditems(changes)
 
     @log_timed
-    def _vacuum(self, cache, object_index):
+    def _vacuum(self, cache, object_index, max_entries=None):
         """
         Handle object index and cache entries for which we no longer
         have a requirement.
@@ -379,6 +579,10 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
         because, even though the objects with the partially diverged index
         will still be able to read just fine, we may prematurely remove
         cached object states that they need.
+
+        If *max_entries* is given, we stop removing transactions once
+        the ones we've removed held that many entries, leaving the
+        rest for the next call.
         """
         # This is called for every transaction. It needs to be fast, and mindful
         # of what it logs.
@@ -413,6 +617,9 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
             required_tid,
         )
         oids_tids_to_del = OidTMap()
+        stats = self.vacuum_stats
+        stats['passes'] += 1
+        entries = 0
         while 1: # pylint:disable=consider-refactoring-into-while-condition
             if object_index.depth == 1:
                 # Nothing left to vacuum
@@ -425,6 +632,14 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
                 # The last state isn't quite obsolete, others are still looking
                 # at that range. Don't remove it.
                 break
+            if max_entries and entries >= max_entries:
+                # That's enough while holding the lock; we'll
+                # pick up here next time.
+                stats['deferred'] += 1
+                break
+
+            entries += len(object_index.get_oldest_transaction())
+            stats['maps_removed'] += 1
 
             # all remaining valid viewers have highest_visible_tid > this one
             # So any OIDs that exist in both this bucket and any newer bucket with a newer
@@ -443,20 +658,25 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
             if obsolete_bucket:
                 self.log(LTRACE, "Vacuum: Freezing %s old OIDs", len(obsolete_bucket))
                 local_client.freeze(obsolete_bucket)
+                stats['entries_frozen'] += len(obsolete_bucket)
 
         if oids_tids_to_del:
             local_client.delitems(oids_tids_to_del)
+            stats['entries_removed'] += len(oids_tids_to_del)
 
 
     def flush_all(self):
         with self._lock:
             self.object_index = None
+            self._restore_generation += 1
             self.detach_all()
 
     def close(self):
+        self.stop_background_poll()
         self.clear()
         with self._lock:
             self.object_index = None
+            self._restore_generation += 1
 
     def save(self, cache, save_args):
         if not self.object_index or not self.object_index.maximum_highest_visible_tid:
@@ -477,16 +697,99 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
         # We give that last map to the local client so it knows to write only
         # known-valid data and to dispose of anything invalid.
 
-        checkpoints = None
-        max_hvt = self.object_index.maximum_highest_visible_tid
-        checkpoints = (
-            max_hvt,
-            self.complete_since_tid or max_hvt
-        )
+        checkpoints = self._checkpoints()
         local_client = cache.local_client
-        return local_client.save(object_index=self.object_index.get_newest_transaction(),
+        newest_map = self.object_index.get_newest_transaction()
+        if self.save_object_index and local_client.options.cache_local_dir:
+            self.__save_object_index(local_client, checkpoints[0], newest_map)
+        return local_client.save(object_index=newest_map,
                                  checkpoints=checkpoints, **save_args)
 
+    @log_timed
+    def __save_object_index(self, local_client, highest_visible_tid, newest_map):
+        # Everything we know to be current as of *highest_visible_tid*:
+        # the final map of the index, and the frozen states we have
+        # of objects it doesn't mention (anything that changed before
+        # the map began was discarded when it was frozen, and
+        # anything since is in the map).
+        #
+        # This isn't about what's in the persistent cache; whoever
+        # wrote it, a row with exactly this OID and TID is current as
+        # of *highest_visible_tid*.
+        oid_tids = local_client.frozen_oid_tids()
+        oid_tids.update(newest_map.items())
+        path = object_index_file(local_client.options, local_client.prefix)
+        try:
+            _save_object_index(path, highest_visible_tid, oid_tids)
+        except OSError:
+            logger.exception("Failed to save the object index")
+        else:
+            logger.info("Saved the object index of %d OIDs as of %s",
+                        len(oid_tids), highest_visible_tid)
+
+    def __load_object_index(self, local_client):
+        if not self.save_object_index or not local_client.options.cache_local_dir:
+            return None, None
+        return _load_object_index(
+            object_index_file(local_client.options, local_client.prefix))
+
+    def start_background_poll(self, adapter, local_client):
+        """
+        Begin polling the database every ``background_poll_interval``
+        seconds in a background thread, using its own connection.
+
+        That keeps the object index current (and vacuumed) so that
+        viewers polling when a transaction begins can usually use it
+        as it is.
+        """
+        if not self.background_poll_interval or self._poll_thread is not None:
+            return
+        self._poll_thread_stop = threading.Event()
+        self._poll_thread = thread_spawn(
+            self._poll_in_background,
+            (adapter, local_client, self._poll_thread_stop),
+            daemon=True
+        )
+
+    def stop_background_poll(self, timeout=None):
+        """
+        Stop the background poller, if there is one, waiting up to
+        *timeout* seconds for it to finish.
+        """
+        thread = self._poll_thread
+        if thread is None:
+            return
+        self._poll_thread_stop.set()
+        thread.wait(timeout)
+        self._poll_thread = self._poll_thread_stop = None
+
+    def _poll_in_background(self, adapter, local_client, stop):
+        viewer = _BackgroundPollViewer(adapter, local_client)
+        self.register(viewer)
+        connmanager = adapter.connmanager
+        conn = cursor = None
+        try:
+            while not stop.wait(self.background_poll_interval):
+                try:
+                    if conn is None:
+                        conn, cursor = connmanager.open_for_load()
+                    else:
+                        connmanager.restart_load(conn, cursor, needs_rollback=False)
+                    self.poll(viewer, conn, cursor)
+                    self.poll_stats['background'] += 1
+                    # Don't hold a snapshot open until the next poll;
+                    # that keeps the database from cleaning up.
+                    connmanager.rollback_quietly(conn, cursor)
+                except Exception: # pylint:disable=broad-except
+                    logger.exception("Failed to poll in the background")
+                    if conn is not None:
+                        connmanager.rollback_and_close(conn, cursor)
+                        conn = cursor = None
+        finally:
+            self.unregister(viewer)
+            if conn is not None:
+                connmanager.rollback_and_close(conn, cursor)
+
     def restore(self, adapter, local_client, timeout=None):
         # This method is not thread safe
 
@@ -508,12 +811,165 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
             self.object_index = _ObjectIndex(highest_visible_tid)
             self.__poll_old_oids_and_remove(adapter, local_client, timeout or POLL_TIMEOUT)
 
+    def restore_in_background(self, adapter, local_client, timeout=None):
+        """
+        Like :meth:`restore`, but read the persistent cache and check
+        which objects are still current in a background thread, and
+        only then add those to *local_client*.
+
+        The cache is in use the whole time; it just doesn't have the
+        restored objects until they're added.
+        """
+        with self._lock:
+            self._restore_generation += 1
+            generation = self._restore_generation
+        self._restore_thread = thread_spawn(
+            self._restore_in_background,
+            (adapter, local_client, timeout or POLL_TIMEOUT, generation),
+            daemon=True
+        )
+
+    def wait_for_restore(self, timeout=None):
+        """
+        Wait for a background restore to finish, or for *timeout*
+        seconds. Return whether there's no restore in progress.
+        """
+        thread = self._restore_thread
+        if thread is None:
+            return True
+        thread.wait(timeout)
+        return thread.ready()
+
+    def _restore_in_background(self, *args):
+        try:
+            self.__admit_restored_items(*args)
+        except Exception: # pylint:disable=broad-except
+            logger.exception("Failed to restore the persistent cache")
+
     @log_timed
-    def __poll_old_oids_and_remove(self, adapter, local_client, timeout):
+    def __admit_restored_items(self, adapter, local_client, timeout, generation):
+        _, items = local_client.read_persistent_items()
+        if not items:
+            return
+        known_tid, saved_tids = self.__load_object_index(local_client)
+        known = OidTMap()
+        if saved_tids:
+            saved_tid = saved_tids.get
+            known.update([(oid, tid) for oid, (_, tid, _, _) in items
+                          if saved_tid(oid) == tid])
+        cached_oids = OidSet([item[0] for item in items if item[0] not in known])
+
+        for _ in range(self.restore_poll_attempts):
+            db_tid, current_tids, complete = self.__poll_current_tids(
+                adapter, cached_oids, timeout, known_tid, known)
+            current_tid = current_tids.get
+            valid = [item for item in items if current_tid(item[0]) == item[1][1]]
+            with self._lock:
+                if generation != self._restore_generation:
+                    logger.info("Abandoning restore of the persistent cache")
+                    return
+                index = self.object_index
+                if index is None:
+                    if not db_tid:
+                        return
+                    # Nobody has polled yet. What we have is
+                    # current as of our poll, so that's where they
+                    # can start.
+                    index = self.object_index = _ObjectIndex(db_tid)
+                known_since = index.complete_since_tid
+                if known_since is None:
+                    known_since = index.highest_visible_tid
+                if known_since > db_tid:
+                    # Objects might have changed after our poll
+                    # without the index knowing.
+                    continue
+                # Anything the index knows about has changed since
+                # our poll (unless it's the same TID we found).
+                valid = [item for item in valid if index[item[0]] in (None, item[1][1])]
+                admitted = local_client.admit_restored(valid)
+            break
+        else:
+            logger.info("Database changed too quickly to restore the persistent cache")
+            return
+
+        invalid_oids = OidSet([
+            oid for oid, (_, tid, _, _) in items
+            if (current_tid(oid) or 0) != tid and (complete or oid in current_tids)
+        ])
+        logger.info(
+            "Restored %d of %d cached objects in the background; %d were out of date",
+            admitted, len(items), len(invalid_oids))
+        local_client.remove_invalid_persistent_oids(invalid_oids, invalidate=False)
+
+    @staticmethod
+    def __poll_current_tids(adapter, oids, timeout, known_tid=None, known=None):
+        """
+        Return the current TID of the database, a mapping of the
+        current TID of each of *oids* as of then, and whether we
+        got them all before *timeout*.
+
+        If given, *known* maps more OIDs to their TIDs as of
+        *known_tid* (from a saved object index). Rather than look
+        those up, we poll for what changed since then, and include
+        them in the mapping too.
+        """
         from relstorage.adapters.connmanager import connection_callback
         from relstorage.adapters.interfaces import AggregateOperationTimeoutError
 
+        @connection_callback(isolation_level=adapter.connmanager.isolation_load,
+                             read_only=True)
+        def poll_cached_oids(conn, cursor):
+            # All the queries see the same snapshot.
+            db_tid = adapter.poller.get_current_tid(cursor)
+            current_tids = OidTMap()
+            lookup = oids
+            if known:
+                changes = None
+                if db_tid >= known_tid:
+                    changes, _ = adapter.poller.poll_invalidations(conn, cursor, known_tid)
+                if changes is None:
+                    # The database went backwards (or was replaced);
+                    # what we knew may not be true anymore.
+                    lookup = list(oids) + list(known.keys())
+                else:
+                    current_tids.update(known)
+                    for oid, tid in changes:
+                        if oid in known and tid > current_tids[oid]:
+                            current_tids[oid] = tid
+                    logger.info(
+                        "Used the object index saved as of %s for %d oids",
+                        known_tid, len(known))
+            try:
+                current_tids.update(adapter.mover.current_object_tids(cursor, lookup,
+                                                                      timeout=timeout))
+                complete = True
+            except AggregateOperationTimeoutError as ex:
+                logger.info(
+                    "Timed out polling the database for %s oids; will use %s partial results",
+                    len(lookup), len(ex.partial_result)
+                )
+                current_tids.update(ex.partial_result)
+                complete = False
+            return db_tid, current_tids, complete
+
+        return adapter.connmanager.open_and_call(poll_cached_oids)
+
+    @log_timed
+    def __poll_old_oids_and_remove(self, adapter, local_client, timeout):
         cached_oids = OidSet(local_client.keys())
+        # pylint:disable-next=protected-access
+        cache_is_correct = local_client._cache.contains_oid_with_tid
+        # Objects cached just as the saved object index has them
+        # only need checking for changes since it was saved.
+        known_tid, saved_tids = self.__load_object_index(local_client)
+        known = OidTMap()
+        if saved_tids:
+            saved_tid = saved_tids.get
+            for oid_int in cached_oids:
+                tid = saved_tid(oid_int)
+                if tid is not None and cache_is_correct(oid_int, tid):
+                    known[oid_int] = tid
+        lookup_oids = OidSet([oid_int for oid_int in cached_oids if oid_int not in known])
         # In local tests, this function executes against PostgreSQL 11 in .78s
         # for 133,002 older OIDs; or, .35s for 57,002 OIDs against MySQL 5.7.
         # In one production environment of 800,000 OIDs with a 98% survival rate,
@@ -523,30 +979,14 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
         # since the ``current_object_tids`` batches in groups of 1024, that works out to
         # .75s per SQL query. Not good. Hence the ability to set a timeout.
         logger.info("Polling %d oids stored in cache with SQL timeout %r",
-                    len(cached_oids), timeout)
+                    len(lookup_oids), timeout)
 
-        @connection_callback(isolation_level=adapter.connmanager.isolation_load,
-                             read_only=True)
-        def poll_cached_oids(_conn, cursor):
-            # type: (Any, Any) -> Dict[Int, Int]
-            """Return mapping of {oid_int: tid_int}"""
-            try:
-                return adapter.mover.current_object_tids(cursor, cached_oids,
-                                                         timeout=timeout)
-            except AggregateOperationTimeoutError as ex:
-                # If we time out, we can at least validate the results we have
-                # so far.
-                logger.info(
-                    "Timed out polling the database for %s oids; will use %s partial results",
-                    len(cached_oids), len(ex.partial_result)
-                )
-                return ex.partial_result
-
-        current_tids = adapter.connmanager.open_and_call(poll_cached_oids)
+        # If we time out, we can at least validate the results we
+        # have so far.
+        _, current_tids, _ = self.__poll_current_tids(
+            adapter, lookup_oids, timeout, known_tid, known)
         current_tid = current_tids.get
         polled_invalid_oids = OidSet()
-        # pylint:disable-next=protected-access
-        cache_is_correct = local_client._cache.contains_oid_with_tid
 
         for oid_int in cached_oids:
             if not cache_is_correct(oid_int, current_tid(oid_int)):
@@ -556,3 +996,20 @@ class MVCCDatabaseCoordinator(DetachableMVCCDatabaseCoordinator):
                     len(cached_oids), len(current_tids),
                     len(cached_oids) - len(polled_invalid_oids))
         local_client.remove_invalid_persistent_oids(polled_invalid_oids)
+
+
+class _BackgroundPollViewer(DetachableMVCCDatabaseViewer):
+    """
+    The viewer the background poller polls for.
+    """
+    __slots__ = (
+        'adapter',
+        'local_client',
+        'object_index',
+    )
+
+    def __init__(self, adapter, local_client):
+        super().__init__()
+        self.adapter = adapter
+        self.local_client = local_client
+        self.object_index = None
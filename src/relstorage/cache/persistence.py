@@ -25,10 +25,13 @@ import logging
 import os
 import os.path
 import sqlite3
+import tempfile
+from contextlib import contextmanager
 
 
 from relstorage.adapters.sqlite.drivers import Sqlite3Driver
 from relstorage.adapters.sqlite.dialect import SQ3_SUPPORTS_CTE
+from relstorage.cache._segment_file import SegmentFiles
 
 # Because we use a CTE in our default queries. In principle,
 # we could probably re-write queries and run on 3.7.11; 3.7.0 was the
@@ -43,6 +46,37 @@ def _normalize_path(options):
     path = os.path.abspath(path)
     return path
 
+def _cache_dir(options):
+    # The normalized cache directory, created if needed.
+    parent_dir = _normalize_path(options)
+    try:
+        os.makedirs(parent_dir)
+    except os.error:
+        pass
+    return parent_dir
+
+@contextmanager
+def replacing_file(path):
+    """
+    Produce a new binary file, uniquely named in the directory of
+    *path*, to write; if that succeeds, it atomically replaces
+    *path*.
+
+    Processes sharing a cache directory may write the same *path*
+    at the same time; each writes its own file, and the last to
+    finish wins.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                     prefix=os.path.basename(path) + '.',
+                                     suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.replace(temp_path, path)
+    except:
+        __quiet_remove(temp_path)
+        raise
+
 def trace_file(options, prefix):
     # Return an open file for tracing to, if that is set up.
     # Otherwise, return nothing.
@@ -113,6 +147,35 @@ def sqlite_files(options, prefix):
     return fname, destroy
 
 
+def segment_files(options, prefix):
+    """
+    Return the :class:`relstorage.cache._segment_file.SegmentFiles` for
+    the cache directory, creating the directory if needed.
+    """
+    parent_dir = _normalize_path(options)
+    try:
+        os.makedirs(parent_dir)
+    except os.error:
+        pass
+    return SegmentFiles(parent_dir, prefix)
+
+
+def coaccess_file(options, prefix):
+    """
+    Return the path of the file holding the table of objects loaded
+    together, creating the cache directory if needed.
+    """
+    return os.path.join(_cache_dir(options), 'relstorage-coaccess-' + prefix + '.bin')
+
+
+def object_index_file(options, prefix):
+    """
+    Return the path of the file holding the object index saved with
+    the persistent cache, creating the cache directory if needed.
+    """
+    return os.path.join(_cache_dir(options), 'relstorage-index-' + prefix + '.bin')
+
+
 class Sqlite3TooOldError(ValueError):
     """Raised if the sqlite3 module is too old."""
 
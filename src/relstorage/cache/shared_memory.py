@@ -0,0 +1,497 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+An implementation of ``IStateCache`` that is shared between all the
+processes on a single host using a memory mapped file.
+
+The file (usually found in ``/dev/shm``) is divided into three parts:
+
+- A fixed size header describing the geometry of the rest of the file.
+- A set-associative hash index. Each OID hashes to a bucket of a few
+  slots; each slot records the OID, the TID of the state, the highest
+  TID the state is known to be current as-of, and where in the data
+  area the state lives. A bucket may hold several states for one OID.
+- A circular data log. New states are appended at the head, eventually
+  overwriting the oldest states.
+
+The index is protected by a set of lock stripes. Because POSIX record
+locks only exclude other *processes*, each stripe is a pair of a
+``threading.Lock`` and a one-byte ``fcntl`` lock. Readers verify that
+the data they copied wasn't overwritten by the data log wrapping
+around while they were reading it (and check a CRC, for good measure).
+
+Invalidation remains the responsibility of each process's
+:class:`relstorage.cache.mvcc.MVCCDatabaseCoordinator`: exact
+``(oid, tid)`` keys are immutable and may always be shared. Lookups
+without a known TID are only answered with states that some process
+verified to be current as-of a TID no older than the point at which
+the requesting viewer's index is complete.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+from zope import interface
+
+from relstorage.cache.interfaces import IStateCache
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover
+    # Windows.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# magic, bucket_count, ways, stripe_count, data_size, head
+_HEADER = struct.Struct('<8sIIIQQ')
+_HEADER_SIZE = 64
+_HEAD_OFFSET = 32
+_HEAD = struct.Struct('<Q')
+_MAGIC = b'RSSHMC01'
+
+# oid, tid, verified_tid, data position, length, crc32
+_SLOT = struct.Struct('<qqqQII')
+_EMPTY_SLOT = b'\0' * _SLOT.size
+
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+# {path: _Segment}, of the segments open in this process.
+_segments = {}
+_segments_lock = threading.Lock()
+
+
+class _Segment(object):
+    """
+    The memory mapped file and its locks.
+
+    Instances are shared by every ``SharedMemoryStateCache`` in
+    a process that uses the same file; get them with :meth:`open`.
+    That matters for correctness, not just economy: POSIX record
+    locks don't exclude other file descriptors in the same process,
+    and closing any descriptor for the file drops all of the
+    process's locks on it.
+    """
+
+    #: Number of slots per bucket.
+    ways = 4
+    #: Number of lock stripes.
+    stripe_count = 64
+    #: We plan for one slot per this many bytes of the file.
+    bytes_per_slot = 1024
+
+    @classmethod
+    def open(cls, path, byte_limit):
+        """
+        Return the segment for *path*, opening it if this process
+        hasn't already. Call :meth:`release` when done with it.
+        """
+        key = os.path.realpath(path)
+        with _segments_lock:
+            segment = _segments.get(key)
+            if segment is None or not segment._is_file(key):
+                # If the file was removed or replaced, the old
+                # segment stays with whoever has it open.
+                segment = _segments[key] = cls(path, byte_limit)
+                segment._key = key
+            segment._references += 1
+        return segment
+
+    def release(self):
+        """
+        Stop using a segment returned from :meth:`open`, closing it
+        if nothing else in this process is.
+        """
+        with _segments_lock:
+            self._references -= 1
+            if self._references > 0:
+                return
+            if _segments.get(self._key) is self:
+                del _segments[self._key]
+        self.close()
+
+    _key = None
+    _references = 0
+
+    def _is_file(self, path):
+        try:
+            on_disk = os.stat(path)
+        except OSError:
+            return False
+        mine = os.fstat(self._fd)
+        return (on_disk.st_dev, on_disk.st_ino) == (mine.st_dev, mine.st_ino)
+
+    def __init__(self, path, byte_limit):
+        self.path = path
+        self._fd = fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # The allocation lock protects the head of the data log
+        # and the initialization of the file.
+        self._alloc_lock = threading.Lock()
+        try:
+            with self._locked(self._alloc_lock, 0):
+                if os.fstat(fd).st_size < _HEADER_SIZE:
+                    self._initialize(byte_limit)
+                self._map = mmap.mmap(fd, os.fstat(fd).st_size)
+        except:
+            os.close(fd)
+            raise
+
+        magic, buckets, ways, stripes, data_size, _ = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError("Not a shared cache file: %r" % (path,))
+        self.bucket_count = buckets
+        self.ways = ways
+        self.stripe_count = stripes
+        self.data_size = data_size
+        self._data_offset = _HEADER_SIZE + buckets * ways * _SLOT.size
+        self._stripe_locks = [threading.Lock() for _ in range(stripes)]
+
+    def _initialize(self, byte_limit):
+        ways = self.ways
+        buckets = max(self.stripe_count, byte_limit // (self.bytes_per_slot * ways))
+        index_size = buckets * ways * _SLOT.size
+        data_size = max(byte_limit - _HEADER_SIZE - index_size, self.bytes_per_slot)
+        os.ftruncate(self._fd, _HEADER_SIZE + index_size + data_size)
+        os.pwrite(self._fd,
+                  _HEADER.pack(_MAGIC, buckets, ways, self.stripe_count, data_size, 0),
+                  0)
+
+    def _locked(self, lock, lock_byte):
+        return _Locked(lock, self._fd, lock_byte)
+
+    def _stripe(self, bucket):
+        stripe = bucket % self.stripe_count
+        # Byte 0 is the allocation lock. Record locks don't
+        # need to correspond to the contents of the file.
+        return self._locked(self._stripe_locks[stripe], stripe + 1)
+
+    def _bucket(self, oid):
+        # Fibonacci hashing; the high bits are the well-mixed ones.
+        return (((oid * _HASH_MULTIPLIER) & _MASK64) >> 32) % self.bucket_count
+
+    def _slot_offsets(self, bucket):
+        start = _HEADER_SIZE + bucket * self.ways * _SLOT.size
+        return range(start, start + self.ways * _SLOT.size, _SLOT.size)
+
+    def _head(self):
+        return _HEAD.unpack_from(self._map, _HEAD_OFFSET)[0]
+
+    def _is_intact(self, pos):
+        # Has the data log wrapped around far enough to
+        # overwrite any of this?
+        return self._head() - pos <= self.data_size
+
+    def _append(self, data):
+        length = len(data)
+        data_size = self.data_size
+        with self._locked(self._alloc_lock, 0):
+            pos = self._head()
+            offset = pos % data_size
+            if offset + length > data_size:
+                # Don't split a record around the end.
+                pos += data_size - offset
+                offset = 0
+            _HEAD.pack_into(self._map, _HEAD_OFFSET, pos + length)
+        start = self._data_offset + offset
+        self._map[start:start + length] = data
+        return pos
+
+    def _read(self, pos, length):
+        start = self._data_offset + pos % self.data_size
+        return self._map[start:start + length]
+
+    def get(self, oid, tid=None, complete_since_tid=None, highest_visible_tid=None):
+        """
+        Return ``(state, tid)`` for *oid* or None.
+
+        If *tid* is given, the state must have exactly that TID.
+        Otherwise, it must have been verified to be current as-of at least
+        *complete_since_tid*, and must not be newer than *highest_visible_tid*.
+        """
+        bucket = self._bucket(oid)
+        slot = None
+        with self._stripe(bucket):
+            for offset in self._slot_offsets(bucket):
+                entry = _SLOT.unpack_from(self._map, offset)
+                if entry[0] != oid or not entry[1]:
+                    continue
+                if tid is not None:
+                    if entry[1] == tid:
+                        slot = entry
+                        break
+                elif (entry[2] >= complete_since_tid
+                      and entry[1] <= highest_visible_tid
+                      and (slot is None or entry[1] > slot[1])):
+                    slot = entry
+            if slot is None:
+                return None
+            _, slot_tid, _, pos, length, crc = slot
+            data = self._read(pos, length)
+
+        if not self._is_intact(pos) or zlib.crc32(data) & 0xFFFFFFFF != crc:
+            return None
+        return data, slot_tid
+
+    def contains(self, oid, tid):
+        bucket = self._bucket(oid)
+        with self._stripe(bucket):
+            for offset in self._slot_offsets(bucket):
+                entry = _SLOT.unpack_from(self._map, offset)
+                if entry[0] == oid and entry[1] == tid:
+                    return self._is_intact(entry[3])
+        return False
+
+    def store(self, oid, state, tid, verified_tid):
+        """
+        Store *state* for *oid* as-of *tid*, known to be current as
+        of *verified_tid*.
+
+        If we already have the same state, only *verified_tid* is updated.
+        """
+        bucket = self._bucket(oid)
+        with self._stripe(bucket):
+            slot_offset = self._find_slot(bucket, oid, tid, verified_tid)
+        if slot_offset is None:
+            return False
+
+        state = state or b''
+        crc = zlib.crc32(state) & 0xFFFFFFFF
+        # Write the data before publishing it in the index.
+        pos = self._append(state)
+        with self._stripe(bucket):
+            # Someone could have beaten us.
+            slot_offset = self._find_slot(bucket, oid, tid, verified_tid)
+            if slot_offset is not None:
+                _SLOT.pack_into(self._map, slot_offset,
+                                oid, tid, verified_tid, pos, len(state), crc)
+        return True
+
+    def _find_slot(self, bucket, oid, tid, verified_tid):
+        # Return the offset of the slot to write to, or None
+        # if nothing needs to be written. The victim is the slot whose
+        # data is oldest.
+        victim = None
+        victim_pos = None
+        for offset in self._slot_offsets(bucket):
+            entry = _SLOT.unpack_from(self._map, offset)
+            slot_oid, slot_tid, slot_verified, pos, _, _ = entry
+            intact = slot_tid and self._is_intact(pos)
+            if intact and slot_oid == oid and slot_tid == tid:
+                if slot_verified < verified_tid:
+                    _SLOT.pack_into(self._map, offset, *((oid, tid, verified_tid) + entry[3:]))
+                return None
+            if not intact:
+                pos = -1
+            if victim is None or pos < victim_pos:
+                victim = offset
+                victim_pos = pos
+        return victim
+
+    def delete(self, oid, tid=None):
+        bucket = self._bucket(oid)
+        with self._stripe(bucket):
+            for offset in self._slot_offsets(bucket):
+                entry = _SLOT.unpack_from(self._map, offset)
+                if entry[0] == oid and entry[1] and (tid is None or entry[1] == tid):
+                    self._map[offset:offset + _SLOT.size] = _EMPTY_SLOT
+
+    def clear(self):
+        for bucket in range(self.bucket_count):
+            with self._stripe(bucket):
+                for offset in self._slot_offsets(bucket):
+                    self._map[offset:offset + _SLOT.size] = _EMPTY_SLOT
+
+    def stats(self):
+        used = 0
+        for offset in range(_HEADER_SIZE, self._data_offset, _SLOT.size):
+            if _SLOT.unpack_from(self._map, offset)[1]:
+                used += 1
+        return {
+            'path': self.path,
+            'slots': self.bucket_count * self.ways,
+            'used_slots': used,
+            'data_size': self.data_size,
+            'bytes_written': self._head(),
+        }
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class _Locked(object):
+    __slots__ = ('lock', 'fd', 'lock_byte')
+
+    def __init__(self, lock, fd, lock_byte):
+        self.lock = lock
+        self.fd = fd
+        self.lock_byte = lock_byte
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, self.lock_byte)
+        except:
+            self.lock.release()
+            raise
+
+    def __exit__(self, t, v, tb):
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.lock_byte)
+        finally:
+            self.lock.release()
+
+
+@interface.implementer(IStateCache)
+class SharedMemoryStateCache(object):
+    """
+    A cache of object states shared between processes.
+
+    Like the :class:`relstorage.cache.local_client.LocalClient`, one
+    instance is shared by all the threads of a process.
+    """
+
+    @classmethod
+    def from_options(cls, options, prefix=''):
+        """
+        Create and return a SharedMemoryStateCache from the options,
+        if they so request.
+        """
+        if not options.cache_local_shared_mb:
+            return None
+        if fcntl is None: # pragma: no cover
+            logger.warning("Shared memory caching is not supported on this platform.")
+            return None
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        path = os.path.join(directory, cls.file_name(prefix))
+        return cls(path,
+                   int(1000000 * options.cache_local_shared_mb),
+                   options.cache_local_object_max)
+
+    @staticmethod
+    def file_name(prefix):
+        prefix = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in prefix or '')
+        return 'relstorage-cache-%s-%s.shm' % (prefix, os.getuid())
+
+    def __init__(self, path, byte_limit, value_limit):
+        self.path = path
+        self._segment = _Segment.open(path, byte_limit)
+        # Keep these small so that the largest values don't
+        # evict everything else.
+        self.value_limit = min(value_limit, self._segment.data_size // 8)
+        self.hits = self.misses = self.sets = 0
+
+    def new_instance(self):
+        # Like the LocalClient, we're shared.
+        return self
+
+    def release(self):
+        "Does nothing; the memory map is shared."
+
+    def close(self):
+        if self._segment is not None:
+            self._segment.release()
+            self._segment = None
+
+    def flush_all(self):
+        self._segment.clear()
+
+    def __contains__(self, oid_tid):
+        oid, tid = oid_tid
+        if tid is None:
+            return False
+        return self._segment.contains(oid, tid)
+
+    def __getitem__(self, oid_tid):
+        oid, tid = oid_tid
+        if tid is None:
+            # Wildcards need more information; see get_current().
+            return None
+        return self._count(self._segment.get(oid, tid))
+
+    def get(self, oid_tid, peek=False): # pylint:disable=unused-argument
+        return self[oid_tid]
+
+    def get_current(self, oid, complete_since_tid, highest_visible_tid):
+        """
+        Find a state for *oid* that is current for a viewer whose
+        index is complete after *complete_since_tid*.
+
+        Such a viewer knows about every change made after that TID,
+        so a state that was the current state as-of that TID (or
+        later) and is not from the viewer's future can be used.
+        """
+        if complete_since_tid is None:
+            return None
+        return self._count(self._segment.get(oid, None, complete_since_tid, highest_visible_tid))
+
+    def _count(self, result):
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def store_current(self, oid, state, tid, verified_tid):
+        """
+        Store the *state* of *oid* as-of *tid*, known to still be
+        current as-of *verified_tid*.
+        """
+        if state is not None and len(state) > self.value_limit:
+            return
+        if self._segment.store(oid, state, tid, verified_tid):
+            self.sets += 1
+
+    def __setitem__(self, oid_tid, state_bytes_tid):
+        state, tid = state_bytes_tid
+        self.store_current(oid_tid[0], state, tid, tid)
+
+    def __delitem__(self, oid_tid):
+        self._segment.delete(*oid_tid)
+
+    def set_all_for_tid(self, tid_int, state_oid_iter):
+        for state, oid_int, _ in state_oid_iter:
+            self.store_current(oid_int, state, tid_int, tid_int)
+
+    def updating_delta_map(self, deltas):
+        return deltas
+
+    def invalidate_all(self, oids):
+        delete = self._segment.delete
+        for oid in oids:
+            delete(oid)
+
+    def stats(self):
+        stats = self._segment.stats()
+        stats.update({
+            'hits': self.hits,
+            'misses': self.misses,
+            'sets': self.sets,
+        })
+        return stats
@@ -0,0 +1,244 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""
+Replay a RelStorage cache trace against the local cache with
+different settings, and report how each would have done.
+
+Every combination of the given cache sizes, compression codecs and
+generation splits is simulated, using several processes.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import gzip
+import itertools
+import os
+import pickle
+import random
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from relstorage.options import Options
+
+_HEADER = struct.Struct(">iiH8s8s")
+_U64 = struct.Struct(">Q")
+
+# The trace codes we replay; see ZEOTracer and TracingStateCache.
+_LOAD_MISS = 0x20
+_LOAD_HIT = 0x22
+_STORE = 0x52
+
+#: The generation split used when none is given; the local cache's
+#: default.
+DEFAULT_SPLIT = (0.1, 0.8, 0.1)
+
+
+def read_trace(filename):
+    """
+    Return a list of ``(code, oid_int, tid_int, dlen)`` tuples for
+    the loads and stores in the ZEO format trace file *filename*,
+    which may be gzipped.
+    """
+    opener = gzip.open if filename.endswith('.gz') else open
+    records = []
+    with opener(filename, 'rb') as f:
+        read = f.read
+        unpack = _HEADER.unpack
+        header_size = _HEADER.size
+        while True:
+            header = read(header_size)
+            if len(header) < header_size:
+                break
+            _, encoded, oidlen, tid, _ = unpack(header)
+            oid = read(oidlen)
+            code = encoded & 0x7e
+            if code not in (_LOAD_MISS, _LOAD_HIT, _STORE) or len(oid) != 8:
+                continue
+            records.append((
+                code,
+                _U64.unpack(oid)[0],
+                _U64.unpack(tid)[0],
+                encoded >> 8,
+            ))
+    return records
+
+
+def _pickle_like_data(size):
+    # Object states to store. Their contents matter to the
+    # compression codecs, so rather than use a single repeated byte
+    # we pickle some plausible, partly random, data.
+    rnd = random.Random(size)
+    chunks = []
+    length = 0
+    while length < size:
+        chunk = pickle.dumps({
+            'title': 'Object %d' % rnd.randrange(1 << 20),
+            'counts': [rnd.randrange(1000) for _ in range(16)],
+            'ratio': rnd.random(),
+            'tags': ('a', 'b', rnd.choice(('c', 'd', 'e'))),
+        }, 3)
+        chunks.append(chunk)
+        length += len(chunk)
+    return b''.join(chunks)
+
+
+def parse_split(value):
+    """
+    Parse a generation split like ``10/80/10`` (the percentage of the
+    cache for the eden, protected and probation generations) into
+    fractions.
+    """
+    try:
+        parts = [float(x) for x in value.split('/')]
+    except ValueError:
+        parts = ()
+    if len(parts) != 3 or min(parts) < 0 or not sum(parts):
+        raise argparse.ArgumentTypeError(
+            "Expected three percentages like 10/80/10, not %r" % (value,))
+    total = sum(parts)
+    return tuple(x / total for x in parts)
+
+
+def simulate(records, cache_local_mb, codec='none', split=DEFAULT_SPLIT):
+    """
+    Replay *records* (from :func:`read_trace`) against a new
+    :class:`~relstorage.cache.local_client.LocalClient` and return a
+    dictionary of statistics.
+
+    Each load that misses is counted as a database round trip; the
+    store that follows it in the trace fills the cache.
+    """
+    # pylint:disable=too-many-locals,protected-access
+    from relstorage.cache.local_client import LocalClient
+
+    options = Options(
+        cache_local_mb=cache_local_mb,
+        cache_local_compression=codec,
+    )
+    client = LocalClient(options)
+    eden, protected, probation = split
+    client._gen_eden_pct = eden
+    client._gen_protected_pct = protected
+    client._gen_probation_pct = probation
+    limit = client.limit
+    client._cache.resize(limit * eden, limit * protected, limit * probation)
+
+    data = _pickle_like_data(max([r[3] for r in records] or [0]))
+    current_tids = {}
+    loads = hits = stored_bytes = 0
+    begin = time.time()
+    for code, oid, tid, dlen in records:
+        if code == _STORE:
+            current_tids[oid] = tid
+            client[(oid, tid)] = (data[:dlen], tid)
+            stored_bytes += dlen
+            continue
+        loads += 1
+        if client.get((oid, tid or current_tids.get(oid))) is not None:
+            hits += 1
+    end = time.time()
+
+    return {
+        'cache_local_mb': cache_local_mb,
+        'codec': codec,
+        'split': split,
+        'loads': loads,
+        'hits': hits,
+        'ratio': hits / loads if loads else 0,
+        'round_trips': loads - hits,
+        'stored_bytes': stored_bytes,
+        'bytes': client.size,
+        'len': len(client),
+        'time': end - begin,
+    }
+
+
+_records = None
+
+def _init_worker(filename):
+    global _records # pylint:disable=global-statement
+    _records = read_trace(filename)
+
+def _simulate_in_worker(args):
+    return simulate(_records, *args)
+
+
+def _format_split(split):
+    return '/'.join('%d' % round(x * 100) for x in split)
+
+
+def report(results, out=None):
+    out = out if out is not None else sys.stdout
+    fmt = "{:>8} {:>6} {:>9} {:>10} {:>10} {:>7} {:>11} {:>10} {:>7}"
+    print(fmt.format("Size MB", "Codec", "Split", "Loads", "Hits",
+                     "Hit %", "Round trips", "Bytes", "Time"), file=out)
+    for r in results:
+        print(fmt.format(
+            r['cache_local_mb'], r['codec'], _format_split(r['split']),
+            r['loads'], r['hits'], '%.1f' % (r['ratio'] * 100),
+            r['round_trips'], r['bytes'], '%.2f' % r['time'],
+        ), file=out)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-s", "--size", dest="sizes", type=int, action="append",
+        help="A value for cache-local-mb to simulate. May be given more than once. "
+        "(default: 10)",
+    )
+    parser.add_argument(
+        "-c", "--codec", dest="codecs", action="append",
+        choices=('none', 'zlib', 'bz2', 'lz4', 'zstd'),
+        help="A value for cache-local-compression to simulate. May be given "
+        "more than once. (default: none)",
+    )
+    parser.add_argument(
+        "-g", "--split", dest="splits", type=parse_split, action="append",
+        help="Percentages of the cache for the eden, protected and probation "
+        "generations, like 10/80/10. May be given more than once. "
+        "(default: 10/80/10)",
+    )
+    parser.add_argument(
+        "-j", "--jobs", dest="jobs", type=int, default=os.cpu_count() or 1,
+        help="How many simulations to run at once (default: %(default)s).",
+    )
+    parser.add_argument("trace_file")
+    options = parser.parse_args(argv[1:])
+
+    matrix = list(itertools.product(
+        options.sizes or [10],
+        options.codecs or ['none'],
+        options.splits or [DEFAULT_SPLIT],
+    ))
+    if options.jobs <= 1 or len(matrix) == 1:
+        records = read_trace(options.trace_file)
+        results = [simulate(records, *args) for args in matrix]
+    else:
+        with ProcessPoolExecutor(min(options.jobs, len(matrix)),
+                                 initializer=_init_worker,
+                                 initargs=(options.trace_file,)) as pool:
+            results = list(pool.map(_simulate_in_worker, matrix))
+    report(results)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -23,6 +23,7 @@ import threading
 
 from persistent.timestamp import TimeStamp
 from ZODB.POSException import ReadConflictError
+from ZODB.serialize import referencesf
 from ZODB.utils import p64
 from zope import interface
 
@@ -38,10 +39,12 @@ from relstorage.cache.interfaces import IPersistentCache
 from relstorage.cache.interfaces import CacheConsistencyError
 from relstorage.cache.local_client import LocalClient
 from relstorage.cache.memcache_client import MemcacheStateCache
-from relstorage.cache.trace import ZEOTracer
+from relstorage.cache.shared_memory import SharedMemoryStateCache
+from relstorage.cache.trace import tracer_for_file
 from relstorage.cache._statecache_wrappers import MultiStateCache
 from relstorage.cache._statecache_wrappers import TracingStateCache
 from relstorage.cache.mvcc import MVCCDatabaseCoordinator
+from relstorage.cache._coaccess import CoAccessTable
 
 logger = log = logging.getLogger(__name__)
 
@@ -51,7 +54,7 @@ class _UsedAfterRelease(object):
         return 0
     def __call__(self):
         raise NotImplementedError
-    close = reset_stats = release = unregister = lambda self, *args: None
+    close = reset_stats = release = unregister = stop_background_poll = lambda self, *args: None
     stats = lambda s: {}
     new_instance = lambda s: s
 _UsedAfterRelease = _UsedAfterRelease()
@@ -74,11 +77,21 @@ class StorageCache(DetachableMVCCDatabaseViewer):
         'prefix',
         'polling_state',
         'local_client',
+        'shared_memory_cache',
         'cache',
         'object_index',
+        'coaccess',
+        '_loaded_oids',
     )
 
 
+    #: The TID we record, in both the object index and the local
+    #: cache, for an object that has no state at all (it doesn't
+    #: exist yet, or it has been removed). Real TIDs are always
+    #: greater than this. Such entries are invalidated just like any
+    #: other when the object is created.
+    NO_STATE_TID = 0
+
     if IN_TESTRUNNER:
         class MVCCInternalConsistencyError(Exception):
             "This can never be raised or caught."
@@ -100,23 +113,34 @@ class StorageCache(DetachableMVCCDatabaseViewer):
             # polling.
             self.polling_state = MVCCDatabaseCoordinator(self.options)
             self.local_client = LocalClient(options, self.prefix)
+            self.cache = self.local_client
 
+            # This is shared between processes, and can be None.
+            self.shared_memory_cache = SharedMemoryStateCache.from_options(options, self.prefix)
+            if self.shared_memory_cache is not None:
+                self.cache = MultiStateCache(self.cache, self.shared_memory_cache)
 
             shared_cache = MemcacheStateCache.from_options(options, self.prefix)
             if shared_cache is not None:
-                self.cache = MultiStateCache(self.local_client, shared_cache)
-            else:
-                self.cache = self.local_client
+                self.cache = MultiStateCache(self.cache, shared_cache)
+
+            # Learned from all instances, so shared.
+            self.coaccess = CoAccessTable() if options.cache_prefetch_coaccess else None
 
             tracefile = persistence.trace_file(options, self.prefix)
             if tracefile:
-                tracer = ZEOTracer(tracefile)
+                tracer = tracer_for_file(tracefile)
                 tracer.trace(0x00)
                 self.cache = TracingStateCache(self.cache, tracer)
         else:
             self.polling_state = _parent.polling_state # type: MVCCDatabaseCoordinator
             self.local_client = _parent.local_client.new_instance()
+            self.shared_memory_cache = _parent.shared_memory_cache
             self.cache = _parent.cache.new_instance()
+            self.coaccess = _parent.coaccess
+
+        # The OIDs loaded since we last polled, to teach self.coaccess.
+        self._loaded_oids = []
 
         # Once we have registered with the MVCCDatabaseCoordinator,
         # we cannot make any changes to our own mvcc state without
@@ -135,6 +159,7 @@ class StorageCache(DetachableMVCCDatabaseViewer):
 
         if _parent is None:
             self.restore()
+            self.polling_state.start_background_poll(self.adapter, self.local_client)
 
 
     @property
@@ -166,6 +191,8 @@ class StorageCache(DetachableMVCCDatabaseViewer):
         stats = self.local_client.stats()
         stats['local_index_stats'] = self.object_index.stats() if self.object_index else None
         stats['global_index_stats'] = self.polling_state.stats()
+        if self.shared_memory_cache is not None:
+            stats['shared_memory_stats'] = self.shared_memory_cache.stats()
         return stats
 
     def __repr__(self):
@@ -210,8 +237,11 @@ class StorageCache(DetachableMVCCDatabaseViewer):
         # Release our clients. If we had a non-shared local cache,
         # this will also allow it to release any memory it's holding.
         self.local_client = self.cache = _UsedAfterRelease
+        self.shared_memory_cache = None
         self.polling_state.unregister(self)
         self.polling_state = _UsedAfterRelease
+        self.coaccess = None
+        self._loaded_oids = []
         self.object_index = None
         self.highest_visible_tid = None
 
@@ -226,19 +256,31 @@ class StorageCache(DetachableMVCCDatabaseViewer):
         # grab things that will be reset in release()
         cache = self.cache
         polling_state = self.polling_state
+        shared_memory_cache = self.shared_memory_cache
 
         # Go ahead and release our polling_state now, in case
-        # it helps to vacuum for save.
+        # it helps to vacuum for save. The background poller must
+        # not change it while we save.
+        polling_state.stop_background_poll()
         self.polling_state.unregister(self)
         self.save(**save_args)
         self.release()
         cache.close()
+        if shared_memory_cache is not None:
+            # Releasing the cache dropped it from ``cache``, so
+            # it has to be closed directly to give up the segment.
+            shared_memory_cache.close()
         polling_state.close()
 
     def save(self, **save_args):
         """
         Store any persistent client data.
         """
+        if self.options.cache_local_dir and self.coaccess:
+            try:
+                self.coaccess.save(persistence.coaccess_file(self.options, self.prefix))
+            except OSError:
+                logger.exception("Failed to save the co-access table")
         if self.options.cache_local_dir and len(self) > 0: # pylint:disable=len-as-condition
             # (our __bool__ is not consistent with our len)
             stats = self.local_client.stats()
@@ -256,7 +298,12 @@ class StorageCache(DetachableMVCCDatabaseViewer):
         # We must only restore into an empty cache.
         state = self.polling_state
         assert not self.local_client
-        state.restore(self.adapter, self.local_client)
+        if self.options.cache_local_restore_in_background:
+            state.restore_in_background(self.adapter, self.local_client)
+        else:
+            state.restore(self.adapter, self.local_client)
+        if self.options.cache_local_dir and self.coaccess is not None:
+            self.coaccess.load(persistence.coaccess_file(self.options, self.prefix))
 
     def _reset(self, message=None):
         """
@@ -302,6 +349,15 @@ class StorageCache(DetachableMVCCDatabaseViewer):
         persistent cache files on disk.
         """
         self.local_client.zap_all()
+        if self.options.cache_local_dir and self.options.cache_local_object_index:
+            try:
+                os.remove(persistence.object_index_file(self.options, self.prefix))
+            except OSError:
+                pass
+        if self.coaccess is not None:
+            self.coaccess.clear()
+            if self.options.cache_local_dir:
+                self.coaccess.save(persistence.coaccess_file(self.options, self.prefix))
         self.clear(load_persistent=False)
 
     def _check_tid_after_load(self, oid_int, actual_tid_int,
@@ -417,7 +473,11 @@ class StorageCache(DetachableMVCCDatabaseViewer):
 
         Fall back to loading from the database.
 
-        Returns (state_bytes, tid_int).
+        Returns (state_bytes, tid_int). If the object has no state,
+        returns ``(None, None)`` (or an empty state and its TID, if its
+        creation was undone or it was deleted) when that was
+        determined by asking the database, or ``(None, NO_STATE_TID)``
+        when that was already known from the cache.
         """
         # pylint:disable=too-many-statements,too-many-branches,too-many-locals
         if not self.object_index:
@@ -439,6 +499,9 @@ class StorageCache(DetachableMVCCDatabaseViewer):
         # internally in the clients.
 
 
+        if self.coaccess is not None and len(self._loaded_oids) < CoAccessTable.max_sequence:
+            self._loaded_oids.append(oid_int)
+
         cache = self.cache
         index = self.object_index
         indexed_tid_int = index[oid_int] # Could be None pylint:disable=unsubscriptable-object
@@ -452,8 +515,26 @@ class StorageCache(DetachableMVCCDatabaseViewer):
 
         if cache_data:
             # Cache hit, non-wildcard or wildcard matched.
+            if cache_data[1] == self.NO_STATE_TID or not cache_data[0]:
+                # We already know there's nothing to load: there's
+                # no row, or its creation was undone, or it was deleted.
+                return None, self.NO_STATE_TID
             return cache_data
 
+        shared_memory_cache = self.shared_memory_cache
+        if shared_memory_cache is not None and indexed_tid_int is None:
+            # Another process may have found the current state
+            # of an object we have no index entry for.
+            cache_data = shared_memory_cache.get_current(
+                oid_int,
+                index.complete_since_tid,
+                self.highest_visible_tid)
+            if cache_data:
+                actual_tid_int = cache_data[1]
+                index[oid_int] = actual_tid_int # pylint:disable=unsupported-assignment-operation
+                self.local_client[(oid_int, actual_tid_int)] = cache_data
+                return cache_data if cache_data[0] else (None, self.NO_STATE_TID)
+
         # Cache miss.
         state, actual_tid_int = self.adapter.mover.load_current(
             cursor, oid_int)
@@ -465,11 +546,85 @@ class StorageCache(DetachableMVCCDatabaseViewer):
             # Eventually this will age to be frozen again if needed.
             index[oid_int] = actual_tid_int # pylint:disable=unsupported-assignment-operation
             cache[(oid_int, actual_tid_int)] = (state, actual_tid_int)
+            if shared_memory_cache is not None:
+                # Let other processes know this is current as-of our view.
+                shared_memory_cache.store_current(
+                    oid_int, state, actual_tid_int, self.highest_visible_tid)
+            if state and self.options.cache_prefetch_depth:
+                self._prefetch_references(cursor, state)
+            if self.coaccess is not None:
+                successors = self.coaccess.successors(oid_int)
+                if successors:
+                    self.prefetch(cursor, successors)
             return state, actual_tid_int
 
+        if not indexed_tid_int and self.options.cache_local_negative:
+            # There's no row for the object. Remember that until
+            # someone creates it, at which point polling will find it
+            # and the index and cache entries will be replaced as usual.
+            # This only goes in the local cache.
+            index[oid_int] = self.NO_STATE_TID # pylint:disable=unsupported-assignment-operation
+            self.local_client[(oid_int, self.NO_STATE_TID)] = (None, self.NO_STATE_TID)
+
         # This is in the bytecode as a LOAD_CONST
         return None, None
 
+    def load_many(self, cursor, oid_ints):
+        """
+        Like :meth:`load`, but for many objects at once.
+
+        Returns a dictionary mapping each OID in *oid_ints* to a
+        ``(state_bytes, tid_int)`` pair, as :meth:`load` would return.
+        Those that can't be found in the cache are loaded with a single
+        query, and checked just as :meth:`load` does.
+        """
+        if not self.object_index:
+            # No poll has occurred yet; as for load(), don't use the cache.
+            result = dict.fromkeys(oid_ints, (None, None))
+            for oid_int, state, tid_int in self.adapter.mover.load_currents(cursor, list(result)):
+                result[oid_int] = (state, tid_int)
+            return result
+
+        cache = self.cache
+        index = self.object_index
+        highest_visible_tid = self.highest_visible_tid
+        result = {}
+        to_fetch = {}
+        for oid_int in oid_ints:
+            indexed_tid_int = index[oid_int] # pylint:disable=unsubscriptable-object
+            cache_data = cache[(oid_int, indexed_tid_int)]
+            if cache_data and indexed_tid_int is None and cache_data[1] > highest_visible_tid:
+                cache_data = None
+            if not cache_data:
+                to_fetch[oid_int] = indexed_tid_int
+            elif cache_data[1] == self.NO_STATE_TID or not cache_data[0]:
+                result[oid_int] = (None, self.NO_STATE_TID)
+            else:
+                result[oid_int] = cache_data
+
+        if not to_fetch:
+            return result
+
+        shared_memory_cache = self.shared_memory_cache
+        for oid_int, state, actual_tid_int in self.adapter.mover.load_currents(cursor, to_fetch):
+            self._check_tid_after_load(oid_int, actual_tid_int, to_fetch[oid_int], cursor)
+            index[oid_int] = actual_tid_int # pylint:disable=unsupported-assignment-operation
+            cache[(oid_int, actual_tid_int)] = (state, actual_tid_int)
+            if shared_memory_cache is not None:
+                shared_memory_cache.store_current(
+                    oid_int, state, actual_tid_int, highest_visible_tid)
+            result[oid_int] = (state, actual_tid_int)
+
+        remember_missing = self.options.cache_local_negative
+        for oid_int, indexed_tid_int in to_fetch.items():
+            if oid_int in result:
+                continue
+            result[oid_int] = (None, None)
+            if not indexed_tid_int and remember_missing:
+                index[oid_int] = self.NO_STATE_TID # pylint:disable=unsupported-assignment-operation
+                self.local_client[(oid_int, self.NO_STATE_TID)] = (None, self.NO_STATE_TID)
+        return result
+
     def prefetch(self, cursor, oid_ints):
         # Just like load(), but we only fetch the OIDs
         # we can't find in the cache.
@@ -503,6 +658,56 @@ class StorageCache(DetachableMVCCDatabaseViewer):
             cache[key] = (state, tid_int)
             index[oid] = tid_int # pylint:disable=unsupported-assignment-operation
 
+    def _prefetch_references(self, cursor, state):
+        """
+        Having missed the cache for *state*, speculatively load the
+        objects it refers to that aren't cached, and the objects
+        they refer to, and so on, up to ``cache-prefetch-depth``
+        levels, using one query per level.
+
+        We stop early once ``cache-prefetch-max-kb`` of pickles have
+        been loaded.
+        """
+        cache = self.cache
+        if cache is self.local_client and not cache.limit:
+            return
+
+        index = self.object_index
+        budget = self.options.cache_prefetch_max_kb * 1024
+        seen = set()
+        states = [state]
+        for _ in range(self.options.cache_prefetch_depth):
+            to_fetch = set()
+            for referring_state in states:
+                try:
+                    oids = referencesf(referring_state)
+                except Exception: # pylint:disable=broad-except
+                    # Not a pickle we understand (e.g., compressed by
+                    # zc.zlibstorage). The application will load what
+                    # it needs as usual.
+                    continue
+                for oid in oids:
+                    oid_int = bytes8_to_int64(oid)
+                    if oid_int in seen:
+                        continue
+                    seen.add(oid_int)
+                    # As for prefetch(), don't disturb the stats or LRU.
+                    if (oid_int, index[oid_int]) not in cache: # pylint:disable=unsubscriptable-object
+                        to_fetch.add(oid_int)
+            if not to_fetch:
+                break
+
+            states = []
+            for oid, fetched_state, tid_int in self.adapter.mover.load_currents(cursor, to_fetch):
+                self._check_tid_after_load(oid, tid_int, cursor=cursor)
+                cache[(oid, tid_int)] = (fetched_state, tid_int)
+                index[oid] = tid_int # pylint:disable=unsupported-assignment-operation
+                if fetched_state:
+                    states.append(fetched_state)
+                    budget -= len(fetched_state)
+            if budget <= 0:
+                break
+
     def prefetch_for_conflicts(self, cursor, oid_tid_pairs):
         results = {}
         to_fetch = OidTMap()
@@ -575,6 +780,10 @@ class StorageCache(DetachableMVCCDatabaseViewer):
         self.cache.set_all_for_tid(tid_int, temp_storage)
 
     def poll(self, conn, cursor, ignore_tid):
+        # A new transaction; learn from what the last one loaded.
+        if self._loaded_oids:
+            self.coaccess.learn(self._loaded_oids)
+            self._loaded_oids = []
         try:
             changes = self.polling_state.poll(self, conn, cursor)
         except self.MVCCInternalConsistencyError: # pragma: no cover
@@ -446,7 +446,8 @@ def local_benchmark(runner):
     #     print("Hit ratio", client.stats()['ratio'])
 
     groups = {}
-    for name in ('',):
+    for name in ('', 'sharded'):
+        options.cache_local_shards = 8 if name else 1
         benchmarks = run_and_report_funcs(
             runner,
             (
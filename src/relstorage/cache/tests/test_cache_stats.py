@@ -64,6 +64,9 @@ def cache_run(name, size): # pylint:disable=too-many-locals
     options.cache_local_mb = size * (1<<20)
     options.cache_local_dir = '.'
     options.cache_local_compression = 'zlib'
+    # Objects that miss are stored without polling, which
+    # real objects can never do, so we can't remember misses.
+    options.cache_local_negative = False
     # We can interleave between instances
     adapter = MockAdapter()
     poller = adapter.poller
@@ -0,0 +1,102 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+
+from relstorage.tests import TestCase
+
+from relstorage.cache._coaccess import CoAccessTable
+
+
+class TestCoAccessTable(TestCase):
+
+    def _makeOne(self, **kwargs):
+        table = CoAccessTable()
+        for k, v in kwargs.items():
+            setattr(table, k, v)
+        return table
+
+    def test_successors(self):
+        table = self._makeOne(window=2)
+        table.learn([1, 2, 3, 4])
+        # Seen once isn't enough.
+        self.assertEqual(table.successors(1), [])
+        table.learn([1, 2, 3, 4])
+        table.learn([1, 3])
+        self.assertEqual(table.successors(1), [3, 2])
+        self.assertEqual(table.successors(3), [4])
+        self.assertEqual(table.successors(4), [])
+        self.assertEqual(len(table), 3)
+
+    def test_repeats_ignored(self):
+        table = self._makeOne(min_count=1)
+        table.learn([1, 1, 1])
+        self.assertEqual(len(table), 0)
+
+    def test_bounded(self):
+        table = self._makeOne(max_objects=2, max_successors=2, min_count=1, window=10)
+        table.learn([1, 2, 3, 4, 5, 6])
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.successors(4), [6, 5])
+        table.learn([1, 6, 6])
+        # Only the most recently seen objects are kept.
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.successors(4), [])
+        self.assertEqual(table.successors(1), [6])
+        self.assertEqual(table.successors(5), [6])
+
+    def test_save_and_load(self):
+        temp_dir = tempfile.mkdtemp('.rstest_coaccess')
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+        path = os.path.join(temp_dir, 'table')
+        table = self._makeOne(min_count=1)
+        table.load(path)
+        table.learn([1, 2, 3])
+        table.save(path)
+
+        table = self._makeOne(min_count=1)
+        table.load(path)
+        self.assertEqual(table.successors(1), [3, 2])
+        self.assertEqual(table.successors(2), [3])
+
+        with open(path, 'wb') as f:
+            f.write(b'garbage')
+        table = self._makeOne()
+        table.load(path)
+        self.assertEqual(len(table), 0)
+
+    def test_concurrent_saves(self):
+        from relstorage.cache.persistence import replacing_file
+        temp_dir = tempfile.mkdtemp('.rstest_coaccess')
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+        path = os.path.join(temp_dir, 'table')
+        table = self._makeOne(min_count=1)
+        table.learn([1, 2])
+        # Another process is part way through saving...
+        with replacing_file(path) as other:
+            other.write(b'partial')
+            # ...when we save. We don't write into its file.
+            table.save(path)
+            loaded = self._makeOne(min_count=1)
+            loaded.load(path)
+            self.assertEqual(loaded.successors(1), [2])
+            other.write(b' table')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'partial table')
+        self.assertEqual(os.listdir(temp_dir), ['table'])
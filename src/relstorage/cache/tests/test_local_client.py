@@ -257,6 +257,307 @@ class LocalClientOIDTests(AbstractStateCacheTests):
         self.assertEqual(c[self.key], self.value)
         self.assertEqual(c[self.missing_key], None)
 
+    def test_get_buffer(self):
+        c = self._makeOne()
+        c[self.key] = self.value
+        # Plain gets are always bytes.
+        self.assertIsInstance(c[self.key][0], bytes)
+        state, tid = c.get_buffer(self.key)
+        self.assertIsInstance(state, memoryview)
+        self.assertTrue(state.readonly)
+        self.assertEqual(state, self.value[0])
+        self.assertEqual(tid, self.tid)
+        self.assertIsNone(c.get_buffer(self.missing_key))
+        # The view pins the data even after it leaves the cache.
+        c.invalidate_all((self.oid,))
+        self.assertIsNone(c[self.key])
+        self.assertEqual(state.tobytes(), self.value[0])
+
+    def test_get_buffer_compressed(self):
+        c = self._makeOne(cache_local_compression='zlib')
+        value = (b'statebytes' * 100, self.tid)
+        c[self.key] = value
+        self.assertEqual(c.get_buffer(self.key), value)
+
+    def test_frequency_sketch_does_not_age(self):
+        c = self._makeOne(cache_local_frequency_sketch=True)
+        self.assertTrue(c._cache.uses_frequency_sketch)
+        c[self.key] = self.value
+        self.assertIsNone(c._age())
+        # Flushing keeps the setting.
+        c.flush_all()
+        self.assertTrue(c._cache.uses_frequency_sketch)
+
+    def test_dedup(self):
+        from relstorage._compat import PYPY
+        for shards in (1, 2):
+            c = self._makeOne(cache_local_dedup=True, cache_local_shards=shards)
+            if PYPY:
+                self.assertFalse(c._cache.shares_states)
+                continue
+            self.assertTrue(c._cache.shares_states)
+            c[(0, 1)] = (b'state' * 10, 1)
+            c[(1, 1)] = (b'state' * 10, 1)
+            c[(2, 1)] = (b'other' * 10, 1)
+            self.assertEqual(c._cache.distinct_state_count, 2 if shards == 1 else 3)
+            self.assertEqual(c[(1, 1)], (b'state' * 10, 1))
+            # Flushing keeps the setting.
+            c.flush_all()
+            self.assertTrue(c._cache.shares_states)
+
+    def test_adaptive_generations(self):
+        c = self._makeOne(cache_local_adaptive_generations=True)
+        stats = c.stats()
+        self.assertEqual(stats['eden_pct'], 0.1)
+        self.assertEqual(stats['protected_pct'], 0.8)
+        self.assertEqual(stats['probation_pct'], 0.1)
+        # Not enough operations to climb yet.
+        self.assertIsNone(c._climb())
+
+        # A sample of all hits is an improvement; we begin by
+        # shrinking eden.
+        c[self.key] = self.value
+        for _ in range(c._climb_min_sample):
+            _ = c[self.key]
+        eden_pct = c._climb()
+        self.assertAlmostEqual(eden_pct, 0.1 - c._climb_step_pct)
+        stats = c.stats()
+        self.assertEqual(stats['eden_pct'], eden_pct)
+        self.assertAlmostEqual(
+            stats['eden_pct'] + stats['protected_pct'] + stats['probation_pct'],
+            1.0)
+        self.assertAlmostEqual(stats['protected_pct'] / stats['probation_pct'], 8)
+        self.assertAlmostEqual(c._cache.eden.limit, c.limit * eden_pct, delta=1)
+        self.assertAlmostEqual(c._cache.protected.limit, c.limit * stats['protected_pct'],
+                               delta=1)
+
+        # A sample of all misses is worse, so we reverse.
+        for _ in range(c._climb_min_sample):
+            _ = c[self.missing_key]
+        self.assertAlmostEqual(c._climb(), 0.1)
+
+        # The next sample is taken after as many more operations.
+        self.assertEqual(c._next_climb_at, c._climb_min_sample * 3)
+
+    def test_generations_static_by_default(self):
+        c = self._makeOne()
+        c[self.key] = self.value
+        for _ in range(c._climb_min_sample * 2):
+            _ = c[self.missing_key]
+        c[self.key] = self.value
+        self.assertEqual(c.stats()['eden_pct'], 0.1)
+
+    def test_memory_limit(self):
+        c = self._makeOne(cache_local_memory_limit_mb=2)
+        memory = c._memory
+        self.assertIsNotNone(memory)
+        self.assertEqual(memory.memory_limit, 2000000)
+        self.assertEqual(memory.max_cache_limit, 1000000)
+        usage = [1500000]
+        memory.get_usage = lambda: usage[0]
+
+        state = b'x' * 1000
+        for oid in range(1, 801):
+            c[(oid, 1)] = (state, 1)
+        self.assertEqual(len(c), 800)
+        weight = c.size
+        # Plenty of headroom, and we're already at the maximum.
+        self.assertEqual(c._check_memory(), 1000000)
+
+        # Using too much shrinks what's actually in the cache by the excess.
+        usage[0] = 2300000
+        limit = c._check_memory()
+        self.assertEqual(limit, weight - 300000)
+        self.assertEqual(c.stats()['limit'], limit)
+        self.assertLessEqual(c.size, limit)
+        self.assertLess(len(c), 800)
+        # The newest objects are in eden, and went first, followed by
+        # the least recently used in protected (probation is empty).
+        self.assertIsNone(c[(800, 1)])
+        self.assertIsNone(c[(1, 1)])
+        self.assertEqual(c[(700, 1)], (state, 1))
+
+        # But never too much.
+        usage[0] = 20000000
+        self.assertEqual(c._check_memory(), 100000)
+        self.assertLessEqual(c.size, 100000)
+
+        # Headroom lets it grow back, gradually.
+        usage[0] = 1000000
+        self.assertEqual(c._check_memory(), 100000 + 400000)
+        self.assertEqual(c._check_memory(), 500000 + 400000)
+        self.assertEqual(c._check_memory(), 1000000)
+
+    def test_memory_limit_checked_on_set(self):
+        c = self._makeOne(cache_local_memory_limit_mb=2)
+        c._memory.get_usage = lambda: 20000000
+        self.assertEqual(c._next_memory_check_at, c._memory_check_interval)
+        for oid in range(1, c._memory_check_interval + 2):
+            c[(oid, 1)] = (b'abc', 1)
+        self.assertEqual(c.limit, 100000)
+        self.assertEqual(c._next_memory_check_at, c._cache.sets + c._memory_check_interval)
+
+    def test_miss_ratio_curve(self):
+        c = self._makeOne(cache_local_mrc_sample_rate=1.0)
+        self.assertNotIn('estimated_hit_ratios', self._makeOne().stats())
+        state = b'x' * 9000
+        for oid in range(1, 81):
+            c[(oid, 1)] = (state, 1)
+        # 80 objects, accessed round-robin, five times.
+        for _ in range(5):
+            for oid in range(1, 81):
+                c.get((oid, 1))
+        # Peeking isn't an access.
+        c.get((1, 1), peek=True)
+        stats = c.stats()
+        self.assertEqual(stats['mrc_sample_rate'], 1.0)
+        ratios = stats['estimated_hit_ratios']
+        self.assertEqual(sorted(ratios), [0.25, 0.5, 1, 2, 4, 8])
+        # An LRU cache too small for all of them never hits...
+        self.assertEqual(ratios[0.5], 0)
+        # ... but one big enough always does, after the first time.
+        self.assertEqual(ratios[1], 0.8)
+
+    def test_memory_limit_disabled_by_default(self):
+        c = self._makeOne()
+        self.assertIsNone(c._memory)
+        self.assertEqual(c._next_memory_check_at, float('inf'))
+
+    def _check_zstd(self):
+        from relstorage.cache._zstd_codec import ZstdCodec
+        if not ZstdCodec.available:
+            self.skipTest("zstandard not installed")
+
+    def _zstd_states(self, count):
+        import pickle
+        return [
+            pickle.dumps({'name': 'object %d' % i, 'value': i, 'items': list(range(i % 10))}, 3)
+            for i in range(count)
+        ]
+
+    def test_set_and_get_string_zstd(self):
+        self._check_zstd()
+        c = self._makeOne(cache_local_compression='zstd')
+        value = (b'statebytes' * 100, self.tid)
+        c[self.key] = value
+        self.assertEqual(c[self.key], value)
+        self.assertEqual(bytes(c._cache.peek(self.oid).state[:2]), b'.s')
+
+    def test_zstd_unavailable(self):
+        from unittest import mock
+        from relstorage.cache._zstd_codec import ZstdCodec
+        with mock.patch.object(ZstdCodec, 'available', False):
+            with self.assertRaises(ValueError):
+                self._makeOne(cache_local_compression='zstd')
+            c = self._makeOne()
+            self.assertIsNone(c._zstd)
+            # Persistent data we can't decompress isn't used.
+            self.assertFalse(c._can_decompress(b'.Sdata'))
+            self.assertTrue(c._can_decompress(b'.zdata'))
+
+    def test_zstd_dictionary(self):
+        # pylint:disable=too-many-locals
+        import tempfile
+        import shutil
+        self._check_zstd()
+        temp_dir = tempfile.mkdtemp(".rstest_cache")
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+
+        c = self._makeOne(cache_local_compression='zstd',
+                          cache_local_compression_dictionary=True,
+                          cache_local_dir=temp_dir)
+        codec = c._zstd
+        codec.training_sample_count = 500
+        codec.dictionary_size = 4096
+        self.assertTrue(codec.wants_dictionary)
+
+        states = self._zstd_states(1000)
+        for oid, state in enumerate(states[:500]):
+            c[(oid, 1)] = (state, 1)
+        codec.wait_for_training()
+        for oid, state in enumerate(states[500:], 500):
+            c[(oid, 1)] = (state, 1)
+        self.assertIsNotNone(codec.dictionary)
+        self.assertFalse(codec.wants_dictionary)
+        # Trained after sampling, so later states are compressed with it.
+        self.assertEqual(bytes(c._cache.peek(999).state[:2]), b'.S')
+        # (Earlier, small, states didn't compress at all.)
+        self.assertNotEqual(bytes(c._cache.peek(0).state[:2]), b'.S')
+        for oid in (0, 999):
+            self.assertEqual(c[(oid, 1)], (states[oid], 1))
+        self.assertTrue(c.save())
+
+        # A new client loads the dictionary and can decompress
+        # everything.
+        c2 = self._makeOne(cache_local_compression='zstd',
+                           cache_local_compression_dictionary=True,
+                           cache_local_dir=temp_dir)
+        c2.restore()
+        self.assertEqual(c2._zstd.dictionary.dict_id(), codec.dictionary.dict_id())
+        self.assertEqual(c2[(999, 1)], (states[999], 1))
+
+        # One not using compression can still read it.
+        c3 = self._makeOne(cache_local_dir=temp_dir)
+        c3.restore()
+        self.assertIsNone(c3._zstd.dictionary)
+        self.assertEqual(c3[(999, 1)], (states[999], 1))
+
+    def test_zstd_dictionary_trained_in_background(self):
+        import threading
+        from unittest import mock
+        from relstorage.cache import _zstd_codec
+        self._check_zstd()
+        c = self._makeOne(cache_local_compression='zstd',
+                          cache_local_compression_dictionary=True)
+        codec = c._zstd
+        codec.training_sample_count = 500
+        codec.dictionary_size = 4096
+        states = self._zstd_states(501)
+
+        training = threading.Event()
+        may_finish = threading.Event()
+        train_dictionary = _zstd_codec.zstandard.train_dictionary
+        def slow_train(*args):
+            training.set()
+            may_finish.wait(10)
+            return train_dictionary(*args)
+
+        self.addCleanup(codec.wait_for_training)
+        self.addCleanup(may_finish.set)
+        with mock.patch.object(_zstd_codec.zstandard, 'train_dictionary', slow_train):
+            for oid, state in enumerate(states):
+                c[(oid, 1)] = (state, 1)
+            # Storing the sample that started training didn't wait
+            # for it.
+            self.assertTrue(training.wait(10))
+            self.assertIsNone(codec.dictionary)
+            self.assertTrue(codec.wants_dictionary)
+            self.assertNotEqual(bytes(c._cache.peek(500).state[:2]), b'.S')
+            may_finish.set()
+            codec.wait_for_training()
+        self.assertIsNotNone(codec.dictionary)
+        self.assertFalse(codec.wants_dictionary)
+
+    def test_zstd_unknown_dictionary_not_restored(self):
+        self._check_zstd()
+        c = self._makeOne(cache_local_compression='zstd',
+                          cache_local_compression_dictionary=True)
+        c._zstd.training_sample_count = 500
+        c._zstd.dictionary_size = 4096
+        states = self._zstd_states(600)
+        for oid, state in enumerate(states[:500]):
+            c[(oid, 1)] = (state, 1)
+        c._zstd.wait_for_training()
+        for oid, state in enumerate(states[500:], 500):
+            c[(oid, 1)] = (state, 1)
+        compressed = bytes(c._cache.peek(599).state)
+        self.assertEqual(compressed[:2], b'.S')
+
+        c2 = self._makeOne(cache_local_compression='zstd')
+        self.assertFalse(c2._can_decompress(compressed))
+        self.assertTrue(c2._can_decompress(bytes(c._cache.peek(0).state)))
+        self.assertTrue(c2._can_decompress(b'plain'))
+
     def test_set_and_get_object_too_large(self):
         c = self._makeOne(cache_local_compression='none')
         c[self.key] = (b'abcdefgh' * 10000, self.key_tid)
@@ -360,3 +661,304 @@ class LocalClientOIDTests(AbstractStateCacheTests):
 
         # At no point did we spawn extra threads
         self.assertEqual(1, threading.active_count())
+
+    def test_background_save(self):
+        import tempfile
+        import shutil
+
+        temp_dir = tempfile.mkdtemp(".rstest_cache")
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+
+        c = self._makeOne(cache_local_dir=temp_dir,
+                          cache_local_background_save=True)
+        c.restore()
+        self.assertTrue(c.wait_for_save())
+
+        key = (0, 1)
+        val = (b'abc', 1)
+        c[key] = val
+        c.__getitem__(key)
+        self.assertEqual(c.save(), 1)
+        # Changes after the snapshot aren't saved.
+        c[(1, 1)] = (b'def', 1)
+        self.assertTrue(c.wait_for_save(10))
+        self.assertIsNone(c._save_thread)
+
+        c2 = self._makeOne(cache_local_dir=temp_dir)
+        c2.restore()
+        self.assertEqual(c2[key], val)
+        self.assertIsNone(c2[(1, 1)])
+
+        # A save that fails leaves the file as it was.
+        def broken(*args):
+            raise Exception("Interrupted")
+        c.write_to_sqlite = broken
+        c[(2, 1)] = (b'ghi', 1)
+        self.assertEqual(c.save(), 1)
+        self.assertTrue(c.wait_for_save(10))
+
+        c3 = self._makeOne(cache_local_dir=temp_dir)
+        c3.restore()
+        self.assertEqual(c3[key], val)
+        self.assertIsNone(c3[(2, 1)])
+
+    def test_checkpoint(self):
+        import tempfile
+        import shutil
+
+        temp_dir = tempfile.mkdtemp(".rstest_cache")
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+
+        c = self._makeOne(cache_local_dir=temp_dir,
+                          cache_local_checkpoint_interval=60,
+                          cache_local_checkpoint_max_mb=0.000005)
+        c.restore()
+        c[(0, 1)] = (b'abc', 1)
+        c[(1, 1)] = (b'defg', 1)
+        c.__getitem__((1, 1))
+        # Not yet.
+        self.assertFalse(c.checkpoint((1, 1)))
+
+        # Only the most popular fits.
+        c._next_checkpoint_at = 0
+        self.assertTrue(c.checkpoint((1, 1)))
+        self.assertTrue(c.wait_for_save(10))
+        self.assertEqual(list(c._checkpoint_oids), [0])
+        self.assertGreater(c._next_checkpoint_at, 0)
+
+        c2 = self._makeOne(cache_local_dir=temp_dir)
+        self.assertEqual(c2.restore(), (1, 1))
+        self.assertEqual(c2[(1, 1)], (b'defg', 1))
+        self.assertIsNone(c2[(0, 1)])
+
+        # The rest goes in the next one.
+        c._next_checkpoint_at = 0
+        self.assertTrue(c.checkpoint((2, 1)))
+        self.assertTrue(c.wait_for_save(10))
+        self.assertEqual(list(c._checkpoint_oids), [])
+        c2 = self._makeOne(cache_local_dir=temp_dir)
+        self.assertEqual(c2.restore(), (2, 1))
+        self.assertEqual(c2[(0, 1)], (b'abc', 1))
+        self.assertEqual(c2[(1, 1)], (b'defg', 1))
+
+        # Nothing has changed since.
+        c._next_checkpoint_at = 0
+        self.assertFalse(c.checkpoint((3, 1)))
+
+    def test_checkpoint_copies_only_what_fits(self):
+        c = self._makeOne(cache_local_dir=':memory:',
+                          cache_local_checkpoint_interval=60,
+                          cache_local_checkpoint_max_mb=0.000025)
+        copied = []
+
+        class Value(bytes):
+            # A cached value that notes when its state is copied.
+            tid = 1
+            frozen = False
+
+            @property
+            def state(self):
+                copied.append(self.oid)
+                return bytes(self)
+
+        class Entry(object):
+            def __init__(self, oid):
+                self.newest_value = Value(b'0123456789')
+                self.newest_value.oid = oid
+                self.frequency = oid
+
+        class Cache(object):
+            entries = {oid: Entry(oid) for oid in range(5)}
+            peek = entries.get
+
+        c._cache = Cache()
+        items = c._checkpoint_items(range(6))
+        # The most popular that fit in 25 bytes. The others
+        # weren't copied, and wait for the next checkpoint.
+        self.assertEqual([item[0] for item in items], [4, 3])
+        self.assertEqual(copied, [4, 3])
+        self.assertEqual(sorted(c._checkpoint_oids), [0, 1, 2])
+
+    def test_checkpoint_disabled_by_default(self):
+        c = self._makeOne(cache_local_dir=':memory:')
+        self.assertIsNone(c._checkpoint_oids)
+        c[self.key] = self.value
+        self.assertFalse(c.checkpoint((1, 1)))
+
+    def test_read_persistent_items_and_admit(self):
+        import tempfile
+        import shutil
+
+        temp_dir = tempfile.mkdtemp(".rstest_cache")
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+
+        c = self._makeOne(cache_local_dir=temp_dir)
+        self.assertEqual(c.read_persistent_items(), (None, []))
+        c[(0, 1)] = (b'abc', 1)
+        c[(1, 1)] = (b'def', 1)
+        c.__getitem__((1, 1))
+        c.save(checkpoints=(2, 1))
+
+        c2 = self._makeOne(cache_local_dir=temp_dir)
+        checkpoints, items = c2.read_persistent_items()
+        self.assertEqual(checkpoints, (2, 1))
+        self.assertEqual(sorted(oid for oid, _ in items), [0, 1])
+        # Nothing was loaded.
+        self.assertEqual(len(c2), 0)
+
+        # What the cache already has wins.
+        c2[(0, 2)] = (b'xyz', 2)
+        self.assertEqual(c2.admit_restored(items), 1)
+        self.assertEqual(c2[(0, 2)], (b'xyz', 2))
+        self.assertEqual(c2[(1, None)], (b'def', 1))
+        self.assertTrue(c2._cache.peek(1).frozen)
+
+        # Only what fits in the room that's left is added, most
+        # popular first.
+        c3 = self._makeOne(cache_local_dir=temp_dir)
+        c3.limit = c3._cache.weight + 3
+        self.assertEqual(c3.admit_restored(items), 1)
+        self.assertEqual(list(c3.keys()), [1])
+
+    def test_restore_threads(self):
+        import tempfile
+        import shutil
+        from contextlib import closing
+        from relstorage.cache.persistence import sqlite_connect
+        from relstorage.cache.local_database import Database
+
+        temp_dir = tempfile.mkdtemp(".rstest_cache")
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+
+        c = self._makeOne(cache_local_dir=temp_dir)
+        for oid in range(100):
+            c[(oid, oid + 1)] = (b'%d' % oid, oid + 1)
+            for _ in range(oid % 7):
+                c.__getitem__((oid, oid + 1))
+        c.save()
+
+        c2 = self._makeOne(cache_local_dir=temp_dir, cache_local_mb=0.0001)
+        with closing(sqlite_connect(c2.options, c2.prefix)) as conn:
+            db = Database.from_connection(conn)
+            expected = c2._restorable_items(db)
+            self.assertLess(len(expected), 100)
+            self.assertEqual(c2._restorable_items_in_parallel(db, 4), expected)
+
+        c3 = self._makeOne(cache_local_dir=temp_dir, cache_local_restore_threads=4)
+        c3.restore()
+        self.assertEqual(len(c3), 100)
+        self.assertEqual(c3[(99, 100)], (b'99', 100))
+
+    def test_segment_format(self):
+        import tempfile
+        import shutil
+        import os
+
+        temp_dir = tempfile.mkdtemp(".rstest_cache")
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+
+        with self.assertRaises(ValueError):
+            self._makeOne(cache_local_dir_format='bogus')
+
+        c = self._makeOne(cache_local_dir=temp_dir, cache_local_dir_format='segment')
+        self.assertIsNone(c.restore())
+        c[(0, 1)] = (b'abc', 1)
+        c[(1, 1)] = (b'def', 1)
+        c.__getitem__((1, 1))
+        self.assertTrue(c.save(checkpoints=(2, 1)))
+        self.assertEqual(
+            sorted(os.listdir(temp_dir)),
+            ['relstorage-cache2-.0.rsseg', 'relstorage-cache2-.rsidx',
+             'relstorage-cache2-.rsidx.lock'])
+
+        c2 = self._makeOne(cache_local_dir=temp_dir, cache_local_dir_format='segment')
+        self.assertEqual(c2.restore(), (2, 1))
+        self.assertEqual(c2[(0, 1)], (b'abc', 1))
+        self.assertEqual(c2[(1, 1)], (b'def', 1))
+
+        # The sqlite format doesn't see it.
+        c3 = self._makeOne(cache_local_dir=temp_dir)
+        self.assertIsNone(c3.restore())
+        self.assertIsNone(c3[(0, 1)])
+
+        c2.remove_invalid_persistent_oids([0])
+        c2 = self._makeOne(cache_local_dir=temp_dir, cache_local_dir_format='segment')
+        c2.restore()
+        self.assertIsNone(c2[(0, 1)])
+        self.assertEqual(c2[(1, 1)], (b'def', 1))
+
+        # If we corrupt the index, it's ignored.
+        with open(os.path.join(temp_dir, 'relstorage-cache2-.rsidx'), 'wb') as f:
+            f.write(b'Nope!')
+        c2 = self._makeOne(cache_local_dir=temp_dir, cache_local_dir_format='segment')
+        self.assertIsNone(c2.restore())
+        self.assertIsNone(c2[(1, 1)])
+
+        c2.zap_all()
+        self.assertFalse([f for f in os.listdir(temp_dir) if 'rs' in f.split('.')[-1]])
+
+
+class ShardedLocalClientOIDTests(LocalClientOIDTests):
+
+    class Options(MockOptions):
+        cache_local_shards = 4
+
+    def test_sharded(self):
+        from relstorage.cache._sharded_cache import ShardedCache
+        c = self._makeOne()
+        self.assertIsInstance(c._cache, ShardedCache)
+        self.assertEqual(len(c._cache.shards), 4)
+        self.assertAlmostEqual(c._cache.limit, c.limit, delta=4)
+
+        c.set_all_for_tid(1, [(b'abc', oid, -1) for oid in range(8)])
+        self.assertEqual(len(c), 8)
+        self.assertEqual([len(shard) for shard in c._cache.shards], [2, 2, 2, 2])
+        self.assertEqual(sorted(c.keys()), list(range(8)))
+        self.assertEqual(c[(5, 1)], (b'abc', 1))
+        self.assertEqual(c.stats()['sets'], 8)
+
+        c.invalidate_all([0, 1, 2])
+        self.assertEqual(sorted(c.keys()), list(range(3, 8)))
+
+    def test_iterates_like_one_cache(self):
+        sharded = self._makeOne()
+        single = self._makeOne(cache_local_shards=1)
+        for c in sharded, single:
+            c.set_all_for_tid(2, [(b'abc', oid, -1) for oid in (9, 3, 6, 0, 5)])
+            c[(3, 1)] = (b'old', 1)
+        self.assertEqual(list(sharded.keys()), list(single.keys()))
+        self.assertEqual(list(sharded), list(single))
+        self.assertEqual(list(sharded._newest_items()), list(single._newest_items()))
+
+    def test_threads(self):
+        import threading
+        c = self._makeOne(cache_local_compression='zlib')
+        errors = []
+
+        def run(start):
+            try:
+                for i in range(200):
+                    oid = start + i
+                    state = b'state' * (oid % 50 + 20)
+                    c[(oid, 1)] = (state, 1)
+                    self.assertEqual(c[(oid, 1)], (state, 1))
+            except Exception as ex: # pylint:disable=broad-except
+                errors.append(ex)
+
+        threads = [threading.Thread(target=run, args=(n * 1000,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(c), 800)
+
+    def test_adaptive_generations(self):
+        c = self._makeOne(cache_local_adaptive_generations=True)
+        c[self.key] = self.value
+        for _ in range(c._climb_min_sample):
+            _ = c[self.key]
+        eden_pct = c._climb()
+        self.assertAlmostEqual(eden_pct, 0.1 - c._climb_step_pct)
+        for shard in c._cache.shards:
+            self.assertAlmostEqual(shard.eden.limit, c.limit * eden_pct / 4, delta=1)
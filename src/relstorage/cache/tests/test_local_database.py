@@ -55,6 +55,14 @@ class UpdateTests(TestCase):
         self.db.update_checkpoints(1, 0)
         self.assertEqual(self.db.checkpoints, (1, 0))
 
+    def test_compression_dictionaries(self):
+        self.assertEqual(self.db.compression_dictionaries, [])
+        for i in range(Database.max_compression_dictionaries + 1):
+            self.db.store_compression_dictionary(i, b'dict%d' % i)
+        # Oldest discarded, newest first.
+        self.assertEqual(self.db.compression_dictionaries,
+                         [b'dict4', b'dict3', b'dict2', b'dict1'])
+
     def test_update_checkpoints_newer(self):
         self.db.update_checkpoints(1, 0)
         self.db.update_checkpoints(2, 1)
@@ -109,6 +117,19 @@ class UpdateTests(TestCase):
         self.assertEqual(rows_in_db[1], (1, 1, b'-1', 1, 0))
         self.assertEqual(rows_in_db[2], (2, 2, b'2b', 2, 6))
 
+    def test_fetch_rows_by_priority_range(self):
+        self.db.store_temp([(oid, 1, b'%d' % oid, oid % 3) for oid in range(10)])
+        self.db.move_from_temp()
+        self.assertEqual(self.db.oid_boundaries(1), [])
+        self.assertEqual(self.db.oid_boundaries(3), [3, 6])
+
+        rows = list(self.db.fetch_rows_by_priority(3, 6))
+        self.assertEqual([row[0] for row in rows], [5, 4, 3])
+        self.assertEqual([row[0] for row in self.db.fetch_rows_by_priority(end_oid=2)],
+                         [1, 0])
+        self.assertEqual([row[0] for row in self.db.fetch_rows_by_priority(min_oid=9)],
+                         [9])
+
     def test_remove_invalid_persistent_oids(self):
         rows = [
             (0, 1, b'0', 0),
@@ -15,6 +15,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import unittest
 
 from hamcrest import assert_that
 from nti.testing.matchers import validly_provides
@@ -26,6 +27,7 @@ from nti.testing.matchers import validly_provides
 # over the object layout, especially with the various MSVC compilers
 # we have to deal with. So that explains the tests that have a range of sizes.
 
+from relstorage._compat import PYPY
 from relstorage.tests import TestCase
 from relstorage.cache import interfaces
 from . import Cache
@@ -314,6 +316,165 @@ class GenericGenerationalLRUCacheTests(GenericLRUCacheTests):
         self.assertEqual(3, len(cache))
         self.assertEqual(3, len(list(cache)))
 
+class FrequencySketchTests(TestCase):
+
+    def _makeOne(self, sketch=True):
+        # Room for 10 entries of 10 bytes.
+        cache = NoOverheadSizeCache(100)
+        cache = NoOverheadSizeCache(10 * (cache.entry_size + 10) + cache.base_size)
+        if sketch:
+            cache.enable_frequency_sketch()
+        return cache
+
+    def test_disabled_by_default(self):
+        cache = self._makeOne(sketch=False)
+        self.assertFalse(cache.uses_frequency_sketch)
+        cache[1] = (b'abc', 0)
+        self.assertEqual(cache.sketch_frequency(1), 0)
+
+    def test_tracks_misses_and_evicted_keys(self):
+        cache = self._makeOne()
+        self.assertTrue(cache.uses_frequency_sketch)
+        self.assertEqual(cache.sketch_frequency(1), 0)
+        # A miss counts.
+        self.assertIsNone(cache.get_item_with_tid(1, 0))
+        self.assertEqual(cache.sketch_frequency(1), 1)
+        # So does adding and hitting.
+        cache[1] = (b'abc', 0)
+        self.assertEqual(cache.sketch_frequency(1), 2)
+        cache.get_item_with_tid(1, 0)
+        self.assertEqual(cache.sketch_frequency(1), 3)
+        # But not peeking.
+        cache.peek_item_with_tid(1, 0)
+        self.assertEqual(cache.sketch_frequency(1), 3)
+        # It's remembered after the entry is gone.
+        del cache[1]
+        self.assertEqual(cache.sketch_frequency(1), 3)
+
+    def test_counts_saturate(self):
+        cache = self._makeOne()
+        for _ in range(100):
+            cache.get_item_with_tid(1, 0)
+        self.assertEqual(cache.sketch_frequency(1), 15)
+
+    def test_halves_periodically(self):
+        cache = self._makeOne()
+        for _ in range(15):
+            cache.get_item_with_tid(1, 0)
+        # Enough distinct accesses to reach the sample size
+        # of the minimum table size.
+        for i in range(2, 64 * 10 * 2):
+            cache.get_item_with_tid(i, 0)
+        self.assertLess(cache.sketch_frequency(1), 8)
+
+    def test_growing_keeps_counts(self):
+        cache = NoOverheadSizeCache(100000)
+        cache.enable_frequency_sketch()
+        for _ in range(5):
+            cache.get_item_with_tid(1, 0)
+        # Enough entries to grow past the minimum table size,
+        # but too few to age the counts.
+        for i in range(2, 300):
+            cache[i] = (b'abc', 1)
+        self.assertGreaterEqual(cache.sketch_frequency(1), 5)
+
+    def test_admission_uses_sketch(self):
+        def keys(gen):
+            return [e.key for e in gen]
+
+        def fill(cache):
+            for i in range(1, 13):
+                cache[i] = (b'0123456789', 1)
+            self.assertEqual(keys(cache.eden), [12])
+            probation = keys(cache.probation)
+            self.assertEqual(len(probation), 1)
+            # Make the entry on probation popular without promoting it:
+            # these requests are for a TID we don't have.
+            for _ in range(3):
+                cache.get_item_with_tid(probation[0], 2)
+            # 12 leaves eden for probation; only one of them can stay.
+            cache[13] = (b'0123456789', 1)
+            self.assertEqual(keys(cache.eden), [13])
+            return probation[0], keys(cache.probation)
+
+        # Without the sketch, the newer entry wins because the entry
+        # frequencies are equal.
+        _, probation = fill(self._makeOne(sketch=False))
+        self.assertEqual(probation, [12])
+        # With the sketch, the more popular entry wins.
+        popular, probation = fill(self._makeOne())
+        self.assertEqual(probation, [popular])
+
+
+@unittest.skipIf(PYPY, "States are copied on PyPy")
+class StateSharingTests(TestCase):
+
+    def _makeOne(self, share=True):
+        cache = NoOverheadSizeCache(100000)
+        if share:
+            cache.enable_state_sharing()
+        return cache
+
+    def _state(self):
+        # A new object each time.
+        return bytes(bytearray(b'0123456789'))
+
+    def test_disabled_by_default(self):
+        cache = self._makeOne(share=False)
+        self.assertFalse(cache.shares_states)
+        cache[1] = (self._state(), 1)
+        cache[2] = (self._state(), 1)
+        self.assertEqual(cache.weight, 20)
+        self.assertIsNot(cache[1].state, cache[2].state)
+        self.assertEqual(cache.distinct_state_count, 0)
+
+    def test_equal_states_shared(self):
+        cache = self._makeOne()
+        self.assertTrue(cache.shares_states)
+        cache[1] = (self._state(), 1)
+        cache[2] = (self._state(), 1)
+        cache[3] = (b'abc', 1)
+        self.assertEqual(cache.weight, 13)
+        self.assertIs(cache[1].state, cache[2].state)
+        self.assertEqual(cache[2].state, b'0123456789')
+        self.assertEqual(cache.distinct_state_count, 2)
+
+    def test_multiple_values_shared(self):
+        def fill(cache):
+            cache[1] = (self._state(), 1)
+            # A new revision with the same state.
+            cache[1] = (self._state(), 2)
+            self.assertEqual(sorted(cache), [(1, 1), (1, 2)])
+            return cache
+
+        unshared = fill(self._makeOne(share=False))
+        cache = fill(self._makeOne())
+        self.assertEqual(cache.weight, unshared.weight - 10)
+        self.assertIs(cache.peek_item_with_tid(1, 1).state,
+                      cache.peek_item_with_tid(1, 2).state)
+        cache.freeze({1: 2})
+        self.assertEqual(cache[1].tid, 2)
+        self.assertEqual(cache[1].state, b'0123456789')
+
+    def test_unused_state_charged_again(self):
+        cache = self._makeOne()
+        cache[1] = (self._state(), 1)
+        cache[2] = (self._state(), 1)
+        del cache[1]
+        del cache[2]
+        self.assertEqual(cache.distinct_state_count, 1)
+        # Nobody else is using it.
+        cache[3] = (self._state(), 1)
+        self.assertEqual(cache.weight, 10)
+
+    def test_unused_states_pruned(self):
+        cache = self._makeOne()
+        for i in range(3000):
+            cache[i] = (b'%d' % i, 1)
+            del cache[i]
+        self.assertLess(cache.distinct_state_count, 2048)
+
+
 class CFFICacheTests(TestCase):
     """
     Tests that are specific to the CFFI implementation
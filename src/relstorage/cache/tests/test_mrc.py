@@ -0,0 +1,121 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+from collections import OrderedDict
+
+from relstorage.tests import TestCase
+
+# pylint:disable=protected-access
+
+def _lru_hit_ratio(accesses, cache_size, size):
+    cache = OrderedDict()
+    hits = 0
+    for oid in accesses:
+        if oid in cache:
+            hits += 1
+            cache.move_to_end(oid)
+        else:
+            cache[oid] = True
+            while len(cache) * size > cache_size:
+                cache.popitem(last=False)
+    return hits / len(accesses)
+
+
+class TestMissRatioCurve(TestCase):
+
+    sizes = (1000, 5000, 20000)
+
+    def _makeOne(self, sample_rate=1.0, sizes=sizes):
+        from relstorage.cache._mrc import MissRatioCurve
+        return MissRatioCurve(sample_rate, sizes)
+
+    def _accesses(self, count=20000, oids=2000):
+        r = random.Random(42)
+        return [int(r.paretovariate(1.0)) % oids for _ in range(count)]
+
+    def test_empty(self):
+        mrc = self._makeOne()
+        self.assertEqual(mrc.hit_ratios(), [(1000, 0), (5000, 0), (20000, 0)])
+
+    def test_reuse_distance(self):
+        mrc = self._makeOne()
+        for oid in (1, 2, 3, 1):
+            mrc.record(oid, 400)
+        # 1 needs room for itself, 2 and 3.
+        ratios = dict(mrc.hit_ratios())
+        self.assertEqual(ratios[1000], 0)
+        self.assertEqual(ratios[5000], 0.25)
+
+        # 3 needs room for itself and 1, then only itself.
+        mrc.record(3, 400)
+        mrc.record(3, 400)
+        ratios = dict(mrc.hit_ratios())
+        self.assertEqual(ratios[1000], 2 / 6)
+        self.assertEqual(ratios[5000], 3 / 6)
+
+    def test_unknown_size(self):
+        mrc = self._makeOne()
+        mrc.record(1, 600)
+        mrc.record(2, 200)
+        # We don't know its size, so we assume the average.
+        mrc.record(3)
+        self.assertEqual(mrc._tracked[3][1], 400)
+        # Once we know it, we keep it.
+        mrc.record(3, 900)
+        mrc.record(3)
+        self.assertEqual(mrc._tracked[3][1], 900)
+
+    def test_exact_when_not_sampling(self):
+        accesses = self._accesses()
+        mrc = self._makeOne()
+        for oid in accesses:
+            mrc.record(oid, 100)
+        self.assertEqual(mrc.sample_rate, 1.0)
+        for cache_size, ratio in mrc.hit_ratios():
+            self.assertAlmostEqual(ratio, _lru_hit_ratio(accesses, cache_size, 100))
+
+    def test_sampling(self):
+        accesses = self._accesses(oids=20000)
+        mrc = self._makeOne(0.1, sizes=(10000, 100000))
+        for oid in accesses:
+            mrc.record(oid, 100)
+        self.assertLess(len(mrc._tracked), 2000)
+        for cache_size, ratio in mrc.hit_ratios():
+            self.assertAlmostEqual(ratio, _lru_hit_ratio(accesses, cache_size, 100),
+                                   delta=0.05)
+
+    def test_fixed_size(self):
+        mrc = self._makeOne()
+        mrc.max_tracked = 100
+        accesses = self._accesses()
+        for oid in accesses:
+            mrc.record(oid, 100)
+        self.assertLessEqual(len(mrc._tracked), 100)
+        self.assertLess(mrc.sample_rate, 1.0)
+        self.assertTrue(all(h < mrc.threshold for _, _, h in mrc._tracked.values()))
+        for cache_size, ratio in mrc.hit_ratios():
+            self.assertAlmostEqual(ratio, _lru_hit_ratio(accesses, cache_size, 100),
+                                   delta=0.1)
+
+    def test_compact(self):
+        mrc = self._makeOne()
+        capacity = mrc._tree.capacity
+        for i in range(capacity + 10):
+            mrc.record(i % 3, 100)
+        self.assertLess(mrc._time, capacity)
+        self.assertEqual(dict(mrc.hit_ratios())[1000], (capacity + 7) / (capacity + 10))
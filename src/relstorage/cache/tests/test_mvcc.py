@@ -16,6 +16,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import time
+
 from hamcrest import assert_that
 from nti.testing.matchers import validly_provides
 
@@ -252,6 +254,18 @@ class TestMVCCDatabaseCorrdinator(TestCase):
         self.assertIn((0, 1), self.viewer.local_client)
 
 
+    def test_poll_checkpoints(self):
+        checkpoints = []
+        self.viewer.local_client.checkpoint = checkpoints.append
+        self.test_poll_no_index_begins(2)
+        # Beginning doesn't vacuum.
+        self.assertEqual(checkpoints, [])
+
+        self.polled_tid = 3
+        self.polled_changes = self.expected_poll_result = [(1, 3)]
+        self.do_poll()
+        self.assertEqual(checkpoints, [(3, 2)])
+
     def test_poll_many_times_vacuums_two_viewer(self):
         # A viewer that keeps moving forward, and a viewer that
         # is stuck in the past.
@@ -290,6 +304,123 @@ class TestMVCCDatabaseCorrdinator(TestCase):
         self.assertIs(self.viewer.object_index.get_oldest_transaction(),
                       second_viewer.object_index.get_newest_transaction())
 
+    def test_poll_vacuum_is_incremental(self):
+        self.coord.vacuum_max_entries = 2
+        second_viewer = self.add_viewer()
+        self.test_poll_no_index_begins()
+        self.polled_changes = ()
+        self.expected_poll_result = None
+        self.do_poll(viewer=second_viewer)
+
+        # The second viewer pins the old maps while we move forward.
+        for poll_num in range(2, 10):
+            self.polled_tid = poll_num
+            self.polled_changes = self.expected_poll_result = [(poll_num, poll_num)]
+            self.do_poll()
+        self.assertEqual(self.viewer.object_index.depth, 9)
+        self.assertEqual(self.coord.vacuum_stats['maps_removed'], 0)
+
+        # Once it's gone, each poll only removes maps holding two
+        # entries (the first map is empty) until it has caught up.
+        self.coord.unregister(second_viewer)
+        depths = []
+        for poll_num in range(10, 20):
+            self.polled_tid = poll_num
+            self.polled_changes = self.expected_poll_result = [(poll_num, poll_num)]
+            self.do_poll()
+            depths.append(self.viewer.object_index.depth)
+        self.assertEqual(depths, [7, 6, 5, 4, 3, 2, 1, 1, 1, 1])
+
+        stats = self.coord.stats()['vacuum']
+        self.assertEqual(stats['passes'], 18)
+        self.assertEqual(stats['deferred'], 6)
+        self.assertEqual(stats['maps_removed'], 18)
+        self.assertEqual(stats['entries_frozen'], 17)
+
+    def test_poll_shared(self):
+        self.coord.share_polls = True
+        second_viewer = self.add_viewer()
+        self.test_poll_no_index_begins()
+        self.polled_changes = ()
+        self.expected_poll_result = None
+        self.do_poll(viewer=second_viewer)
+
+        self.polled_tid = 2
+        self.polled_changes = self.expected_poll_result = [(1, 2)]
+        self.do_poll()
+
+        # The database hasn't changed, so the second viewer gets
+        # the changes the first polled for without polling itself.
+        def poll_invalidations(*_args):
+            raise AssertionError("Should not poll")
+        self.viewer.adapter.poller.poll_invalidations = poll_invalidations
+        self.do_poll(viewer=second_viewer)
+        self.assertIs(second_viewer.object_index, self.viewer.object_index)
+        self.assertEqual(second_viewer.highest_visible_tid, 2)
+        self.assertEqual(self.coord.poll_stats['shared'], 1)
+
+    def test_poll_shared_database_changed(self):
+        self.coord.share_polls = True
+        second_viewer = self.add_viewer()
+        self.test_poll_no_index_begins()
+        self.polled_changes = ()
+        self.expected_poll_result = None
+        self.do_poll(viewer=second_viewer)
+
+        self.polled_tid = 2
+        self.polled_changes = self.expected_poll_result = [(1, 2)]
+        self.do_poll()
+
+        # Something committed since, so the second viewer has to poll.
+        self.polled_tid = 3
+        self.polled_changes = [(2, 3)]
+        self.expected_poll_result = [(1, 2), (2, 3)]
+        self.do_poll(viewer=second_viewer)
+        self.assertEqual(second_viewer.highest_visible_tid, 3)
+        self.assertEqual(self.coord.poll_stats['shared'], 0)
+
+    def test_background_poll(self):
+        coord = mvcc.MVCCDatabaseCoordinator(Options(cache_background_poll_interval=0.01))
+        self.assertTrue(coord.share_polls)
+        adapter = MockAdapter()
+        adapter.poller.poll_tid = 2
+        adapter.poller.poll_changes = []
+        coord.start_background_poll(adapter, LocalClient(Options()))
+        self.addCleanup(coord.close)
+
+        def wait_for_index(tid):
+            deadline = time.time() + 10
+            while time.time() < deadline:
+                index = coord.object_index
+                if index is not None and index.highest_visible_tid == tid:
+                    return
+                time.sleep(0.01)
+            self.fail("Background poll didn't reach %s" % (tid,))
+
+        wait_for_index(2)
+        viewer = MockViewer()
+        viewer.adapter = adapter
+        coord.register(viewer)
+        coord.poll(viewer, None, None)
+        self.assertEqual(viewer.highest_visible_tid, 2)
+
+        adapter.poller.poll_tid = 3
+        adapter.poller.poll_changes = [(1, 3)]
+        wait_for_index(3)
+        # The viewer finds the index current, and doesn't poll.
+        poll_invalidations = adapter.poller.poll_invalidations
+        def no_poll(*_args):
+            raise AssertionError("Should not poll")
+        adapter.poller.poll_invalidations = no_poll
+        self.assertEqual(list(coord.poll(viewer, None, None)), [(1, 3)])
+        self.assertEqual(viewer.highest_visible_tid, 3)
+        adapter.poller.poll_invalidations = poll_invalidations
+
+        coord.stop_background_poll(10)
+        self.assertIsNone(coord._poll_thread)
+        self.assertEqual(len(coord._registered_viewers), 1)
+        self.assertGreaterEqual(coord.stats()['polls']['background'], 2)
+
     def test_poll_many_times_vacuums_several_viewers(self):
         # A viewer that keeps moving forward, and a viewer that
         # is stuck in the past.
@@ -508,6 +639,176 @@ class TestMVCCDatabaseCorrdinator(TestCase):
             3, 4, 5, 6, 7, 8, 9, 10
         ])
 
+    def _restore_in_background_fixture(self):
+        adapter = MockAdapter()
+        adapter.poller.poll_tid = 5
+        adapter.mover.data = {1: (b'1', 2), 2: (b'2', 3), 3: (b'3', 2)}
+
+        class MockLocalClient(object):
+            admitted = invalid_oids = None
+            def read_persistent_items(self):
+                return (4, 4), [(oid, (b'', 2, True, 1)) for oid in (1, 2, 3, 4)]
+
+            def admit_restored(self, items):
+                self.admitted = [item[0] for item in items]
+                return len(items)
+
+            def remove_invalid_persistent_oids(self, oids, invalidate=True):
+                self.assertFalse(invalidate)
+                self.invalid_oids = sorted(oids)
+
+        local_client = MockLocalClient()
+        local_client.assertFalse = self.assertFalse
+        return adapter, local_client
+
+    def test_restore_in_background(self):
+        adapter, local_client = self._restore_in_background_fixture()
+        coord = self._makeOne()
+        coord.restore_in_background(adapter, local_client)
+        self.assertTrue(coord.wait_for_restore(10))
+
+        # Nobody had polled, so we start at our poll.
+        self.assertEqual(coord.object_index.highest_visible_tid, 5)
+        self.assertEqual(local_client.admitted, [1, 3])
+        self.assertEqual(local_client.invalid_oids, [2, 4])
+
+    def test_restore_in_background_after_changes(self):
+        adapter, local_client = self._restore_in_background_fixture()
+        coord = self._makeOne()
+        # Object 3 changed after our poll.
+        coord.object_index = objectindex._ObjectIndex(6, 5, {3: 6})
+        coord._restore_in_background(adapter, local_client, None, coord._restore_generation)
+        self.assertEqual(local_client.admitted, [1])
+        self.assertEqual(local_client.invalid_oids, [2, 4])
+
+    def test_restore_in_background_index_too_new(self):
+        adapter, local_client = self._restore_in_background_fixture()
+        coord = self._makeOne()
+        # The index doesn't know what changed between 5 and 7.
+        coord.object_index = objectindex._ObjectIndex(8, 7, {3: 8})
+        coord._restore_in_background(adapter, local_client, None, coord._restore_generation)
+        self.assertIsNone(local_client.admitted)
+        self.assertIsNone(local_client.invalid_oids)
+
+    def test_restore_in_background_abandoned(self):
+        adapter, local_client = self._restore_in_background_fixture()
+        coord = self._makeOne()
+        generation = coord._restore_generation
+        coord.flush_all()
+        coord._restore_in_background(adapter, local_client, None, generation)
+        self.assertIsNone(coord.object_index)
+        self.assertIsNone(local_client.admitted)
+
+    def _object_index_fixture(self, mover_data):
+        import tempfile
+        import shutil
+        temp_dir = tempfile.mkdtemp('.rstest_index')
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+        options = Options(cache_local_dir=temp_dir, cache_local_object_index=True)
+        # What we knew as of TID 5.
+        mvcc._save_object_index(
+            mvcc.object_index_file(options, 'myprefix'),
+            5,
+            mvcc.OidTMap({1: 2, 2: 3, 3: 2}))
+
+        adapter = MockAdapter()
+        adapter.poller.poll_tid = 6
+        # Object 3 changed since then.
+        adapter.poller.poll_changes = [(3, 6)]
+        adapter.mover.data = mover_data
+        looked_up = []
+        current_object_tids = adapter.mover.current_object_tids
+        def lookup(cursor, oids, timeout=None):
+            looked_up.extend(sorted(oids))
+            return current_object_tids(cursor, oids, timeout)
+        adapter.mover.current_object_tids = lookup
+
+        coord = mvcc.MVCCDatabaseCoordinator(options)
+        return coord, adapter, options, looked_up
+
+    def test_restore_with_object_index(self):
+        # What we have cached. 2 isn't what the index says, and the
+        # index doesn't know 4.
+        cached = {1: 2, 2: 2, 3: 2, 4: 2}
+        coord, adapter, options, looked_up = self._object_index_fixture(
+            {1: (b'', 2), 2: (b'', 3), 3: (b'', 6), 4: (b'', 2)})
+
+        class MockCache(object):
+            def contains_oid_with_tid(self, oid, tid):
+                return cached.get(oid) == tid
+
+        class MockLocalClient(object):
+            _cache = MockCache()
+            invalid_oids = None
+            prefix = 'myprefix'
+            def restore(self):
+                return (5, 5)
+
+            def keys(self):
+                return list(cached)
+
+            def remove_invalid_persistent_oids(self, oids):
+                self.invalid_oids = sorted(oids)
+
+        local_client = MockLocalClient()
+        local_client.options = options
+        coord.restore(adapter, local_client)
+
+        # We only had to ask about what the index couldn't tell us.
+        self.assertEqual(looked_up, [2, 4])
+        self.assertEqual(local_client.invalid_oids, [2, 3])
+
+        # If the database is behind the saved index, we can't trust it.
+        del looked_up[:]
+        adapter.poller.poll_tid = 4
+        coord.restore(adapter, local_client)
+        self.assertEqual(looked_up, [1, 2, 3, 4])
+
+    def test_restore_in_background_with_object_index(self):
+        coord, adapter, options, looked_up = self._object_index_fixture(
+            {1: (b'1', 2), 2: (b'2', 3), 3: (b'3', 6)})
+        _, local_client = self._restore_in_background_fixture()
+        local_client.options = options
+        local_client.prefix = 'myprefix'
+
+        coord.restore_in_background(adapter, local_client)
+        self.assertTrue(coord.wait_for_restore(10))
+        self.assertEqual(looked_up, [2, 4])
+        self.assertEqual(local_client.admitted, [1])
+        self.assertEqual(local_client.invalid_oids, [2, 3, 4])
+
+    def test_load_object_index(self):
+        import tempfile
+        import shutil
+        import os
+        temp_dir = tempfile.mkdtemp('.rstest_index')
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+        path = os.path.join(temp_dir, 'index.bin')
+        self.assertEqual(mvcc._load_object_index(path), (None, None))
+
+        mvcc._save_object_index(path, 42, mvcc.OidTMap({1: 2, 3: 4}))
+        tid, oid_tids = mvcc._load_object_index(path)
+        self.assertEqual(tid, 42)
+        self.assertEqual(dict(oid_tids.items()), {1: 2, 3: 4})
+
+        # One writer's header with another's pairs, as could happen
+        # if they shared a file, is the right length but rejected.
+        other_path = os.path.join(temp_dir, 'other.bin')
+        mvcc._save_object_index(other_path, 43, mvcc.OidTMap({1: 5, 3: 6}))
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(other_path, 'rb') as f:
+            other_data = f.read()
+        header_size = mvcc._INDEX_HEADER.size
+        with open(path, 'wb') as f:
+            f.write(other_data[:header_size] + data[header_size:])
+        self.assertEqual(mvcc._load_object_index(path), (None, None))
+
+        with open(other_path, 'ab') as f:
+            f.write(b'garbage')
+        self.assertEqual(mvcc._load_object_index(other_path), (None, None))
+        self.assertEqual(sorted(os.listdir(temp_dir)), ['index.bin', 'other.bin'])
+
     def test_find_changes_for_viewer_produces_detached_stat(self):
         from perfmetrics.testing.matchers import is_counter
         from hamcrest import contains_exactly
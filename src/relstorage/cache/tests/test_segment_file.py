@@ -0,0 +1,164 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+
+from relstorage.tests import TestCase
+
+# pylint:disable=protected-access
+
+class TestSegmentFiles(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp(".rstest_cache")
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+
+    def _makeOne(self, prefix='pfx'):
+        from relstorage.cache._segment_file import SegmentFiles
+        return SegmentFiles(self.temp_dir, prefix)
+
+    def _write(self, files, rows, checkpoints=None, dictionary=None, limit=None):
+        with files.writing() as writer:
+            count = writer.append(rows)
+            writer.commit(checkpoints, dictionary, limit)
+        return count
+
+    def _data_files(self):
+        return sorted(f for f in os.listdir(self.temp_dir) if f.endswith('.rsseg'))
+
+    def test_empty(self):
+        files = self._makeOne()
+        self.assertIsNone(files.open_reader())
+        self._write(files, ())
+        with files.open_reader() as reader:
+            self.assertEqual(len(reader), 0)
+            self.assertIsNone(reader.checkpoints)
+            self.assertIsNone(reader.get(1))
+            self.assertEqual(list(reader.fetch_rows_by_priority()), [])
+
+    def test_write_and_read(self):
+        files = self._makeOne()
+        count = self._write(files, [
+            (3, 5, False, b'three', 1),
+            (1, 5, True, b'one', 4),
+            (2, 6, False, b'two', 4),
+        ], checkpoints=(6, 5), dictionary=b'dict')
+        self.assertEqual(count, 3)
+
+        with files.open_reader() as reader:
+            self.assertEqual(len(reader), 3)
+            self.assertEqual(reader.checkpoints, (6, 5))
+            self.assertEqual(reader.compression_dictionaries, [b'dict'])
+            self.assertEqual(reader.get(1), (b'one', 5, True, 4))
+            self.assertEqual(reader.get(3), (b'three', 5, False, 1))
+            self.assertIsNone(reader.get(4))
+            self.assertEqual(dict(reader.oid_to_tid().items()), {1: 5, 2: 6, 3: 5})
+            self.assertEqual(list(reader.fetch_rows_by_priority()), [
+                (2, 6, b'two', 6, 4),
+                (1, -1, b'one', 5, 4),
+                (3, 5, b'three', 5, 1),
+            ])
+
+    def test_update(self):
+        files = self._makeOne()
+        self._write(files, [(1, 5, False, b'one', 1), (2, 5, False, b'two', 1)],
+                    checkpoints=(6, 5), dictionary=b'd1')
+        # Older states are ignored; newer ones add their frequency.
+        count = self._write(files, [(1, 4, False, b'old', 1), (2, 7, False, b'TWO', 2)],
+                            checkpoints=(5, 5), dictionary=b'd2')
+        self.assertEqual(count, 1)
+        with files.open_reader() as reader:
+            self.assertEqual(reader.get(1), (b'one', 5, False, 1))
+            self.assertEqual(reader.get(2), (b'TWO', 7, False, 3))
+            # Older checkpoints don't replace newer.
+            self.assertEqual(reader.checkpoints, (6, 5))
+            self.assertEqual(reader.compression_dictionaries, [b'd2', b'd1'])
+
+        with files.writing() as writer:
+            self.assertEqual(writer.remove([1, 3]), 1)
+            writer.commit()
+        with files.open_reader() as reader:
+            self.assertIsNone(reader.get(1))
+            self.assertEqual(len(reader), 1)
+
+    def test_interrupted_write(self):
+        files = self._makeOne()
+        self._write(files, [(1, 5, False, b'one', 1)])
+        with files.writing() as writer:
+            writer.append([(2, 5, False, b'two', 1)])
+            # No commit.
+        with files.open_reader() as reader:
+            self.assertEqual(len(reader), 1)
+            self.assertIsNone(reader.get(2))
+        # The next write reuses the space.
+        self._write(files, [(3, 5, False, b'three', 1)])
+        with files.open_reader() as reader:
+            self.assertEqual(reader.get(3), (b'three', 5, False, 1))
+            self.assertEqual(reader.data_length,
+                             os.path.getsize(reader.data_path))
+
+    def test_trim_to_size(self):
+        files = self._makeOne()
+        self._write(files, [
+            (1, 5, False, b'a' * 10, 1),
+            (2, 5, False, b'b' * 10, 5),
+            (3, 6, False, b'c' * 10, 1),
+        ], limit=20)
+        with files.open_reader() as reader:
+            self.assertIsNone(reader.get(1))
+            self.assertEqual(sorted(e[0] for e in reader.entries()), [2, 3])
+
+    def test_compaction(self):
+        files = self._makeOne()
+        files.min_garbage_to_compact = 100
+        self._write(files, [(1, 1, False, b'x' * 100, 1), (2, 1, False, b'y', 1)])
+        self.assertEqual(self._data_files(), ['relstorage-cache2-pfx.0.rsseg'])
+        self._write(files, [(1, 2, False, b'z' * 100, 1)])
+        # Not enough garbage yet.
+        self.assertEqual(self._data_files(), ['relstorage-cache2-pfx.0.rsseg'])
+        self._write(files, [(1, 3, False, b'w' * 100, 1)])
+        self.assertEqual(self._data_files(), ['relstorage-cache2-pfx.1.rsseg'])
+        with files.open_reader() as reader:
+            self.assertEqual(reader.generation, 1)
+            self.assertEqual(reader.get(1), (b'w' * 100, 3, False, 3))
+            self.assertEqual(reader.get(2), (b'y', 1, False, 1))
+
+    def test_corrupt_index(self):
+        from relstorage.cache._segment_file import CorruptSegmentFileError
+        files = self._makeOne()
+        self._write(files, [(1, 5, False, b'one', 1)])
+        with open(files.index_path, 'wb') as f:
+            f.write(b'Nope!' * 10)
+        with self.assertRaises(CorruptSegmentFileError):
+            files.open_reader()
+        # Writing starts over.
+        self._write(files, [(2, 5, False, b'two', 1)])
+        with files.open_reader() as reader:
+            self.assertEqual(len(reader), 1)
+            self.assertEqual(reader.get(2), (b'two', 5, False, 1))
+
+    def test_destroy(self):
+        files = self._makeOne()
+        self._write(files, [(1, 5, False, b'one', 1)])
+        other = self._makeOne('other')
+        self._write(other, [(1, 5, False, b'one', 1)])
+        files.destroy()
+        self.assertIsNone(files.open_reader())
+        self.assertEqual(self._data_files(), ['relstorage-cache2-other.0.rsseg'])
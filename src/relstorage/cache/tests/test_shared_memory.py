@@ -0,0 +1,244 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+
+from relstorage.tests import TestCase
+
+from . import MockOptions
+from . import MockAdapter
+from .test_memcache_client import AbstractStateCacheTests
+
+# pylint:disable=protected-access
+
+class _SharedMemoryTestMixin(object):
+
+    def setUp(self):
+        super(_SharedMemoryTestMixin, self).setUp()
+        self.temp_dir = tempfile.mkdtemp('.rstest')
+        self.addCleanup(shutil.rmtree, self.temp_dir, True)
+        self.path = os.path.join(self.temp_dir, 'cache.shm')
+
+    def _makeShared(self, byte_limit=100000, value_limit=16384):
+        from relstorage.cache.shared_memory import SharedMemoryStateCache
+        inst = SharedMemoryStateCache(self.path, byte_limit, value_limit)
+        self.addCleanup(inst.close)
+        return inst
+
+
+class SharedMemoryStateCacheTests(_SharedMemoryTestMixin,
+                                  AbstractStateCacheTests):
+
+    def getClass(self):
+        return lambda options: self._makeShared(value_limit=options.cache_local_object_max)
+
+    def test_from_options_disabled(self):
+        from relstorage.cache.shared_memory import SharedMemoryStateCache
+        self.assertIsNone(SharedMemoryStateCache.from_options(MockOptions()))
+
+    def test_new_instance_is_shared(self):
+        inst = self._makeOne()
+        self.assertIs(inst, inst.new_instance())
+
+    def test_shared_between_processes(self):
+        # Separate mappings of the same file, as another process would have.
+        one = self._makeOne()
+        two = self._makeOne()
+        one[(1, 5)] = (b'abc', 5)
+        self.assertEqual(two[(1, 5)], (b'abc', 5))
+        self.assertIn((1, 5), two)
+        self.assertNotIn((1, 4), two)
+        self.assertIsNone(two[(1, 4)])
+        # Wildcards aren't answered by the key interface.
+        self.assertIsNone(two[(1, None)])
+
+        del two[(1, 5)]
+        self.assertIsNone(one[(1, 5)])
+
+    def test_shared_within_process(self):
+        from relstorage.cache import shared_memory
+        one = self._makeShared()
+        two = self._makeShared()
+        # One descriptor, mapping and set of locks, or the locks
+        # wouldn't exclude each other.
+        self.assertIs(one._segment, two._segment)
+        segment = one._segment
+        self.assertIs(shared_memory._segments[os.path.realpath(self.path)], segment)
+
+        one.close()
+        # Closing one doesn't close the file (and drop the locks)
+        # out from under the other.
+        self.assertIsNotNone(segment._fd)
+        two[(1, 5)] = (b'abc', 5)
+        self.assertEqual(two[(1, 5)], (b'abc', 5))
+
+        two.close()
+        self.assertIsNone(segment._fd)
+        self.assertNotIn(os.path.realpath(self.path), shared_memory._segments)
+        # Opening it again gets a new one.
+        three = self._makeShared()
+        self.assertIsNot(three._segment, segment)
+        self.assertEqual(three[(1, 5)], (b'abc', 5))
+
+    def test_replaced_file_not_shared(self):
+        one = self._makeShared()
+        one[(1, 5)] = (b'abc', 5)
+        os.unlink(self.path)
+        two = self._makeShared()
+        self.assertIsNot(two._segment, one._segment)
+        self.assertIsNone(two[(1, 5)])
+        # The old one keeps working with what it had open.
+        self.assertEqual(one[(1, 5)], (b'abc', 5))
+        one.close()
+        self.assertIsNotNone(two._segment._fd)
+
+    def test_geometry_comes_from_existing_file(self):
+        one = self._makeShared(byte_limit=100000)
+        two = self._makeShared(byte_limit=500000)
+        self.assertEqual(one._segment.data_size, two._segment.data_size)
+        self.assertEqual(one._segment.bucket_count, two._segment.bucket_count)
+        self.assertEqual(os.path.getsize(self.path), 100000)
+
+    def test_get_current(self):
+        c = self._makeOne()
+        c.store_current(1, b'abc', 5, 10)
+        # Not for a viewer whose index isn't complete.
+        self.assertIsNone(c.get_current(1, None, 20))
+        # Verified as-of 10, so it's current for anyone who
+        # knows about changes after 10 or earlier.
+        self.assertEqual(c.get_current(1, 10, 20), (b'abc', 5))
+        self.assertEqual(c.get_current(1, 7, 8), (b'abc', 5))
+        # But not if we only know about changes after 11.
+        self.assertIsNone(c.get_current(1, 11, 20))
+        # Nor if it's from the future.
+        self.assertIsNone(c.get_current(1, 1, 4))
+
+        # Storing it again with a later verification
+        # extends it.
+        c.store_current(1, b'abc', 5, 15)
+        self.assertEqual(c.get_current(1, 11, 20), (b'abc', 5))
+        self.assertEqual(c.sets, 1)
+
+    def test_multiple_versions(self):
+        c = self._makeOne()
+        c.store_current(1, b'new', 5, 10)
+        c.store_current(1, b'old', 3, 4)
+        self.assertEqual(c[(1, 5)], (b'new', 5))
+        self.assertEqual(c[(1, 3)], (b'old', 3))
+        # The newest suitable version is found.
+        self.assertEqual(c.get_current(1, 4, 20), (b'new', 5))
+        self.assertEqual(c.get_current(1, 4, 4), (b'old', 3))
+
+        del c[(1, 5)]
+        self.assertIsNone(c[(1, 5)])
+        self.assertEqual(c[(1, 3)], (b'old', 3))
+
+    def test_value_limit(self):
+        c = self._makeOne(cache_local_object_max=2)
+        c[(1, 5)] = (b'abc', 5)
+        self.assertIsNone(c[(1, 5)])
+        self.assertEqual(c.sets, 0)
+
+    def test_data_wraps_around(self):
+        c = self._makeShared(byte_limit=20000)
+        data_size = c._segment.data_size
+        state = b'x' * 100
+        count = data_size // len(state) * 2
+        for oid in range(1, count):
+            c[(oid, 1)] = (state, 1)
+        # The oldest was overwritten, the newest are there.
+        self.assertIsNone(c[(1, 1)])
+        self.assertEqual(c[(count - 1, 1)], (state, 1))
+        self.assertGreater(c._segment.stats()['bytes_written'], data_size)
+
+    def test_invalidate_and_flush(self):
+        c = self._makeOne()
+        c.set_all_for_tid(5, [(b'abc', 1, -1), (b'def', 2, -1), (b'ghi', 3, -1)])
+        c.invalidate_all((1,))
+        self.assertIsNone(c[(1, 5)])
+        self.assertEqual(c[(2, 5)], (b'def', 5))
+        self.assertEqual(c.stats()['used_slots'], 2)
+
+        c.flush_all()
+        self.assertIsNone(c[(2, 5)])
+        self.assertEqual(c.stats()['used_slots'], 0)
+
+
+class StorageCacheSharedMemoryTests(_SharedMemoryTestMixin, TestCase):
+
+    def _makeOne(self, current_oids):
+        from relstorage.cache.storage_cache import StorageCache
+        from relstorage.cache.shared_memory import SharedMemoryStateCache
+        options = MockOptions.from_args(cache_local_shared_mb=1)
+        prefix = 'test_shared_memory_%s' % (os.getpid(),)
+        adapter = MockAdapter()
+        adapter.mover.data.update({oid: (b'state', tid) for oid, tid in current_oids.items()})
+        inst = StorageCache(adapter, options, prefix)
+        self.addCleanup(inst.close)
+        path = inst.shared_memory_cache.path
+        self.assertEqual(os.path.basename(path), SharedMemoryStateCache.file_name(prefix))
+        self.addCleanup(lambda: os.path.exists(path) and os.unlink(path))
+        return inst
+
+    def _poll(self, cache, complete_since_tid, tid, changes=((99, None),)):
+        from relstorage.cache import mvcc
+        ix = mvcc._ObjectIndex(complete_since_tid)
+        ix = ix.with_polled_changes(tid, complete_since_tid,
+                                    [(oid, change_tid or tid) for oid, change_tid in changes])
+        cache.polling_state.object_index = ix
+        cache.object_index = ix
+        cache.highest_visible_tid = tid
+
+    def test_load_from_other_process(self):
+        one = self._makeOne({1: 5})
+        two = self._makeOne({})
+        self.assertIsNotNone(one.shared_memory_cache)
+        self.assertIsNot(one.shared_memory_cache, two.shared_memory_cache)
+        self._poll(one, 10, 12)
+        self._poll(two, 10, 12)
+
+        self.assertEqual(one.load(None, 1), (b'state', 5))
+        # The second one doesn't find it in the database, but
+        # does find it in shared memory.
+        self.assertEqual(two.load(None, 1), (b'state', 5))
+        self.assertEqual(two.object_index[1], 5)
+        self.assertEqual(two.local_client[(1, 5)], (b'state', 5))
+        self.assertIn('shared_memory_stats', two.stats())
+
+    def test_load_not_verified_for_other_process(self):
+        one = self._makeOne({1: 5})
+        two = self._makeOne({})
+        self._poll(one, 8, 9)
+        # two knows about changes after 10, but one only
+        # verified the state up to 9.
+        self._poll(two, 10, 12)
+        self.assertEqual(one.load(None, 1), (b'state', 5))
+        self.assertEqual(two.load(None, 1), (None, None))
+
+    def test_commit_shared(self):
+        from ZODB.utils import p64
+        from ...storage.tpc.temporary_storage import HFTPCTemporaryStorage
+        one = self._makeOne({})
+        two = self._makeOne({})
+        temp_storage = HFTPCTemporaryStorage()
+        temp_storage.store_temp(1, b'abc')
+        one.after_tpc_finish(p64(11), temp_storage)
+        temp_storage.close()
+        self._poll(two, 10, 12, [(1, 11)])
+        self.assertEqual(two.load(None, 1), (b'abc', 11))
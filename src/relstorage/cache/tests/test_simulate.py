@@ -0,0 +1,88 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from relstorage.tests import TestCase
+
+from relstorage.cache import simulate
+
+
+class TestSimulate(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.mkdtemp(".rstest_simulate")
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+        self.trace_file = os.path.join(temp_dir, 'relstorage-trace.trace')
+        from relstorage.cache.trace import ZEOTracer
+        # pylint:disable=consider-using-with
+        tracer = ZEOTracer(open(self.trace_file, 'wb'))
+        tracer.trace(0x00)
+        # 200 objects of 10KB, loaded round-robin twice; each
+        # load is traced as a miss, followed by the fill.
+        for _ in range(2):
+            for oid in range(1, 201):
+                tracer.trace(0x20, oid)
+                tracer.trace(0x52, oid, 5, dlen=10000)
+        # Then a load of a known revision.
+        tracer.trace(0x22, 3, 5, dlen=10000)
+        tracer.close()
+
+    def test_read_trace(self):
+        records = simulate.read_trace(self.trace_file)
+        self.assertEqual(len(records), 801)
+        self.assertEqual(records[0], (0x20, 1, 0, 0))
+        self.assertEqual(records[1], (0x52, 1, 5, 10000))
+
+    def test_simulate(self):
+        records = simulate.read_trace(self.trace_file)
+        big = simulate.simulate(records, 10)
+        self.assertEqual(big['loads'], 401)
+        self.assertEqual(big['hits'], 201)
+        self.assertEqual(big['round_trips'], 200)
+        self.assertEqual(big['stored_bytes'], 400 * 10000)
+        self.assertEqual(big['len'], 200)
+        # One MB can't hold them all.
+        small = simulate.simulate(records, 1)
+        self.assertGreater(small['round_trips'], 300)
+
+        compressed = simulate.simulate(records, 10, 'zlib')
+        self.assertEqual(compressed['hits'], 201)
+        self.assertLess(compressed['bytes'], big['bytes'])
+
+    def test_parse_split(self):
+        self.assertEqual(simulate.parse_split('20/60/20'), (0.2, 0.6, 0.2))
+        with self.assertRaises(argparse.ArgumentTypeError):
+            simulate.parse_split('20/80')
+
+    def test_main(self):
+        import io
+        from contextlib import redirect_stdout
+        out = io.StringIO()
+        with redirect_stdout(out):
+            results = simulate.main([
+                'relstorage-cache-simulate', '-j', '1',
+                '-s', '1', '-s', '10', '-g', '10/80/10', '-g', '30/60/10',
+                self.trace_file,
+            ])
+        self.assertEqual(len(results), 4)
+        self.assertEqual([r['cache_local_mb'] for r in results], [1, 1, 10, 10])
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
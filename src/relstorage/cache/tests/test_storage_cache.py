@@ -32,6 +32,24 @@ from . import MockAdapter
 
 # pylint:disable=protected-access
 
+def _state_referring_to(*oids, **kwargs):
+    # A ZODB record (class and state pickles) whose state refers to
+    # the persistent objects *oids*.
+    import io
+    import pickle
+    from ZODB.utils import p64
+
+    class Pickler(pickle.Pickler):
+        def persistent_id(self, obj):
+            return (p64(obj), None) if isinstance(obj, int) else None
+
+    buf = io.BytesIO()
+    pickler = Pickler(buf, 3)
+    pickler.dump(('module', 'Class'))
+    pickler.dump((list(oids), b'x' * kwargs.get('padding', 0)))
+    return buf.getvalue()
+
+
 class StorageCacheTests(TestCase):
     # pylint:disable=too-many-public-methods
 
@@ -100,11 +118,11 @@ class StorageCacheTests(TestCase):
         inst.close()
         self.assertIsInstance(inst.stats(), dict)
 
-    def _setup_for_save(self):
+    def _setup_for_save(self, **kwargs):
         import tempfile
         import shutil
 
-        c = self._makeOne()
+        c = self._makeOne(**kwargs)
         temp_storage = TemporaryStorage()
         # tid is 2016-09-29 11:35:58,120
         # (That used to matter when we stored that information as a
@@ -188,6 +206,42 @@ class StorageCacheTests(TestCase):
         self.test_closed_state(c2)
         self.test_closed_state(c)
 
+    def test_restore_in_background(self):
+        c, oid, tid = self._setup_for_save()
+        c.save(overwrite=True)
+
+        c2 = self._makeOne(current_oids={oid: tid},
+                           cache_local_dir=c.options.cache_local_dir,
+                           cache_local_restore_in_background=True)
+        self.assertTrue(c2.polling_state.wait_for_restore(10))
+        self.assertEqual(1, len(c2))
+        self.assertIsNotNone(c2.polling_state.object_index)
+
+        c.options.cache_local_dir = None
+        c2.options.cache_local_dir = None
+
+    def test_object_index_saved_and_restored(self):
+        import os
+        from relstorage.cache import mvcc
+        from relstorage.cache.persistence import object_index_file
+        c, oid, tid = self._setup_for_save(cache_local_object_index=True)
+        c.save(overwrite=True)
+        path = object_index_file(c.options, c.prefix)
+        saved_tid, oid_tids = mvcc._load_object_index(path)
+        self.assertEqual(saved_tid, tid)
+        self.assertEqual(dict(oid_tids.items()), {oid: tid})
+
+        c2 = self._makeOne(current_oids={oid: tid},
+                           cache_local_dir=c.options.cache_local_dir,
+                           cache_local_object_index=True)
+        self.assertEqual(1, len(c2))
+
+        c2.zap_all()
+        self.assertFalse(os.path.exists(path))
+
+        c.options.cache_local_dir = None
+        c2.options.cache_local_dir = None
+
     def test_save_no_hits_no_sets(self):
         c, _, _ = self._setup_for_save()
         c.local_client.reset_stats()
@@ -238,6 +292,205 @@ class StorageCacheTests(TestCase):
         res = c.load(None, 2)
         self.assertEqual(res, (None, None))
 
+    def _poll(self, c, complete_since_tid, tid, changes):
+        from relstorage.cache import mvcc
+        ix = mvcc._ObjectIndex(complete_since_tid)
+        ix = ix.with_polled_changes(tid, complete_since_tid, changes)
+        c.polling_state.object_index = ix
+        c.object_index = ix
+        c.highest_visible_tid = tid
+        return ix
+
+    def test_load_missing_is_cached(self):
+        c = self._makeOne()
+        ix = self._poll(c, 10, 12, [(1, 12)])
+        mover = c.adapter.mover
+
+        self.assertEqual(c.load(None, 2), (None, None))
+        self.assertEqual(ix[2], c.NO_STATE_TID)
+        self.assertEqual(c.local_client[(2, c.NO_STATE_TID)], (b'', c.NO_STATE_TID))
+
+        # Now the database isn't asked.
+        mover.data[2] = (b'abc', 5)
+        self.assertEqual(c.load(None, 2), (None, c.NO_STATE_TID))
+
+        # Not even if the index entry has gone away and we're
+        # relying on a frozen value.
+        c.local_client.freeze({2: c.NO_STATE_TID})
+        ix = self._poll(c, 12, 13, [(1, 13)])
+        self.assertIsNone(ix[2])
+        self.assertEqual(c.load(None, 2), (None, c.NO_STATE_TID))
+
+    def test_load_missing_invalidated_by_creation(self):
+        c = self._makeOne()
+        ix = self._poll(c, 10, 12, [(1, 12)])
+        self.assertEqual(c.load(None, 2), (None, None))
+        self.assertEqual(ix[2], c.NO_STATE_TID)
+
+        # It gets created.
+        c.adapter.mover.data[2] = (b'abc', 13)
+        self._poll(c, 12, 13, [(2, 13)])
+        self.assertEqual(c.load(None, 2), (b'abc', 13))
+
+    def test_load_missing_disabled(self):
+        c = self._makeOne(cache_local_negative=False)
+        ix = self._poll(c, 10, 12, [(1, 12)])
+        self.assertEqual(c.load(None, 2), (None, None))
+        self.assertIsNone(ix[2])
+        self.assertEqual(len(c.local_client), 0)
+
+    def test_load_missing_evicted(self):
+        c = self._makeOne(cache_local_mb=0)
+        ix = self._poll(c, 10, 12, [(1, 12)])
+        self.assertEqual(c.load(None, 2), (None, None))
+        self.assertEqual(ix[2], c.NO_STATE_TID)
+        # Not in the cache, so we go to the database again,
+        # and it still doesn't exist.
+        self.assertEqual(c.load(None, 2), (None, None))
+
+    def _prefetch_fixture(self, **kwargs):
+        c = self._makeOne(**kwargs)
+        self._poll(c, 10, 12, [(1, 12)])
+        mover = c.adapter.mover
+        fetched = []
+        load_currents = mover.load_currents
+        def recording_load_currents(cursor, oids):
+            fetched.append(sorted(oids))
+            return load_currents(cursor, oids)
+        mover.load_currents = recording_load_currents
+        return c, mover, fetched
+
+    def test_load_prefetches_references(self):
+        c, mover, fetched = self._prefetch_fixture(cache_prefetch_depth=2)
+        # A tree: 1 -> (2, 3); 2 -> (4,); 4 -> (5,)
+        mover.data.update({
+            1: (_state_referring_to(2, 3), 12),
+            2: (_state_referring_to(4), 5),
+            3: (b'not a pickle', 5),
+            4: (_state_referring_to(5), 5),
+            5: (_state_referring_to(), 5),
+        })
+
+        self.assertEqual(c.load(None, 1), mover.data[1])
+        self.assertEqual(fetched, [[2, 3], [4]])
+        for oid in 2, 3, 4:
+            self.assertEqual(c.local_client[(oid, 5)], mover.data[oid])
+            self.assertEqual(c.object_index[oid], 5)
+        self.assertIsNone(c.local_client[(5, 5)])
+
+        # Loading what was prefetched doesn't go to the database.
+        del fetched[:]
+        del mover.data[4]
+        self.assertEqual(c.load(None, 4), (_state_referring_to(5), 5))
+        self.assertEqual(fetched, [])
+
+    def test_load_prefetch_budget(self):
+        c, mover, fetched = self._prefetch_fixture(cache_prefetch_depth=5,
+                                                   cache_prefetch_max_kb=1)
+        mover.data.update({
+            1: (_state_referring_to(2, 3), 12),
+            2: (_state_referring_to(4, padding=1024), 5),
+            3: (_state_referring_to(5), 5),
+        })
+        c.load(None, 1)
+        # The first level used up the budget.
+        self.assertEqual(fetched, [[2, 3]])
+
+    def test_load_prefetch_disabled(self):
+        c, mover, fetched = self._prefetch_fixture()
+        mover.data[1] = (_state_referring_to(2), 12)
+        mover.data[2] = (_state_referring_to(), 5)
+        c.load(None, 1)
+        self.assertEqual(fetched, [])
+
+    def test_load_prefetches_coaccessed(self):
+        c = self._makeOne(cache_prefetch_coaccess=True)
+        mover = c.adapter.mover
+        fetched = []
+        load_currents = mover.load_currents
+        mover.load_currents = lambda cursor, oids: fetched.append(sorted(oids)) or load_currents(
+            cursor, oids)
+        c.adapter.poller.poll_tid = 12
+        for oid in range(1, 6):
+            mover.data[oid] = (b'state', 5)
+        c.poll(None, None, None)
+        c.adapter.poller.poll_changes = []
+        # Load objects 1 through 5 twice, in separate transactions.
+        for _ in range(2):
+            for oid in range(1, 6):
+                c.load(None, oid)
+            c.poll(None, None, None)
+        self.assertEqual(fetched, [])
+        self.assertEqual(c.coaccess.successors(1), [5, 4, 3, 2])
+
+        c.cache.flush_all()
+        c.load(None, 2)
+        self.assertEqual(fetched, [[3, 4, 5]])
+        # Those were cached.
+        c.load(None, 3)
+        self.assertEqual(fetched, [[3, 4, 5]])
+
+    def test_coaccess_saved_and_restored(self):
+        import tempfile
+        import shutil
+        temp_dir = tempfile.mkdtemp('.rstest_coaccess')
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+        c = self._makeOne(cache_prefetch_coaccess=True, cache_local_dir=temp_dir)
+        c.coaccess.learn([1, 2, 1, 2])
+        c.save()
+
+        c2 = self._makeOne(cache_prefetch_coaccess=True, cache_local_dir=temp_dir)
+        self.assertEqual(c2.coaccess.successors(1), [2])
+        self.assertIsNot(c2.coaccess, c.coaccess)
+
+        c2.zap_all()
+        self.assertEqual(len(c2.coaccess), 0)
+        c3 = self._makeOne(cache_prefetch_coaccess=True, cache_local_dir=temp_dir)
+        self.assertEqual(len(c3.coaccess), 0)
+
+    def test_load_many(self):
+        c, mover, fetched = self._prefetch_fixture()
+        mover.data.update({
+            1: (b'one', 12),
+            2: (b'two', 5),
+            3: (b'three', 5),
+        })
+        self.assertEqual(c.load(None, 2), (b'two', 5))
+        self.assertEqual(c.load(None, 4), (None, None))
+
+        result = c.load_many(None, [1, 2, 3, 4, 5])
+        self.assertEqual(result, {
+            1: (b'one', 12),
+            2: (b'two', 5),
+            3: (b'three', 5),
+            4: (None, c.NO_STATE_TID),
+            5: (None, None),
+        })
+        # Only what wasn't cached was queried, all at once.
+        self.assertEqual(fetched, [[1, 3, 5]])
+        self.assertEqual(c.object_index[3], 5)
+        self.assertEqual(c.object_index[5], c.NO_STATE_TID)
+        self.assertEqual(c.local_client[(3, 5)], (b'three', 5))
+
+        del fetched[:]
+        self.assertEqual(c.load_many(None, [1, 3]), {1: (b'one', 12), 3: (b'three', 5)})
+        self.assertEqual(fetched, [])
+
+    def test_load_many_checks_tids(self):
+        from relstorage.cache.interfaces import CacheConsistencyError
+        c, mover, _ = self._prefetch_fixture()
+        # The index says 1 changed in 12, but the database has
+        # something else.
+        mover.data[1] = (b'one', 11)
+        with self.assertRaises(CacheConsistencyError):
+            c.load_many(None, [1])
+
+    def test_load_many_without_poll(self):
+        c = self._makeOne()
+        c.adapter.mover.data[1] = (b'one', 5)
+        self.assertEqual(c.load_many(None, [1, 2]), {1: (b'one', 5), 2: (None, None)})
+        self.assertEqual(len(c.local_client), 0)
+
     def test_store_temp(self):
         c = self._makeOne()
         temp_storage = TemporaryStorage()
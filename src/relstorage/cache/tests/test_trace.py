@@ -0,0 +1,100 @@
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+import time
+
+from relstorage.tests import TestCase
+
+from relstorage.cache import trace
+
+# pylint:disable=protected-access
+
+class _File(io.BytesIO):
+
+    def close(self):
+        self.final_value = self.getvalue()
+        super().close()
+
+
+class _StoredStates(object):
+
+    def __init__(self, oids):
+        self.oids = oids
+
+    def items(self):
+        return [(0, oid, oid, 0) for oid in self.oids]
+
+
+class TestBufferedZEOTracer(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        orig_time = time.time
+        time.time = lambda: 1000
+        self.addCleanup(setattr, time, 'time', orig_time)
+
+    def _trace_all(self, tracer):
+        tracer.trace(0x00)
+        tracer.trace(0x20, 1)
+        tracer.trace(0x22, 2, 3, 4, dlen=5)
+        tracer.trace_store_current(6, _StoredStates([7, 8]))
+        tracer.close()
+
+    def test_same_records_as_zeo_tracer(self):
+        expected = _File()
+        self._trace_all(trace.ZEOTracer(expected))
+        buffered = _File()
+        self._trace_all(trace.BufferedZEOTracer(buffered, flush_interval=0.01))
+        self.assertEqual(len(buffered.final_value), 5 * 26 + 4 * 8)
+        self.assertEqual(buffered.final_value, expected.final_value)
+
+    def test_sample(self):
+        f = _File()
+        tracer = trace.BufferedZEOTracer(f, sample=4)
+        tracer.trace(0x00)
+        for oid in range(1, 1001):
+            tracer.trace(0x20, oid)
+            tracer.trace(0x20, oid)
+        tracer.close()
+        kept = [oid for oid in range(1, 1001) if trace._sampled(oid, 4)]
+        self.assertGreater(len(kept), 200)
+        self.assertLess(len(kept), 300)
+        # The restart record, and both accesses to each sampled OID.
+        self.assertEqual(len(f.final_value), 26 + len(kept) * 2 * (26 + 8))
+
+    def test_full_buffer_drops(self):
+        f = _File()
+        tracer = trace.BufferedZEOTracer(f, buffer_size=2, flush_interval=1000)
+        for oid in range(1, 5):
+            tracer.trace(0x20, oid)
+        self.assertEqual(tracer.dropped, 2)
+        tracer.close()
+        self.assertEqual(len(f.final_value), 2 * (26 + 8))
+
+    def test_tracer_for_file(self):
+        self.assertIsInstance(trace.tracer_for_file(_File()), trace.ZEOTracer)
+        os.environ['RS_CACHE_TRACE_BUFFER'] = '10'
+        os.environ['RS_CACHE_TRACE_SAMPLE'] = '3'
+        self.addCleanup(os.environ.pop, 'RS_CACHE_TRACE_BUFFER')
+        self.addCleanup(os.environ.pop, 'RS_CACHE_TRACE_SAMPLE')
+        tracer = trace.tracer_for_file(_File())
+        self.addCleanup(tracer.close)
+        self.assertIsInstance(tracer, trace.BufferedZEOTracer)
+        self.assertEqual(tracer.buffer_size, 10)
+        self.assertEqual(tracer.sample, 3)
@@ -19,12 +19,26 @@ import logging
 import struct
 import threading
 import time
+from collections import deque
 
 from ZODB.utils import p64
 from ZODB.utils import z64
 
+from relstorage._util import get_positive_integer_from_environ
+from relstorage._util import get_non_negative_float_from_environ
+from relstorage._util import thread_spawn
+
 log = logging.getLogger(__name__)
 
+_RECORD = struct.Struct(">iiH8s8s")
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def _sampled(oid_int, sample):
+    # Fibonacci hashing, as in _mrc; sequential OIDs are spread
+    # evenly, and a given OID is always either in or out.
+    return (((oid_int * 0x9E3779B97F4A7C15) & _MASK64) >> 32) % sample == 0
+
 
 class ZEOTracer(object):
     # Knows how to write ZEO trace files.
@@ -37,7 +51,7 @@ class ZEOTracer(object):
         # (going off example in ZEO code; in one test locally this gets us a
         # ~15% improvement)
         _now = time.time
-        _pack = struct.Struct(">iiH8s8s").pack
+        _pack = _RECORD.pack
         _trace_file_write = trace_file.write
         _p64 = p64
         _z64 = z64
@@ -85,3 +99,122 @@ class ZEOTracer(object):
     def close(self):
         self._trace_file.close()
         del self._trace
+
+
+class BufferedZEOTracer(object):
+    """
+    Writes the same ZEO trace files as :class:`ZEOTracer`, but off
+    the request path.
+
+    Tracing an operation only appends a tuple to a bounded buffer;
+    appending to a :class:`collections.deque` is atomic, so no lock is
+    taken. A background thread wakes every *flush_interval* seconds
+    to pack and write what has accumulated. If the writer falls so far
+    behind that the buffer holds *buffer_size* records, new records
+    are dropped (and counted in :attr:`dropped`) rather than
+    blocking.
+
+    If *sample* is greater than one, only about one in *sample* OIDs
+    is traced, chosen by a hash of the OID so that every access to a
+    traced OID is kept. Records without an OID, like client restarts,
+    are always kept.
+    """
+
+    #: How many records were discarded because the buffer was full.
+    dropped = 0
+
+    def __init__(self, trace_file, buffer_size=65536, sample=1, flush_interval=1.0):
+        self._trace_file = trace_file
+        self.buffer_size = buffer_size
+        self.sample = sample
+        self.flush_interval = flush_interval
+        self._buffer = deque()
+        self._closing = threading.Event()
+        self._writer = thread_spawn(self._write_until_closed, daemon=True)
+
+    def trace(self, code, oid_int=0, tid_int=0, end_tid_int=0, dlen=0):
+        if oid_int and self.sample > 1 and not _sampled(oid_int, self.sample):
+            return
+        buf = self._buffer
+        if len(buf) >= self.buffer_size:
+            self.dropped += 1
+            return
+        buf.append((time.time(), code, oid_int, tid_int, end_tid_int, dlen))
+
+    def trace_store_current(self, tid_int, state_oid_iter):
+        now = time.time()
+        sample = self.sample
+        buf = self._buffer
+        append = buf.append
+        for startpos, endpos, oid_int, _prev_tid_int in state_oid_iter.items():
+            if sample > 1 and not _sampled(oid_int, sample):
+                continue
+            if len(buf) >= self.buffer_size:
+                self.dropped += 1
+                continue
+            append((now, 0x52, oid_int, tid_int, 0, endpos - startpos))
+
+    def _write_until_closed(self):
+        while not self._closing.wait(self.flush_interval or 1.0):
+            try:
+                self.flush()
+            except Exception: # pylint:disable=broad-except
+                log.exception("Problem writing trace records; stopping tracing")
+                self._buffer.clear()
+                self.buffer_size = 0
+                return
+
+    def flush(self):
+        """
+        Write everything buffered so far. This is only called by the
+        writer thread, or once it has stopped.
+        """
+        pack = _RECORD.pack
+        popleft = self._buffer.popleft
+        records = []
+        while True:
+            try:
+                now, code, oid_int, tid_int, end_tid_int, dlen = popleft()
+            except IndexError:
+                break
+            oid = p64(oid_int) if oid_int else b''
+            records.append(pack(
+                int(now), (dlen << 8) + code, len(oid),
+                p64(tid_int) if tid_int else z64,
+                p64(end_tid_int) if end_tid_int else z64,
+            ) + oid)
+        if records:
+            self._trace_file.write(b''.join(records))
+            self._trace_file.flush()
+
+    def close(self):
+        self._closing.set()
+        self._writer.wait()
+        try:
+            self.flush()
+        finally:
+            if self.dropped:
+                log.warning("Dropped %d trace records because the buffer was full",
+                            self.dropped)
+            self._trace_file.close()
+
+
+def tracer_for_file(trace_file):
+    """
+    Return a tracer writing to *trace_file*, configured from the
+    environment.
+
+    If ``RS_CACHE_TRACE_BUFFER`` is set to a number of records, a
+    :class:`BufferedZEOTracer` is returned, otherwise a
+    :class:`ZEOTracer`. ``RS_CACHE_TRACE_SAMPLE`` and
+    ``RS_CACHE_TRACE_FLUSH_INTERVAL`` configure the buffered tracer.
+    """
+    buffer_size = get_positive_integer_from_environ('RS_CACHE_TRACE_BUFFER', None, logger=log)
+    if not buffer_size:
+        return ZEOTracer(trace_file)
+    return BufferedZEOTracer(
+        trace_file,
+        buffer_size,
+        get_positive_integer_from_environ('RS_CACHE_TRACE_SAMPLE', 1, logger=log),
+        get_non_negative_float_from_environ('RS_CACHE_TRACE_FLUSH_INTERVAL', 1.0, logger=log),
+    )
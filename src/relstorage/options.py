@@ -101,6 +101,10 @@ class Options(object):
     replica_timeout = 600.0
     #: Specifies what to do when a database connection is stale.
     revert_when_stale = False
+    #: How to be told when transactions commit instead of polling
+    invalidation_notifier = None
+    #: Directory for the sockets of the ``socket`` invalidation notifier
+    invalidation_notifier_dir = None
     #: Perform a GC when packing
     pack_gc = True
     #: Only prepack
@@ -122,8 +126,53 @@ class Options(object):
     cache_local_object_max = 16384
     #: How to compress local pickles
     cache_local_compression = 'none'
+    #: Train a dictionary for zstd compression of local pickles
+    cache_local_compression_dictionary = False
     #: Directory holding persistent cache files
     cache_local_dir = None
+    #: How the persistent cache files are stored
+    cache_local_dir_format = 'sqlite'
+    #: Load the persistent cache in a background thread
+    cache_local_restore_in_background = False
+    #: How many threads read the persistent cache
+    cache_local_restore_threads = 1
+    #: Save the object index with the persistent cache, so restoring
+    #: it only has to poll for changes
+    cache_local_object_index = False
+    #: Write the persistent cache from a background thread
+    cache_local_background_save = False
+    #: How long to wait for a background save at exit, in seconds
+    cache_local_save_timeout = None
+    #: Seconds between incremental checkpoints of the persistent cache
+    cache_local_checkpoint_interval = 0
+    #: The most pickle data to write in one checkpoint
+    cache_local_checkpoint_max_mb = 0
+    #: Use a count-min sketch (W-TinyLFU) for cache admission
+    cache_local_frequency_sketch = False
+    #: Adapt the sizes of the cache generations to the workload
+    cache_local_adaptive_generations = False
+    #: How many independently locked parts to divide the pickle cache into
+    cache_local_shards = 1
+    #: How much memory to use for the cache shared between processes
+    cache_local_shared_mb = 0
+    #: Shrink the local cache when more memory than this is in use
+    cache_local_memory_limit_mb = 0
+    #: Fraction of objects sampled to estimate the hit ratio of other cache sizes
+    cache_local_mrc_sample_rate = 0.0
+    #: Remember which objects don't exist
+    cache_local_negative = True
+    #: Share byte-identical states between cache entries
+    cache_local_dedup = False
+    #: Levels of references to load after a cache miss
+    cache_prefetch_depth = 0
+    #: The most pickle data to load by following references after one miss
+    cache_prefetch_max_kb = 256
+    #: Learn which objects are loaded together and prefetch them
+    cache_prefetch_coaccess = False
+    #: Let connections share the results of one poll query
+    cache_share_polls = False
+    #: Poll for changes in a background thread this often, in seconds
+    cache_background_poll_interval = 0
     #: Switch checkpoints after this many writes
     cache_delta_size_limit = 100000 if not PYPY else 50000
 
@@ -111,6 +111,10 @@ class Loader(object):
                                               self.adapter,
                                               oid_int,
                                               "no tid found"))
+        if tid_int == self.cache.NO_STATE_TID:
+            # The cache already knew the object doesn't exist (or has
+            # no state); don't go back to the database to find out why.
+            raise self.__pke(oid, reason="no state (cached)")
 
         if not state:
             # This can happen if something attempts to load
@@ -123,6 +127,40 @@ class Loader(object):
                                               "creation undone"))
         return state, int64_to_8bytes(tid_int)
 
+    @stale_aware
+    @storage_method
+    @metricmethod_sampled
+    def loadMany(self, oids):
+        """
+        Load the current state of each of the objects *oids*.
+
+        Returns a dictionary mapping each OID to a ``(state, tid)``
+        pair, as returned by :meth:`load`. Objects found in the
+        cache are returned from there, and the rest are loaded with a
+        single query.
+
+        Raises a :class:`~relstorage.interfaces.POSKeyError` if any
+        of the objects doesn't exist.
+        """
+        oid_ints = [bytes8_to_int64(oid) for oid in oids]
+        load_cursor = self.load_connection.cursor
+        loaded = self.__load_using_method(load_cursor, self.cache.load_many, oid_ints)
+        result = {}
+        for oid_int, (state, tid_int) in loaded.items():
+            if not state:
+                oid = int64_to_8bytes(oid_int)
+                if tid_int is None:
+                    raise self.__pke(oid,
+                                     **_make_pke_data(load_cursor,
+                                                      self.adapter,
+                                                      oid_int,
+                                                      "no tid found"))
+                raise self.__pke(oid, reason="no state (cached)"
+                                 if tid_int == self.cache.NO_STATE_TID
+                                 else "creation undone")
+            result[int64_to_8bytes(oid_int)] = (state, int64_to_8bytes(tid_int))
+        return result
+
     @storage_method
     def getTid(self, oid):
         """
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2019 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+
+"""
+Tests for load.py.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from ZODB.utils import p64
+
+from relstorage.interfaces import POSKeyError
+from relstorage.tests import TestCase
+from relstorage.tests import MockAdapter
+from relstorage.tests import MockOptions
+
+
+class MockLoadConnection(object):
+    cursor = None
+
+
+class MockTxnControl(object):
+
+    def __init__(self, queries):
+        self.queries = queries
+
+    def get_tid(self, _cursor):
+        self.queries.append('get_tid')
+        return 12
+
+
+class MockDatabaseIterator(object):
+
+    def __init__(self, queries):
+        self.queries = queries
+
+    def iter_object_history(self, _cursor, oid_int):
+        self.queries.append('iter_object_history')
+        raise KeyError(oid_int)
+
+
+class TestLoader(TestCase):
+
+    def _makeOne(self):
+        from relstorage.cache import mvcc
+        from relstorage.cache.storage_cache import StorageCache
+        from ..load import Loader
+
+        self.queries = []
+        adapter = MockAdapter()
+        adapter.keep_history = True
+        adapter.txncontrol = MockTxnControl(self.queries)
+        adapter.dbiter = MockDatabaseIterator(self.queries)
+        load_current = adapter.mover.load_current
+        def counting_load_current(cursor, oid_int):
+            self.queries.append('load_current')
+            return load_current(cursor, oid_int)
+        adapter.mover.load_current = counting_load_current
+
+        cache = StorageCache(adapter, MockOptions(), 'myprefix')
+        self.addCleanup(cache.close)
+        ix = mvcc._ObjectIndex(10)
+        ix = ix.with_polled_changes(12, 10, [(1, 11), (2, 12)])
+        cache.polling_state.object_index = cache.object_index = ix
+        cache.highest_visible_tid = 12
+        return Loader(adapter, MockLoadConnection(), cache)
+
+    def test_load_undone_creation_asks_database_once(self):
+        loader = self._makeOne()
+        # The creation of 2 was undone; the row has no state.
+        loader.adapter.mover.data[2] = (None, 12)
+
+        with self.assertRaises(POSKeyError):
+            loader.load(p64(2))
+        # Loading, then finding out why.
+        self.assertEqual(self.queries, ['load_current', 'get_tid', 'iter_object_history'])
+
+        del self.queries[:]
+        for _ in range(3):
+            with self.assertRaises(POSKeyError) as exc:
+                loader.load(p64(2))
+            self.assertEqual(exc.exception.args[1]['reason'], 'no state (cached)')
+        self.assertEqual(self.queries, [])
+
+    def test_load_existing(self):
+        loader = self._makeOne()
+        loader.adapter.mover.data[1] = (b'abc', 11)
+        self.assertEqual(loader.load(p64(1)), (b'abc', p64(11)))
+        self.assertEqual(loader.load(p64(1)), (b'abc', p64(11)))
+        self.assertEqual(self.queries, ['load_current'])
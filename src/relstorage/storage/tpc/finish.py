@@ -40,6 +40,9 @@ def Finish(vote_state, committed_tid_int, needs_store_commit=True):
         vote_state.shared_state.store_connection.cursor)
     vote_state.shared_state.cache.after_tpc_finish(vote_state.committing_tid_lock.tid,
                                                    vote_state.shared_state.temp_storage)
+    notifier = vote_state.shared_state.adapter.notifier
+    if notifier is not None:
+        notifier.committed(committed_tid_int)
 
     # The vote caller is responsible for releasing the shared
     # resources in vote_state.shared_state.
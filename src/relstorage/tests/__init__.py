@@ -428,6 +428,12 @@ class MockObjectMover(object):
     def load_current(self, _cursor, oid_int):
         return self.data.get(oid_int, (None, None))
 
+    def load_currents(self, _cursor, oids):
+        for oid_int in oids:
+            if oid_int in self.data:
+                state, tid_int = self.data[oid_int]
+                yield oid_int, state, tid_int
+
     def current_object_tids(self, _cursor, oids, timeout=None):
         # pylint:disable=unused-argument
         return {
@@ -443,6 +449,8 @@ class MockLocker(object):
 
 class MockAdapter(object):
 
+    notifier = None
+
     def __init__(self):
         self.driver = MockDriver()
         self.connmanager = MockConnectionManager()
@@ -40,6 +40,7 @@ import ZODB.tests.util
 from ZODB.Connection import TransactionMetaData
 from ZODB.DB import DB
 from ZODB.FileStorage import FileStorage
+from ZODB.POSException import POSKeyError
 from ZODB.POSException import ReadConflictError
 from ZODB.POSException import ReadOnlyError
 from ZODB.serialize import referencesf
@@ -1339,6 +1340,24 @@ class GenericRelStorageTests(
         conn.prefetch(z64, mapping)
         self.assertEqual(2, len(self._storage._cache))
 
+    def checkLoadMany(self):
+        db = DB(self._storage)
+        conn = db.open()
+        mapping = conn.root()['key'] = PersistentMapping()
+        transaction.commit()
+        self._storage._cache.clear()
+
+        states = self._storage.loadMany([z64, mapping._p_oid])
+        self.assertEqual(sorted(states), sorted([z64, mapping._p_oid]))
+        self.assertEqual(states[z64], self._storage.load(z64))
+        self.assertEqual(states[mapping._p_oid][1], mapping._p_serial)
+        self.assertEqual(2, len(self._storage._cache))
+
+        with self.assertRaises(POSKeyError):
+            self._storage.loadMany([z64, int64_to_8bytes(0xFFFFFF)])
+        conn.close()
+        db.close()
+
     ######
     # Parallel Commit Tests
     ######